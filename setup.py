@@ -6,6 +6,7 @@ setup(name='quiz-generator',
       url='https://github.com/taminemelissa/quiz-generator',
       author='Mélissa Tamine, Adrien Servière',
       author_email='melissa.tamine@ensae.fr, adrien.serviere@ensae.fr',
-      package_dir={'': 'src'},
-      packages=find_packages('src'),
-      install_requires=['numpy', 'tqdm', 'wikiextractor', 'elasticsearch', 'torch', 'pytorch_lightning', 'transformers', 'stanza', 'sentencepiece', 'strsimpy', 'ipywidgets', 'seaborn', 'wordcloud', 'nltk', 'spacy', 'scikit-learn', 'ipykernel', 'nbconvert'])
+      packages=find_packages(include=['src', 'src.*']),
+      install_requires=['numpy', 'tqdm', 'wikiextractor', 'elasticsearch', 'torch', 'pytorch_lightning', 'transformers', 'stanza', 'sentencepiece', 'rapidfuzz', 'msgpack', 'ipywidgets', 'seaborn', 'wordcloud', 'nltk', 'spacy', 'scikit-learn', 'ipykernel', 'nbconvert'],
+      extras_require={'onnx': ['optimum[onnxruntime]']},
+      entry_points={'console_scripts': ['quiz-generator=src.scripts.cli:main']})
@@ -0,0 +1,91 @@
+import argparse
+import json
+import sys
+
+from src.data.data_format import *
+
+
+# Suffixes of the metrics that should go down, and of the ones that should go up
+LOWER_IS_BETTER = ('_seconds', 'seconds', '_mb')
+HIGHER_IS_BETTER = ('_per_second',)
+
+
+
+def flatten(results: Dict[str, Any], prefix: str = '') -> Dict[str, float]:
+    """
+
+    Returns:
+        Dict[str, float]: the numeric values of a results file, keyed by their dotted path.
+    """
+    values = {}
+    for key, value in results.items():
+        path = f'{prefix}{key}'
+        if isinstance(value, dict):
+            values.update(flatten(value, path + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[path] = value
+    return values
+
+
+
+def direction(metric: str) -> int:
+    """
+
+    Returns:
+        int: 1 when the metric should go up, -1 when it should go down, 0 when it is informational.
+    """
+    name = metric.rsplit('.', 1)[-1]
+    if name.endswith(HIGHER_IS_BETTER):
+        return 1
+    if name.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0
+
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = 0.1,
+            prefixes: List[str] = ('stages', 'quiz_generator', 'indexing', 'peak_rss_mb')) -> List[Dict[str, Any]]:
+    """
+    Compares the metrics of two results files written by src.benchmarks.suite.
+
+    Args:
+        baseline (Dict[str, Any]): results of the reference run.
+        current (Dict[str, Any]): results of the new run.
+        tolerance (float, optional): relative change above which a metric going the wrong way is a regression.
+        prefixes (List[str], optional): sections of the results compared. Defaults to the stages, the whole quiz
+            generation, the indexing and the peak memory.
+
+    Returns:
+        List[Dict[str, Any]]: for each metric of both runs, its values, its relative change and whether it regressed.
+    """
+    baseline_values = flatten(baseline)
+    current_values = flatten(current)
+    rows = []
+    for metric in sorted(set(baseline_values) & set(current_values)):
+        if not metric.startswith(tuple(prefixes)) or direction(metric) == 0:
+            continue
+        before, after = baseline_values[metric], current_values[metric]
+        change = (after - before) / before if before else 0.0
+        rows.append(dict(metric=metric, baseline=before, current=after, change=change,
+                         regression=change * direction(metric) < -tolerance))
+    return rows
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares two benchmark result files, fails on regressions')
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    arguments = parser.parse_args()
+
+    with open(arguments.baseline) as f:
+        baseline_results = json.load(f)
+    with open(arguments.current) as f:
+        current_results = json.load(f)
+
+    comparison = compare(baseline_results, current_results, arguments.tolerance)
+    for row in comparison:
+        flag = 'REGRESSION' if row['regression'] else ''
+        print(f"{row['metric']:<60} {row['baseline']:>12.4g} {row['current']:>12.4g} {row['change']:>+8.1%} {flag}")
+    sys.exit(1 if any(row['regression'] for row in comparison) else 0)
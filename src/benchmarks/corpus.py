@@ -0,0 +1,132 @@
+from os import makedirs
+from os.path import join
+import json
+import random
+import re
+
+from src.data.data_format import *
+from src.scripts.wikipedia_indexing import list_wikipedia_files, iter_wikipedia_file
+
+
+CANDIDATE_EXPRESSION = re.compile(r'[A-Z][a-z]+(?: [A-Z][a-z]+)*')
+
+
+
+def sample_questions(directory: str, n_contexts: int = 20, answers_per_context: int = 4,
+                     min_len_paragraph: int = 100) -> List[Question]:
+    """
+    Builds a reproducible set of context/answer pairs from the first paragraphs of a Wikipedia dump, the answers
+    being capitalised words of the paragraphs, so that no NER model is needed.
+
+    Args:
+        directory (str): directory of the Wikipedia dump.
+        n_contexts (int, optional): number of paragraphs. Defaults to 20.
+        answers_per_context (int, optional): maximal number of answers per paragraph. Defaults to 4.
+        min_len_paragraph (int, optional): minimal number of characters of a paragraph. Defaults to 100.
+
+    Returns:
+        List[Question]: questions with one retrieved context and its predicted answers.
+    """
+
+    questions = []
+    for path in list_wikipedia_files(directory):
+        for paragraphs in iter_wikipedia_file(path, min_len_paragraph):
+            for doc in paragraphs:
+                context = Context(text=doc['text'], title=doc['name'],
+                                  identifier=f"{doc['id']}_{doc['paragraph_id']}")
+                answers = [Answer(text=m.group(), context=context, start_char_position=m.start(),
+                                  end_char_position=m.end())
+                           for m in CANDIDATE_EXPRESSION.finditer(doc['text'])][:answers_per_context]
+                if answers:
+                    questions.append(Question(retrieved_contexts=[context], predicted_answers=answers))
+                if len(questions) == n_contexts:
+                    return questions
+    return questions
+
+
+
+def mask_answer(answer: Answer) -> str:
+    """
+    Builds a question answered by the answer: the sentence of the context containing it, with the answer replaced by
+    'what'.
+
+    Args:
+        answer (Answer): answer with its context and character positions.
+
+    Returns:
+        str: the question.
+    """
+
+    text = answer.context.text
+    start = text.rfind('. ', 0, answer.start_char_position) + 2 if '. ' in text[:answer.start_char_position] else 0
+    end = text.find('. ', answer.end_char_position)
+    end = len(text) if end == -1 else end
+    return (text[start: answer.start_char_position] + 'what' + text[answer.end_char_position: end]).strip()
+
+
+
+def sample_qca(directory: str, n_contexts: int = 20, answers_per_context: int = 4) -> QuestionContextAnswer:
+    """
+    Builds a reproducible QuestionContextAnswer as produced by generate_questions, without the MT5 model: one question
+    per answer of sample_questions, obtained with mask_answer.
+
+    Returns:
+        QuestionContextAnswer: questions with their retrieved context and their predicted answer.
+    """
+
+    questions = []
+    for q in sample_questions(directory, n_contexts, answers_per_context):
+        for a in q.predicted_answers:
+            questions.append(Question(text=mask_answer(a), retrieved_contexts=q.retrieved_contexts,
+                                      predicted_answers=[a]))
+    return QuestionContextAnswer(questions=questions)
+
+
+
+def synthetic_word(rng: random.Random, syllables: int) -> str:
+    return ''.join(rng.choice('bcdfglmnprstv') + rng.choice('aeiou') for _ in range(syllables))
+
+
+
+def write_synthetic_dump(directory: str, n_articles: int = 200, paragraphs_per_article: int = 6,
+                         vocabulary_size: int = 2000, seed: int = 0) -> List[str]:
+    """
+    Writes a reproducible Wikipedia dump of synthetic articles, in the format of WikiExtractor, so that the indexing
+    and quiz pipelines run on it without the real dump. Paragraphs mix common words, capitalised names that the NER
+    stub recognises, and the title of their article so that themes retrieve them.
+
+    Args:
+        directory (str): directory of the dump, the articles are written into directory/AA/wiki_00.
+        n_articles (int, optional): number of articles. Defaults to 200.
+        paragraphs_per_article (int, optional): number of paragraphs of each article. Defaults to 6.
+        vocabulary_size (int, optional): number of distinct common words. Defaults to 2000.
+        seed (int, optional): seed of the generator. Defaults to 0.
+
+    Returns:
+        List[str]: the titles of the articles, usable as quiz themes.
+    """
+
+    rng = random.Random(seed)
+    words = [synthetic_word(rng, rng.randint(1, 3)) for _ in range(vocabulary_size)]
+    names = [synthetic_word(rng, rng.randint(2, 3)).capitalize() for _ in range(vocabulary_size // 10)]
+    titles = []
+
+    makedirs(join(directory, 'AA'), exist_ok=True)
+    with open(join(directory, 'AA', 'wiki_00'), 'w', encoding='utf-8') as f:
+        for article_id in range(1, n_articles + 1):
+            title = ' '.join(rng.sample(names, rng.randint(1, 2)))
+            titles.append(title)
+            paragraphs = []
+            for _ in range(paragraphs_per_article):
+                sentences = []
+                for _ in range(rng.randint(2, 5)):
+                    sentence = rng.choices(words, k=rng.randint(8, 20))
+                    for _ in range(rng.randint(1, 3)):
+                        sentence.insert(rng.randrange(len(sentence)), rng.choice([title] + names))
+                    sentence = ' '.join(sentence)
+                    sentences.append(sentence[0].upper() + sentence[1:] + '.')
+                paragraphs.append(' '.join(sentences))
+            f.write(json.dumps({'id': str(article_id), 'revid': str(article_id), 'title': title,
+                                'url': f'https://example.org/wiki?curid={article_id}',
+                                'text': '\n'.join([title] + paragraphs)}) + '\n')
+    return titles
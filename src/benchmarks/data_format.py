@@ -0,0 +1,163 @@
+import argparse
+import json
+import time
+
+from src.data.data_format import *
+
+
+
+def list_contexts(answers: List[Answer]) -> List[Context]:
+    """
+    Reference implementation of Question._get_contexts, deduplicating with a list of identifiers.
+
+    Returns:
+        List[Context]: the first context of each identifier among the contexts of the answers.
+    """
+    context_ids = []
+    contexts = []
+    for a in answers or []:
+        if a.context and a.context.identifier not in context_ids:
+            context_ids.append(a.context.identifier)
+            contexts.append(a.context)
+    return contexts
+
+
+
+def list_get_all_contexts(question: Question) -> List[Context]:
+    """
+    Reference implementation of Question.get_all_contexts, deduplicating with a list of identifiers.
+
+    Returns:
+        List[Context]: the first context of each identifier, gold then predicted then retrieved.
+    """
+    context_ids = []
+    contexts = []
+    for c in (list_contexts(question.gold_answers) + list_contexts(question.predicted_answers) +
+              (question.retrieved_contexts or [])):
+        if c.identifier not in context_ids:
+            context_ids.append(c.identifier)
+            contexts.append(c)
+    return contexts
+
+
+
+def list_get_all_answers(qca: QuestionContextAnswer) -> List[Answer]:
+    """
+    Reference implementation of QuestionContextAnswer.get_all_answers, concatenating the lists of each question.
+
+    Returns:
+        List[Answer]: the gold then predicted answers of every question.
+    """
+    all_answers = []
+    for q in qca.questions:
+        question_answers = []
+        if q.gold_answers:
+            question_answers += q.gold_answers
+        if q.predicted_answers:
+            question_answers += q.predicted_answers
+        all_answers += question_answers
+    return all_answers
+
+
+
+def synthetic_qca(n_answers: int = 10000, answers_per_question: int = 2000,
+                  answers_per_context: int = 2) -> QuestionContextAnswer:
+    """
+    Builds questions carrying many answers, each context being shared by a few answers.
+
+    Args:
+        n_answers (int, optional): total number of predicted answers. Defaults to 10000.
+        answers_per_question (int, optional): number of answers of each question. Defaults to 2000.
+        answers_per_context (int, optional): number of answers extracted from each context. Defaults to 2.
+
+    Returns:
+        QuestionContextAnswer: the questions.
+    """
+    contexts = [Context(text=f'paragraph {i}', identifier=f'{i}_0')
+                for i in range((n_answers + answers_per_context - 1) // answers_per_context)]
+    answers = [Answer(text=f'answer {i}', context=contexts[i // answers_per_context]) for i in range(n_answers)]
+    questions = [Question(text=f'question {i}', predicted_answers=answers[i: i + answers_per_question],
+                          retrieved_contexts=contexts[i // answers_per_context: (i + answers_per_question) //
+                                                      answers_per_context: 3])
+                 for i in range(0, n_answers, answers_per_question)]
+    return QuestionContextAnswer(questions=questions)
+
+
+
+def best_time(function, repeat: int = 3) -> float:
+    """
+
+    Returns:
+        float: the best time in seconds of repeat calls of function.
+    """
+    best_seconds = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+        best_seconds = seconds if best_seconds is None else min(best_seconds, seconds)
+    return best_seconds
+
+
+
+def time_data_format(n_answers: int = 10000, answers_per_question: int = 2000,
+                     repeat: int = 3) -> Dict[str, Dict[str, Any]]:
+    """
+    Times the context and answer queries of data_format against their list-based references, and checks that they
+    return the same objects in the same order.
+
+    Args:
+        n_answers (int, optional): total number of predicted answers. Defaults to 10000.
+        answers_per_question (int, optional): number of answers of each question. Defaults to 2000.
+        repeat (int, optional): number of timed runs. Defaults to 3.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: for each query, the time of the reference, the time of data_format and whether
+        their results are identical.
+    """
+
+    qca = synthetic_qca(n_answers, answers_per_question)
+    results = {}
+
+    reference = [list_get_all_contexts(q) for q in qca.questions]
+    results['get_all_contexts'] = dict(
+        reference_seconds=best_time(lambda: [list_get_all_contexts(q) for q in qca.questions], repeat),
+        seconds=best_time(lambda: [q.get_all_contexts() for q in qca.questions], repeat),
+        identical=all(a == b for a, b in zip(reference, [q.get_all_contexts() for q in qca.questions])))
+
+    results['get_all_answers'] = dict(
+        reference_seconds=best_time(lambda: list_get_all_answers(qca), repeat),
+        seconds=best_time(qca.get_all_answers, repeat),
+        identical=list_get_all_answers(qca) == qca.get_all_answers())
+
+    sample_ids = [a.context.identifier for a in qca.get_all_answers()[::1000]]
+
+    def scan(identifier: str) -> List[Answer]:
+        return [a for a in list_get_all_answers(qca) if a.context and a.context.identifier == identifier]
+
+    qca.clear_lookups()
+    start = time.perf_counter()
+    answers_by_context_id = qca.get_answers_by_context_id()
+    build_seconds = time.perf_counter() - start
+    results['answers_by_context_id'] = dict(
+        reference_seconds=best_time(lambda: [scan(i) for i in sample_ids], repeat) / len(sample_ids),
+        seconds=best_time(lambda: [answers_by_context_id[i] for i in sample_ids], repeat) / len(sample_ids),
+        build_seconds=build_seconds,
+        identical=all(answers_by_context_id[i] == scan(i) for i in sample_ids))
+
+    return results
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Micro-benchmark of the context and answer queries of data_format')
+    parser.add_argument('--n-answers', type=int, default=10000)
+    parser.add_argument('--answers-per-question', type=int, default=2000)
+    parser.add_argument('--output', default=None, help='json file where the results are written')
+    arguments = parser.parse_args()
+
+    results = time_data_format(arguments.n_answers, arguments.answers_per_question)
+    print(json.dumps(results, indent=2))
+    if arguments.output:
+        with open(arguments.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,100 @@
+from difflib import SequenceMatcher
+import argparse
+import json
+import time
+
+from src.data.data_format import *
+from src.models.mt5_generator import BACKENDS, MT5Generator
+from src.benchmarks.corpus import sample_questions
+
+
+
+def similarity(a: str, b: str) -> float:
+    """
+
+    Returns:
+        float: similarity between 0 and 1 of the two strings, on their words.
+    """
+    return SequenceMatcher(None, a.split(), b.split()).ratio()
+
+
+
+def run_generator(generator: MT5Generator, questions: List[Question], repeat: int = 1) -> Dict[str, Any]:
+    """
+
+    Returns:
+        Dict[str, Any]: the generated questions and the number of questions per second, the best of repeat runs.
+    """
+
+    best_seconds = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        generated = generator.generate(questions)
+        seconds = time.perf_counter() - start
+        best_seconds = seconds if best_seconds is None else min(best_seconds, seconds)
+
+    return dict(questions=[q.text for q in generated], seconds=best_seconds,
+                questions_per_second=len(generated) / best_seconds)
+
+
+
+def compare_backends(model_path: str, questions: List[Question], backends: List[str] = ('quantized', 'onnx'),
+                     min_similarity: float = 0.8, repeat: int = 3) -> Dict[str, Dict[str, Any]]:
+    """
+    Checks that the questions generated by each backend match the fp32 baseline, and measures the questions/sec
+    of each backend on CPU.
+
+    Args:
+        model_path (str): path of the MT5 model.
+        questions (List[Question]): questions with their retrieved context and predicted answers.
+        backends (List[str], optional): backends compared to 'torch'. Defaults to ('quantized', 'onnx').
+        min_similarity (float, optional): minimal mean similarity with the baseline for the parity check.
+        repeat (int, optional): number of timed runs per backend. Defaults to 3.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: for each backend, its throughput, its exact match rate and mean similarity with
+        the baseline, and whether the parity check passed.
+    """
+
+    results = {}
+    baseline = None
+    for backend in ['torch'] + [b for b in backends if b != 'torch']:
+        try:
+            generator = MT5Generator(model_path=model_path, backend=backend)
+        except ImportError as e:
+            results[backend] = dict(error=str(e))
+            continue
+        generator.eval()
+        generator.freeze()
+        generator.to('cpu')
+
+        run = run_generator(generator, questions, repeat)
+        baseline = baseline or run['questions']
+        similarities = [similarity(a, b) for a, b in zip(run['questions'], baseline)]
+        mean_similarity = sum(similarities) / len(similarities) if similarities else 1.0
+        results[backend] = dict(questions_per_second=run['questions_per_second'],
+                                exact_match=sum(a == b for a, b in zip(run['questions'], baseline)) / len(baseline),
+                                mean_similarity=mean_similarity,
+                                parity=mean_similarity >= min_similarity)
+        del generator
+
+    return results
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parity and speed of the inference backends of MT5Generator')
+    parser.add_argument('--model-path', default='Narrativa/mT5-base-finetuned-tydiQA-question-generation')
+    parser.add_argument('--directory', default='./data/wikipedia')
+    parser.add_argument('--n-contexts', type=int, default=20)
+    parser.add_argument('--backends', nargs='+', default=['quantized', 'onnx'], choices=BACKENDS)
+    parser.add_argument('--min-similarity', type=float, default=0.8)
+    parser.add_argument('--output', default=None, help='json file where the results are written')
+    arguments = parser.parse_args()
+
+    results = compare_backends(arguments.model_path, sample_questions(arguments.directory, arguments.n_contexts),
+                               arguments.backends, arguments.min_similarity)
+    print(json.dumps(results, indent=2))
+    if arguments.output:
+        with open(arguments.output, 'w') as f:
+            json.dump(results, f, indent=2)
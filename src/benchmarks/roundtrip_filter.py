@@ -0,0 +1,77 @@
+import argparse
+import copy
+import json
+import time
+
+from src.data.data_format import *
+from src.benchmarks.corpus import sample_qca
+from src.models.model_registry import get_qa_pipeline
+from src.scripts.roundtrip_filter import roundtrip_filter
+
+
+
+def kept_questions(qca: QuestionContextAnswer) -> List[tuple]:
+    """
+
+    Returns:
+        List[tuple]: the (question, answer) pairs kept by the filter.
+    """
+    return [(q.text, q.predicted_answers[0].text) for q in qca.questions]
+
+
+
+def time_roundtrip_filter(qca: QuestionContextAnswer, model_path: str, batch_sizes: List[int] = (1, 16),
+                          threshold: int = 6, repeat: int = 3) -> Dict[str, Dict[str, Any]]:
+    """
+    Times roundtrip_filter with each batch size, batch size 1 being the question-by-question baseline, and checks
+    that every batch size keeps the same questions as the baseline.
+
+    Args:
+        qca (QuestionContextAnswer): questions to filter, copied before each run.
+        model_path (str): path of the question answering model.
+        batch_sizes (List[int], optional): batch sizes to compare. Defaults to (1, 16).
+        threshold (int, optional): threshold of the filter. Defaults to 6.
+        repeat (int, optional): number of timed runs per batch size. Defaults to 3.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: for each batch size, the best time, the questions per second, the number of kept
+        questions and whether they are the ones kept by the first batch size.
+    """
+
+    get_qa_pipeline(model_path)  # the model load is not timed
+    results = {}
+    reference = None
+    for batch_size in batch_sizes:
+        best_seconds = None
+        for _ in range(repeat):
+            run_qca = copy.deepcopy(qca)
+            start = time.perf_counter()
+            filtered = roundtrip_filter(run_qca, model_path=model_path, threshold=threshold, batch_size=batch_size)
+            seconds = time.perf_counter() - start
+            best_seconds = seconds if best_seconds is None else min(best_seconds, seconds)
+
+        kept = kept_questions(filtered)
+        reference = reference if reference is not None else kept
+        results[f'batch_size_{batch_size}'] = dict(seconds=best_seconds,
+                                                   questions_per_second=len(qca) / best_seconds,
+                                                   kept=len(kept),
+                                                   same_kept_questions=kept == reference)
+    return results
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Before/after timing of the batched roundtrip filter')
+    parser.add_argument('--model-path', default='csarron/roberta-base-squad-v1')
+    parser.add_argument('--directory', default='./data/wikipedia')
+    parser.add_argument('--n-contexts', type=int, default=20)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 16])
+    parser.add_argument('--output', default=None, help='json file where the results are written')
+    arguments = parser.parse_args()
+
+    results = time_roundtrip_filter(sample_qca(arguments.directory, arguments.n_contexts), arguments.model_path,
+                                    arguments.batch_sizes)
+    print(json.dumps(results, indent=2))
+    if arguments.output:
+        with open(arguments.output, 'w') as f:
+            json.dump(results, f, indent=2)
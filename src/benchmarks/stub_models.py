@@ -0,0 +1,113 @@
+from os import makedirs
+from os.path import exists, join
+
+from src.data.data_format import *
+from src.benchmarks.corpus import CANDIDATE_EXPRESSION
+from src.models.model_registry import registry, stanza_extractor_key
+from src.models.stanza_extractor import StanzaExtractor
+
+
+
+class CapitalisedWordsExtractor(StanzaExtractor):
+    """
+    Stand-in for the Stanza pipeline: the entities of a text are its sequences of capitalised words. It keeps the
+    interface and the cache of StanzaExtractor, so that the answer extraction runs unchanged without the model.
+    """
+
+    def __init__(self, min_words: int = 15, cache=None) -> None:
+        self.batch_size = 32
+        self.min_words = min_words
+        self.cache = cache
+        self.model_version = f'capitalised-words-{min_words}'
+
+
+    def extract_entities(self, texts: List[str]) -> List[List[tuple]]:
+        return [[(m.group(), 'PER', m.start(), m.end()) for m in CANDIDATE_EXPRESSION.finditer(t)]
+                if len(t.split()) > self.min_words else [] for t in texts]
+
+
+
+def register_stub_extractor(stanza_dir: str) -> CapitalisedWordsExtractor:
+    """
+    Registers the stub as the extractor of stanza_dir, so that get_stanza_extractor(stanza_dir) returns it.
+
+    Returns:
+        CapitalisedWordsExtractor: the registered extractor.
+    """
+    registry.evict(stanza_extractor_key(stanza_dir))
+    return registry.get(stanza_extractor_key(stanza_dir), CapitalisedWordsExtractor)
+
+
+
+def build_tiny_mt5(directory: str, texts: List[str], vocab_size: int = 1000, seed: int = 0) -> str:
+    """
+    Builds a randomly initialised MT5 checkpoint of a few hundred thousand parameters, with a sentencepiece vocabulary
+    trained on the texts, loadable by MT5Generator without network access. Its questions are meaningless, it only
+    measures the cost of the pipeline around the model.
+
+    Args:
+        directory (str): directory of the checkpoint, reused when it already exists.
+        texts (List[str]): texts the vocabulary is trained on.
+        vocab_size (int, optional): maximal size of the vocabulary. Defaults to 1000.
+        seed (int, optional): seed of the weights. Defaults to 0.
+
+    Returns:
+        str: the directory of the checkpoint.
+    """
+    if exists(join(directory, 'config.json')):
+        return directory
+
+    import sentencepiece
+    import torch
+    from transformers import MT5Config, MT5ForConditionalGeneration, MT5Tokenizer
+
+    makedirs(directory, exist_ok=True)
+    sentencepiece.SentencePieceTrainer.train(sentence_iterator=iter(texts), model_prefix=join(directory, 'spiece'),
+                                             vocab_size=vocab_size, hard_vocab_limit=False, pad_id=0, eos_id=1,
+                                             unk_id=2, bos_id=-1)
+    tokenizer = MT5Tokenizer(join(directory, 'spiece.model'), extra_ids=0)
+
+    torch.manual_seed(seed)
+    config = MT5Config(vocab_size=len(tokenizer), d_model=32, d_kv=8, d_ff=64, num_layers=2, num_heads=4,
+                       decoder_start_token_id=0, pad_token_id=0, eos_token_id=1)
+    MT5ForConditionalGeneration(config).save_pretrained(directory)
+    tokenizer.save_pretrained(directory)
+    return directory
+
+
+
+def build_tiny_qa(directory: str, texts: List[str], vocab_size: int = 1000, seed: int = 0) -> str:
+    """
+    Builds a randomly initialised RoBERTa question answering checkpoint, with a byte-level BPE vocabulary trained on
+    the texts, loadable by the HF question-answering pipeline without network access.
+
+    Args:
+        directory (str): directory of the checkpoint, reused when it already exists.
+        texts (List[str]): texts the vocabulary is trained on.
+        vocab_size (int, optional): maximal size of the vocabulary. Defaults to 1000.
+        seed (int, optional): seed of the weights. Defaults to 0.
+
+    Returns:
+        str: the directory of the checkpoint.
+    """
+    if exists(join(directory, 'config.json')):
+        return directory
+
+    import torch
+    from tokenizers import ByteLevelBPETokenizer
+    from transformers import RobertaConfig, RobertaForQuestionAnswering, RobertaTokenizerFast
+
+    makedirs(directory, exist_ok=True)
+    bpe = ByteLevelBPETokenizer()
+    bpe.train_from_iterator(texts, vocab_size=vocab_size, special_tokens=['<s>', '<pad>', '</s>', '<unk>', '<mask>'])
+    bpe.save_model(directory)
+    tokenizer = RobertaTokenizerFast(join(directory, 'vocab.json'), join(directory, 'merges.txt'),
+                                     model_max_length=512)
+
+    torch.manual_seed(seed)
+    config = RobertaConfig(vocab_size=len(tokenizer), hidden_size=32, num_hidden_layers=2, num_attention_heads=4,
+                           intermediate_size=64, max_position_embeddings=514, type_vocab_size=1, pad_token_id=1,
+                           bos_token_id=0, eos_token_id=2)
+    RobertaForQuestionAnswering(config).save_pretrained(directory)
+    tokenizer.save_pretrained(directory)
+    return directory
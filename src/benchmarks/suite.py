@@ -0,0 +1,274 @@
+from os import cpu_count, makedirs
+from os.path import join
+import argparse
+import json
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+
+from src.data.data_format import *
+from src.benchmarks.corpus import sample_qca, sample_questions, write_synthetic_dump
+from src.benchmarks.stub_models import build_tiny_mt5, build_tiny_qa, register_stub_extractor
+from src.models.bm25_retriever import BM25Retriever
+from src.models.model_registry import registry
+from src.scripts.answer_extraction import extract_answers_from_contexts
+from src.scripts.question_generation import generate_questions
+from src.scripts.quiz_generator import generate_quiz_questions
+from src.scripts.roundtrip_filter import roundtrip_filter
+from src.scripts.wikipedia_indexing import build_bm25_index, fill_default_args
+
+
+STAGES = ('retrieval', 'answer_extraction', 'question_generation', 'roundtrip_filter')
+
+MICRO_BENCHMARKS = ('data_format', 'roundtrip_filter', 'generator_backends')
+
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+
+    Returns:
+        float: the q-th percentile of the values, interpolated between the closest ranks.
+    """
+    values = sorted(values)
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+
+def summarize(latencies: List[float], n_items: int = None) -> Dict[str, float]:
+    """
+    Args:
+        latencies (List[float]): the duration in seconds of each call.
+        n_items (int, optional): the number of items processed by all the calls, the calls by default.
+
+    Returns:
+        Dict[str, float]: the number of calls, the mean, p50, p90, p99 and max latency, and the items per second.
+    """
+    total = sum(latencies)
+    n_items = len(latencies) if n_items is None else n_items
+    return dict(calls=len(latencies),
+                mean_seconds=total / len(latencies) if latencies else 0.0,
+                p50_seconds=percentile(latencies, 50),
+                p90_seconds=percentile(latencies, 90),
+                p99_seconds=percentile(latencies, 99),
+                max_seconds=max(latencies, default=0.0),
+                items=n_items,
+                items_per_second=n_items / total if total else 0.0)
+
+
+
+def peak_rss_mb() -> float:
+    """
+
+    Returns:
+        float: the peak resident memory of the process so far, in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+
+def environment() -> Dict[str, Any]:
+    """
+
+    Returns:
+        Dict[str, Any]: the machine, the versions of Python and of the main libraries, and the commit of the repo.
+    """
+    env = dict(python=platform.python_version(), platform=platform.platform(), cpu_count=cpu_count(),
+               time=time.strftime('%Y-%m-%dT%H:%M:%S'))
+    for library in ('torch', 'transformers', 'stanza'):
+        try:
+            env[library] = __import__(library).__version__
+        except ImportError:
+            env[library] = None
+    try:
+        env['commit'] = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                       check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        env['commit'] = None
+    return env
+
+
+
+def time_stages(retriever: BM25Retriever, themes: List[str], stanza_dir: str, generator_path: str,
+                qa_path: str) -> Dict[str, Any]:
+    """
+    Runs the stages of quiz_generator one after the other for each theme, timing each stage.
+
+    Returns:
+        Dict[str, Any]: the summary of the latencies of each stage, the items being the contexts for retrieval and
+        answer extraction, the answers for question generation and the questions for the filter, and the number of
+        items produced by each stage.
+    """
+    latencies = {stage: [] for stage in STAGES}
+    counts = dict(contexts=0, answers=0, questions=0, filtered_questions=0)
+
+    for theme in themes:
+        start = time.perf_counter()
+        contexts = retriever.retrieve(theme)
+        latencies['retrieval'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        qca = QuestionContextAnswer(questions=[Question(retrieved_contexts=[c]) for c in contexts])
+        qca = extract_answers_from_contexts(qca, stanza_dir)
+        latencies['answer_extraction'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        n_answers = len(qca.get_all_answers())
+        qca = generate_questions(qca, model_path=generator_path)
+        latencies['question_generation'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        n_questions = len(qca)
+        qca = roundtrip_filter(qca, model_path=qa_path, threshold=6)
+        latencies['roundtrip_filter'].append(time.perf_counter() - start)
+
+        counts['contexts'] += len(contexts)
+        counts['answers'] += n_answers
+        counts['questions'] += n_questions
+        counts['filtered_questions'] += len(qca)
+
+    items = dict(retrieval=counts['contexts'], answer_extraction=counts['contexts'],
+                 question_generation=counts['answers'], roundtrip_filter=counts['questions'])
+    return dict(stages={stage: summarize(latencies[stage], items[stage]) for stage in STAGES}, counts=counts)
+
+
+
+def time_quiz_generation(retriever: BM25Retriever, themes: List[str], stanza_dir: str, generator_path: str,
+                         qa_path: str) -> Dict[str, Dict[str, float]]:
+    """
+    Times the whole quiz_generator path, stage by stage, streaming and scheduled, one theme at a time.
+
+    Returns:
+        Dict[str, Dict[str, float]]: the summary of the latency per theme of each mode, the items being the filtered
+        questions.
+    """
+    results = {}
+    for mode in ('stage_by_stage', 'streaming', 'scheduled'):
+        latencies = []
+        n_questions = 0
+        for theme in themes:
+            start = time.perf_counter()
+            qca = generate_quiz_questions(theme, retriever, stanza_dir=stanza_dir, generator_path=generator_path,
+                                          qa_path=qa_path, mode=mode)
+            latencies.append(time.perf_counter() - start)
+            n_questions += len(qca)
+        results[mode] = summarize(latencies, n_questions)
+    return results
+
+
+
+def run_micro_benchmarks(names: List[str], corpus_dir: str, generator_path: str,
+                         qa_path: str) -> Dict[str, Any]:
+    """
+    Runs the benchmarks of the other modules of src.benchmarks on the same corpus and models.
+
+    Returns:
+        Dict[str, Any]: the results of each benchmark.
+    """
+    results = {}
+    if 'data_format' in names:
+        from src.benchmarks.data_format import time_data_format
+        results['data_format'] = time_data_format()
+    if 'roundtrip_filter' in names:
+        from src.benchmarks.roundtrip_filter import time_roundtrip_filter
+        results['roundtrip_filter'] = time_roundtrip_filter(sample_qca(corpus_dir, 20), qa_path, repeat=1)
+    if 'generator_backends' in names:
+        from src.benchmarks.generator_backends import compare_backends
+        results['generator_backends'] = compare_backends(generator_path, sample_questions(corpus_dir, 10),
+                                                         backends=('quantized',), repeat=1)
+    return results
+
+
+
+def run_suite(workdir: str, directory: str = None, n_articles: int = 200, n_themes: int = 20, warmup: int = 1,
+              stanza_dir: str = None, generator_path: str = None, qa_path: str = None,
+              micro_benchmarks: List[str] = MICRO_BENCHMARKS, seed: int = 0) -> Dict[str, Any]:
+    """
+    Benchmarks the indexing, each stage and the whole quiz generation on a reproducible corpus, with the in-process
+    BM25 index standing in for Elasticsearch. Models left to None are replaced by stubs: the capitalised words
+    extractor for Stanza and tiny random checkpoints for MT5 and the question answering model, so the suite runs
+    offline and measures the pipeline around the models.
+
+    Args:
+        workdir (str): directory of the synthetic corpus and of the tiny checkpoints.
+        directory (str, optional): Wikipedia dump to use instead of the synthetic corpus. Defaults to None.
+        n_articles (int, optional): number of articles of the synthetic corpus. Defaults to 200.
+        n_themes (int, optional): number of timed themes, sampled from the article titles. Defaults to 20.
+        warmup (int, optional): number of untimed themes run first, to load the models. Defaults to 1.
+        stanza_dir (str, optional): Stanza model, the stub extractor when None.
+        generator_path (str, optional): question generation model, a tiny checkpoint when None.
+        qa_path (str, optional): question answering model, a tiny checkpoint when None.
+        micro_benchmarks (List[str], optional): benchmarks of src.benchmarks also run. Defaults to all of them.
+        seed (int, optional): seed of the corpus and of the sampled themes. Defaults to 0.
+
+    Returns:
+        Dict[str, Any]: the configuration, the environment and the measures, JSON-serializable.
+    """
+
+    makedirs(workdir, exist_ok=True)
+    config = dict(directory=directory, n_articles=n_articles, n_themes=n_themes, warmup=warmup,
+                  stanza_dir=stanza_dir, generator_path=generator_path, qa_path=qa_path, seed=seed)
+
+    corpus_dir = directory or join(workdir, 'wikipedia')
+    if directory is None:
+        write_synthetic_dump(corpus_dir, n_articles=n_articles, seed=seed)
+
+    args = fill_default_args()
+    args.update(directory=corpus_dir, num_workers=1)
+    start = time.perf_counter()
+    index = build_bm25_index(args)
+    indexing = dict(seconds=time.perf_counter() - start, paragraphs=len(index))
+
+    texts = [text for text, *_ in index.documents]
+    if stanza_dir is None:
+        stanza_dir = 'benchmark-stub'
+        register_stub_extractor(stanza_dir)
+    generator_path = generator_path or build_tiny_mt5(join(workdir, 'tiny-mt5'), texts, seed=seed)
+    qa_path = qa_path or build_tiny_qa(join(workdir, 'tiny-qa'), texts, seed=seed)
+
+    titles = sorted({name for _, _, name, _, _ in index.documents})
+    themes = random.Random(seed).sample(titles, min(n_themes + warmup, len(titles)))
+    retriever = BM25Retriever(client=index, backend='local', cache_size=0)
+
+    time_stages(retriever, themes[:warmup], stanza_dir, generator_path, qa_path)
+    results = dict(config=config, environment=environment(), indexing=indexing)
+    results.update(time_stages(retriever, themes[warmup:], stanza_dir, generator_path, qa_path))
+    results['quiz_generator'] = time_quiz_generation(retriever, themes[warmup:], stanza_dir, generator_path, qa_path)
+    results['model_load_seconds'] = dict(registry.load_seconds)
+    results['micro'] = run_micro_benchmarks(micro_benchmarks, corpus_dir, generator_path, qa_path)
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-stage and end-to-end benchmarks of the quiz generation')
+    parser.add_argument('--workdir', default='./data/benchmarks')
+    parser.add_argument('--directory', default=None, help='Wikipedia dump, a synthetic corpus otherwise')
+    parser.add_argument('--n-articles', type=int, default=200)
+    parser.add_argument('--n-themes', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--stanza-dir', default=None, help='Stanza model, a stub extractor otherwise')
+    parser.add_argument('--generator-path', default=None, help='MT5 model, a tiny random checkpoint otherwise')
+    parser.add_argument('--qa-path', default=None, help='question answering model, a tiny checkpoint otherwise')
+    parser.add_argument('--micro', nargs='*', default=list(MICRO_BENCHMARKS), choices=MICRO_BENCHMARKS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark.json', help='json file where the results are written')
+    arguments = parser.parse_args()
+
+    results = run_suite(arguments.workdir, arguments.directory, arguments.n_articles, arguments.n_themes,
+                        arguments.warmup, arguments.stanza_dir, arguments.generator_path, arguments.qa_path,
+                        arguments.micro, arguments.seed)
+    with open(arguments.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(dict(stages=results['stages'], quiz_generator=results['quiz_generator'],
+                          peak_rss_mb=results['peak_rss_mb']), indent=2))
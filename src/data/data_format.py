@@ -10,6 +10,8 @@ def ordered_dict(obj: dict) -> Union[OrderedDict, object]:
 
 
 class BaseItem(object):
+    __slots__ = ('text', 'identifier', 'scores', 'meta')
+
     def __init__(self, text: str = None,
                  identifier: str = None,
                  scores: OrderedDict[str, float] = None,
@@ -21,6 +23,8 @@ class BaseItem(object):
 
 
 class Context(BaseItem):
+    __slots__ = ('title',)
+
     def __init__(self, text: str = None,
                  title: str = None,
                  identifier: str = None,
@@ -37,6 +41,8 @@ class Context(BaseItem):
 
 
 class Answer(BaseItem):
+    __slots__ = ('context', 'start_char_position', 'end_char_position')
+
     def __init__(self, text: str = None,
                  context: Context = None,
                  identifier: str = None,
@@ -61,6 +67,8 @@ class Answer(BaseItem):
 
 
 class Question(BaseItem):
+    __slots__ = ('gold_answers', 'retrieved_contexts', 'predicted_answers')
+
     def __init__(self, text: str = None,
                  identifier: str = None,
                  scores: OrderedDict[str, float] = None,
@@ -83,16 +91,20 @@ class Question(BaseItem):
         self.retrieved_contexts = retrieved_contexts
         self.predicted_answers = predicted_answers
 
+    @staticmethod
+    def _unique_contexts(contexts) -> List[Context]:
+        # Keeps the first context of each identifier, in order
+        context_ids = set()
+        unique_contexts = []
+        for c in contexts:
+            if c.identifier not in context_ids:
+                context_ids.add(c.identifier)
+                unique_contexts.append(c)
+        return unique_contexts
+
     @staticmethod
     def _get_contexts(answers) -> List[Context]:
-        context_ids = []
-        contexts = []
-        if answers:
-            for a in answers:
-                if a.context and a.context.identifier not in context_ids:
-                    context_ids.append(a.context.identifier)
-                    contexts.append(a.context)
-        return contexts
+        return Question._unique_contexts([a.context for a in answers or () if a.context])
 
     def get_gold_contexts(self) -> List[Context]:
         return self._get_contexts(self.gold_answers)
@@ -101,28 +113,17 @@ class Question(BaseItem):
         return self._get_contexts(self.predicted_answers)
 
     def get_all_contexts(self) -> List[Context]:
-        context_ids = []
-        contexts = []
-        gold_contexts = self.get_gold_contexts()
-        pred_contexts = self.get_predicted_contexts()
-        retrieved_contexts = self.retrieved_contexts if self.retrieved_contexts else []
-        all_contexts = gold_contexts + pred_contexts + retrieved_contexts
-        for c in all_contexts:
-            if c.identifier not in context_ids:
-                context_ids.append(c.identifier)
-                contexts.append(c)
-        return contexts
+        return self._unique_contexts([a.context for a in self.gold_answers or () if a.context] +
+                                     [a.context for a in self.predicted_answers or () if a.context] +
+                                     (self.retrieved_contexts or []))
 
     def get_all_answers(self) -> List[Answer]:
-        all_answers = []
-        if self.gold_answers:
-            all_answers += self.gold_answers
-        if self.predicted_answers:
-            all_answers += self.predicted_answers
-        return all_answers
+        return (self.gold_answers or []) + (self.predicted_answers or [])
 
 
 class QuestionContextAnswer:
+    __slots__ = ('_questions', 'meta', '_lookups')
+
     def __init__(self, questions: List[Question] = None,
                  meta: Dict[str, Any] = None):
         """
@@ -132,6 +133,15 @@ class QuestionContextAnswer:
         self.questions = questions
         self.meta = meta
 
+    @property
+    def questions(self) -> List[Question]:
+        return self._questions
+
+    @questions.setter
+    def questions(self, questions: List[Question]) -> None:
+        self._questions = questions
+        self._lookups = None
+
     def __len__(self):
         return len(self.questions)
 
@@ -141,5 +151,35 @@ class QuestionContextAnswer:
     def get_all_answers(self):
         all_answers = []
         for q in self.questions:
-            all_answers += q.get_all_answers()
+            all_answers.extend(q.gold_answers or ())
+            all_answers.extend(q.predicted_answers or ())
         return all_answers
+
+    def _get_lookups(self) -> Dict[str, Dict[str, Any]]:
+        if self._lookups is None:
+            contexts_by_id = {}
+            answers_by_context_id = {}
+            for q in self.questions or []:
+                for c in q.get_all_contexts():
+                    contexts_by_id.setdefault(c.identifier, c)
+                for a in q.get_all_answers():
+                    if a.context:
+                        answers_by_context_id.setdefault(a.context.identifier, []).append(a)
+            self._lookups = dict(contexts_by_id=contexts_by_id, answers_by_context_id=answers_by_context_id)
+        return self._lookups
+
+    def get_contexts_by_id(self) -> Dict[str, Context]:
+        """
+        The lookup tables are built once, call clear_lookups after modifying the questions in place
+        :return: the first context of each identifier, over all the questions
+        """
+        return self._get_lookups()['contexts_by_id']
+
+    def get_answers_by_context_id(self) -> Dict[str, List[Answer]]:
+        """
+        :return: for each context identifier, the gold and predicted answers extracted from it, in question order
+        """
+        return self._get_lookups()['answers_by_context_id']
+
+    def clear_lookups(self) -> None:
+        self._lookups = None
@@ -0,0 +1,171 @@
+from typing import Iterator
+import collections
+import msgpack
+from src.data.data_format import *
+
+
+# Version of the row layout below, written in the header of every serialized QuestionContextAnswer
+SERIALIZATION_VERSION = 1
+
+# A serialized QuestionContextAnswer is a stream of msgpack rows:
+#   header   [SERIALIZATION_VERSION, number of contexts, number of questions, meta]
+#   context  [text, title, identifier, scores, meta]
+#   question [text, identifier, scores, meta, retrieved context positions, gold answers, predicted answers]
+#   answer   [text, context position, identifier, scores, meta, start_char_position, end_char_position]
+# Each context object is written once, questions and answers refer to it by its position in the context rows: the
+# objects shared before serialization are shared again after it, and distinct copies of a context, which may carry
+# different scores, stay distinct. Tuples are written as an extension type so that they are read back as tuples.
+
+# msgpack extension type of the tuples
+TUPLE_EXT_TYPE = 1
+
+
+def _position(c: Union[Context, None], positions: Dict[int, int]) -> Union[int, None]:
+    return positions[id(c)] if c is not None else None
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, tuple):
+        return msgpack.ExtType(TUPLE_EXT_TYPE, msgpack.packb(list(obj), default=_default, strict_types=True))
+    if isinstance(obj, dict):
+        return dict(obj)
+    if isinstance(obj, list):
+        return list(obj)
+    raise TypeError(f'Cannot serialize {type(obj).__name__}')
+
+
+def _ext_hook(code: int, data: bytes) -> Any:
+    if code == TUPLE_EXT_TYPE:
+        return tuple(msgpack.unpackb(data, raw=False, strict_map_key=False, ext_hook=_ext_hook))
+    return msgpack.ExtType(code, data)
+
+
+def _packer() -> msgpack.Packer:
+    # strict_types sends the tuples, and the subclasses of dict such as the OrderedDict scores, to _default
+    return msgpack.Packer(default=_default, strict_types=True)
+
+
+def _index_contexts(qca: QuestionContextAnswer) -> tuple:
+    contexts = []
+    positions = {}
+
+    def add(c: Context) -> None:
+        if c is not None and id(c) not in positions:
+            positions[id(c)] = len(contexts)
+            contexts.append(c)
+
+    for q in qca.questions:
+        for c in q.retrieved_contexts or []:
+            add(c)
+        for a in (q.gold_answers or []) + (q.predicted_answers or []):
+            add(a.context)
+    return contexts, positions
+
+
+def _answer_rows(answers: List[Answer], positions: Dict[int, int]) -> Union[List[list], None]:
+    if answers is None:
+        return None
+    return [[a.text, _position(a.context, positions), a.identifier, a.scores, a.meta, a.start_char_position,
+             a.end_char_position] for a in answers]
+
+
+def iter_rows(qca: QuestionContextAnswer) -> Iterator[list]:
+    """
+    :param qca: a QuestionContextAnswer object
+    :return: the rows of its serialized form, the header first, then the contexts, then the questions
+    """
+    contexts, positions = _index_contexts(qca)
+    yield [SERIALIZATION_VERSION, len(contexts), len(qca.questions), qca.meta]
+    for c in contexts:
+        yield [c.text, c.title, c.identifier, c.scores, c.meta]
+    for q in qca.questions:
+        retrieved = [_position(c, positions) for c in q.retrieved_contexts] if q.retrieved_contexts is not None \
+            else None
+        yield [q.text, q.identifier, q.scores, q.meta, retrieved, _answer_rows(q.gold_answers, positions),
+               _answer_rows(q.predicted_answers, positions)]
+
+
+def _scores(scores: Union[Dict[str, float], None]) -> Union[OrderedDict, None]:
+    return collections.OrderedDict(scores) if scores is not None else None
+
+
+def _contexts(positions: Union[List[int], None], contexts: List[Context]) -> Union[List[Context], None]:
+    if positions is None:
+        return None
+    return [contexts[i] if i is not None else None for i in positions]
+
+
+def _answers(rows: Union[List[list], None], contexts: List[Context]) -> Union[List[Answer], None]:
+    if rows is None:
+        return None
+    return [Answer(text, contexts[position] if position is not None else None, identifier, _scores(scores), meta,
+                   start, end) for text, position, identifier, scores, meta, start, end in rows]
+
+
+def read_rows(rows: Iterator[list]) -> QuestionContextAnswer:
+    """
+    :param rows: the rows written by iter_rows
+    :return: the QuestionContextAnswer object, where the questions and answers share their context objects again
+    """
+    rows = iter(rows)
+    version, n_contexts, n_questions, meta = next(rows)
+    if version != SERIALIZATION_VERSION:
+        raise ValueError(f'Unsupported serialization version {version}, expected {SERIALIZATION_VERSION}')
+
+    contexts = []
+    for _ in range(n_contexts):
+        text, title, identifier, scores, context_meta = next(rows)
+        contexts.append(Context(text, title, identifier, _scores(scores), context_meta))
+
+    questions = []
+    for _ in range(n_questions):
+        text, identifier, scores, question_meta, retrieved, gold, predicted = next(rows)
+        questions.append(Question(text, identifier, _scores(scores), question_meta,
+                                  _contexts(retrieved, contexts), _answers(gold, contexts),
+                                  _answers(predicted, contexts)))
+    return QuestionContextAnswer(questions=questions, meta=meta)
+
+
+def _unpacker(file=None) -> msgpack.Unpacker:
+    return msgpack.Unpacker(file, raw=False, strict_map_key=False, max_buffer_size=0, ext_hook=_ext_hook)
+
+
+def qca_to_bytes(qca: QuestionContextAnswer) -> bytes:
+    """
+    :param qca: a QuestionContextAnswer object
+    :return: its compact msgpack form
+    """
+    packer = _packer()
+    return b''.join(packer.pack(row) for row in iter_rows(qca))
+
+
+def qca_from_bytes(data: bytes) -> QuestionContextAnswer:
+    """
+    :param data: bytes returned by qca_to_bytes
+    :return: the QuestionContextAnswer object
+    """
+    unpacker = _unpacker()
+    unpacker.feed(data)
+    return read_rows(unpacker)
+
+
+def dump_qca(qca: QuestionContextAnswer, path: str) -> None:
+    """
+    Checkpoints a QuestionContextAnswer object to disk, one row at a time
+    :param qca: a QuestionContextAnswer object
+    :param path: the path of the file
+    :return: None
+    """
+    packer = _packer()
+    with open(path, 'wb') as f:
+        for row in iter_rows(qca):
+            f.write(packer.pack(row))
+
+
+def load_qca(path: str) -> QuestionContextAnswer:
+    """
+    :param path: the path of a file written by dump_qca
+    :return: the QuestionContextAnswer object
+    """
+    with open(path, 'rb') as f:
+        return read_rows(_unpacker(f))
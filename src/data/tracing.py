@@ -0,0 +1,278 @@
+from bisect import bisect_left
+import json
+import logging
+import threading
+import time
+from src.data.data_format import *
+
+
+# Upper bounds in seconds of the buckets of the span duration histograms of PrometheusSink
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+
+class _NullSpan:
+    """Span returned when tracing is disabled: every method does nothing"""
+
+    __slots__ = ()
+
+    def __enter__(self) -> '_NullSpan':
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        pass
+
+
+    def set(self, **attributes) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+
+class Span:
+
+    __slots__ = ('tracer', 'name', 'attributes', 'start', 'parent')
+
+    def __init__(self, tracer: 'Tracer', name: str, attributes: Dict[str, Any]):
+        """
+        Timed section of a stage, emitted to the sinks of the tracer when it ends
+        :param tracer: the tracer of the span
+        :param name: the name of the stage
+        :param attributes: the attributes of the span, such as its batch size or its number of items in and out
+        """
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.start = None
+        self.parent = None
+
+
+    def __enter__(self) -> 'Span':
+        stack = self.tracer._stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        duration = time.perf_counter() - self.start
+        self.tracer._stack().pop()
+        event = dict(type='span', name=self.name, parent=self.parent, time=time.time(), duration_seconds=duration,
+                     **self.attributes)
+        if exc_type is not None:
+            event['error'] = exc_type.__name__
+        self.tracer.emit(event)
+
+
+    def set(self, **attributes) -> None:
+        """
+        Adds attributes known once the work is done, such as the number of items out
+        """
+        self.attributes.update(attributes)
+
+
+
+class Tracer:
+
+    def __init__(self):
+        """
+        Records the spans, counters and gauges of the pipeline stages into pluggable sinks.
+        Without sinks, span returns a shared no-op span and the other methods return at once.
+        """
+        self.sinks = []
+        self.enabled = False
+        self._local = threading.local()
+
+
+    def add_sink(self, sink: Any) -> None:
+        """
+        :param sink: an object with an emit(event) method, receiving one dictionary per span, counter or gauge
+        """
+        self.sinks.append(sink)
+        self.enabled = True
+
+
+    def remove_sink(self, sink: Any) -> None:
+        self.sinks.remove(sink)
+        self.enabled = bool(self.sinks)
+
+
+    def _stack(self) -> List[Span]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+
+    def span(self, name: str, **attributes) -> Union[Span, _NullSpan]:
+        """
+        :param name: the name of the stage
+        :param attributes: the attributes of the span
+        :return: a context manager timing the stage
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, attributes)
+
+
+    def record(self, name: str, duration: float, **attributes) -> None:
+        """
+        Emits a span measured by the caller, for work that is not a block of the current thread, such as the batches
+        awaited by coroutines
+        """
+        if self.enabled:
+            self.emit(dict(type='span', name=name, parent=None, time=time.time(), duration_seconds=duration,
+                           **attributes))
+
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        """
+        Increments a counter, such as the cache hits or the questions dropped by the filter
+        """
+        if self.enabled:
+            self.emit(dict(type='counter', name=name, time=time.time(), value=value, **labels))
+
+
+    def gauge(self, name: str, value: float, **labels) -> None:
+        """
+        Sets a gauge, such as a cache hit rate or a model load time
+        """
+        if self.enabled:
+            self.emit(dict(type='gauge', name=name, time=time.time(), value=value, **labels))
+
+
+    def emit(self, event: Dict[str, Any]) -> None:
+        for sink in self.sinks:
+            sink.emit(event)
+
+
+
+class JSONLinesSink:
+
+    def __init__(self, path: str):
+        """
+        Appends every event to a file, one JSON object per line
+        :param path: the path of the file
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'a', encoding='utf-8')
+
+
+    def emit(self, event: Dict[str, Any]) -> None:
+        line = json.dumps(event, default=str) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+
+    def close(self) -> None:
+        self.file.close()
+
+
+
+class LoggingSink:
+
+    def __init__(self, logger: logging.Logger = None, level: int = logging.INFO):
+        """
+        Writes one human-readable line per span, in place of the progress messages of the stages
+        :param logger: the logger, the one of this module by default
+        :param level: the level of the messages
+        """
+        self.logger = logger or logging.getLogger(__name__)
+        self.level = level
+
+
+    def emit(self, event: Dict[str, Any]) -> None:
+        if event['type'] == 'span' and self.logger.isEnabledFor(self.level):
+            attributes = ' '.join(f'{k}={v}' for k, v in event.items()
+                                  if k not in ('type', 'name', 'parent', 'time', 'duration_seconds'))
+            self.logger.log(self.level, f"{event['name']}: {event['duration_seconds']:.3f}s {attributes}")
+
+
+
+class PrometheusSink:
+
+    def __init__(self, namespace: str = 'quiz_generator', buckets: tuple = DURATION_BUCKETS):
+        """
+        Aggregates the events into metrics rendered in the Prometheus text format: a duration histogram and
+        counters of the items in and out per span name, the sum of each counter and the last value of each gauge
+        :param namespace: the prefix of the metric names
+        :param buckets: the upper bounds of the duration histogram buckets, in seconds
+        """
+        self.namespace = namespace
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.durations = {}
+        self.counters = {}
+        self.gauges = {}
+
+
+    @staticmethod
+    def _labels(event: Dict[str, Any], exclude: tuple) -> tuple:
+        return tuple(sorted((k, str(v)) for k, v in event.items() if k not in exclude))
+
+
+    def emit(self, event: Dict[str, Any]) -> None:
+        with self.lock:
+            if event['type'] == 'span':
+                span = (('span', event['name']),)
+                counts, total = self.durations.get(span, ([0] * (len(self.buckets) + 1), 0.0))
+                counts[bisect_left(self.buckets, event['duration_seconds'])] += 1
+                self.durations[span] = (counts, total + event['duration_seconds'])
+                for key in ('items_in', 'items_out'):
+                    if key in event:
+                        metric = (f'span_{key}_total', span)
+                        self.counters[metric] = self.counters.get(metric, 0) + event[key]
+            elif event['type'] == 'counter':
+                metric = (f"{event['name']}_total", self._labels(event, ('type', 'name', 'time', 'value')))
+                self.counters[metric] = self.counters.get(metric, 0) + event['value']
+            elif event['type'] == 'gauge':
+                metric = (event['name'], self._labels(event, ('type', 'name', 'time', 'value')))
+                self.gauges[metric] = event['value']
+
+
+    def _format(self, name: str, labels: tuple, value: float) -> str:
+        label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+        return f'{self.namespace}_{name}{{{label_text}}} {value}' if labels else f'{self.namespace}_{name} {value}'
+
+
+    def render(self) -> str:
+        """
+        :return: the metrics in the Prometheus text exposition format
+        """
+        lines = []
+        with self.lock:
+            if self.durations:
+                lines.append(f'# TYPE {self.namespace}_span_duration_seconds histogram')
+            for labels, (counts, total) in sorted(self.durations.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    lines.append(self._format('span_duration_seconds_bucket', labels + (('le', str(bound)),),
+                                              cumulative))
+                lines.append(self._format('span_duration_seconds_sum', labels, total))
+                lines.append(self._format('span_duration_seconds_count', labels, cumulative))
+            for kind, metrics in (('counter', self.counters), ('gauge', self.gauges)):
+                for name in sorted({name for name, _ in metrics}):
+                    lines.append(f'# TYPE {self.namespace}_{name} {kind}')
+                    for (metric_name, labels), value in sorted(metrics.items()):
+                        if metric_name == name:
+                            lines.append(self._format(name, labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+    def write(self, path: str) -> None:
+        """
+        Writes the metrics into a file, e.g. for the textfile collector of the node exporter
+        :param path: the path of the file
+        """
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+
+
+tracer = Tracer()
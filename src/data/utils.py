@@ -1,5 +1,4 @@
 from typing import List
-from tqdm import tqdm
 
 
 def yield_batches(input_list: List[object], batch_size=12) -> List[object]:
@@ -8,6 +7,6 @@ def yield_batches(input_list: List[object], batch_size=12) -> List[object]:
     :param batch_size: the size of one batch
     :return:
     """
-    for i in tqdm(range(0, len(input_list), batch_size)):
+    for i in range(0, len(input_list), batch_size):
         yield input_list[i: i + batch_size]
 
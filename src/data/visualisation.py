@@ -1,32 +1,53 @@
-from nltk.corpus import stopwords
-from nltk import RegexpTokenizer
-
-import spacy
-
 import numpy as np
-
-from sklearn.decomposition import PCA
     
 from typing import List, Any, Dict
 
-import pickle
+import logging
 
-import matplotlib.pyplot as plt
+from functools import lru_cache
+
+import pickle
 
 import re
 
 from src.data.constants import *
 
-try:
-    STOPWORDS = set(stopwords.words(LANGUAGE))
-except LookupError:
-    import nltk
-    nltk.download('stopwords')
-    STOPWORDS = set(stopwords.words(LANGUAGE))
-
 from src.data.data_format import *
 
-from pywaffle import Waffle
+from src.models.bm25_index import BM25Index, is_bm25_index_file
+
+# nltk, spaCy, scikit-learn, matplotlib and pywaffle are imported by the functions using them, so that importing this
+# module stays cheap and never downloads anything
+
+logger = logging.getLogger(__name__)
+
+
+
+
+@lru_cache(maxsize=None)
+def get_stopwords() -> frozenset:
+    """
+
+    Returns:
+        frozenset: the nltk stop words of LANGUAGE, downloaded on first use when missing.
+    """
+
+    from nltk.corpus import stopwords
+
+    try:
+        return frozenset(stopwords.words(LANGUAGE))
+    except LookupError:
+        import nltk
+        nltk.download('stopwords')
+        return frozenset(stopwords.words(LANGUAGE))
+
+
+
+def __getattr__(name: str) -> Any:
+    # STOPWORDS used to be computed at import time, it is now loaded on first access
+    if name == 'STOPWORDS':
+        return get_stopwords()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 
@@ -36,7 +57,7 @@ from pywaffle import Waffle
 class TextProcessing:
     """
     In what follows:
-    self.path is the path to a pickle file containing string sequences
+    self.path is the path to a pickle file containing string sequences, or to a BM25 index file
     self.retrieved_contexts is a list of contexts instances defined in data_format
     
     self.sequences is a list of sequences
@@ -60,7 +81,12 @@ class TextProcessing:
         Loads everything in the pickle file.
         """
         
-        if self.path:
+        if self.path and is_bm25_index_file(self.path):
+
+            with BM25Index.open(self.path) as index:
+                self.sequences = list(index.iter_texts())
+
+        elif self.path:
 
             self.sequences = []
             
@@ -70,9 +96,8 @@ class TextProcessing:
                         o = pickle.load(f)
                     except EOFError:
                         break
-                    finally :
-                        print('extraction done')
                     self.sequences.append(o)
+            logger.debug(f'{len(self.sequences)} sequences extracted from {self.path}')
         
         elif self.retrieved_contexts:
 
@@ -121,6 +146,8 @@ class TextProcessing:
         """
         This tokenize makes it possible to split "l'école" into ["l'", "école"], and removes ponctuation by the way.
         """
+        from nltk import RegexpTokenizer
+
         tokenizer = RegexpTokenizer(r'\w+')
 
         self.text_split = tokenizer.tokenize(self.text)
@@ -136,7 +163,8 @@ class TextProcessing:
         if not hasattr(self, 'text'):
             self.prepare() #by default it creates text_split
             
-        self.word_list_without_stop_words = [w for w in self.text_split if w not in STOPWORDS]
+        stopwords = get_stopwords()
+        self.word_list_without_stop_words = [w for w in self.text_split if w not in stopwords]
         
         return self.word_list_without_stop_words
     
@@ -190,6 +218,8 @@ class Embedding:
             name ([type]): name of the spacy model
         """
         
+        import spacy
+
         self.model = spacy.load(name)
         
     
@@ -210,6 +240,8 @@ class Embedding:
         if not hasattr(self, 'words_embedding'):
             raise NameError('words should be embedded first')
         
+        from sklearn.decomposition import PCA
+
         pca = PCA(n_components=2)
         
         self.words_embedding_dim_2 = pca.fit_transform(self.words_embedding)
@@ -218,6 +250,9 @@ class Embedding:
 
     
 def graph_occurrence(word, contexts):
+    import matplotlib.pyplot as plt
+    from pywaffle import Waffle
+
     data = {}
     for i in range(len(contexts)):
         total_occurrences = contexts[i].text.lower().count(word)
@@ -0,0 +1,105 @@
+from functools import lru_cache
+import re
+from src.data.data_format import *
+
+
+# End of a sentence: its punctuation, closing quotes or brackets included, then the spaces before the next one,
+# which does not start with a lowercase letter or a digit
+SENTENCE_END = re.compile(r'[.!?]+["\')\]]*(\s+)(?![\sa-z0-9])')
+
+# Word before a period that does not end a sentence: a title, a month, a Latin abbreviation, an initial (J.) or a
+# dotted acronym (U.S.)
+ABBREVIATIONS = frozenset(['mr', 'mrs', 'ms', 'dr', 'prof', 'st', 'jr', 'sr', 'rev', 'gen', 'col', 'capt', 'lt',
+                           'sgt', 'mt', 'ft', 'vs', 'etc', 'e.g', 'i.e', 'cf', 'approx', 'fig', 'vol', 'no', 'jan',
+                           'feb', 'mar', 'apr', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec'])
+WORD_BEFORE = re.compile(r'[\w.]+$')
+INITIALS = re.compile(r'(?:[A-Za-z]\.)*[A-Za-z]')
+
+# Number of sentences kept on each side of the sentences of an answer
+DEFAULT_WINDOW_SENTENCES = 1
+
+# Windows with fewer words than this fall back to the full context, too little text to ask or answer a question
+DEFAULT_MIN_WINDOW_WORDS = 8
+
+
+def is_abbreviation(text: str, end: int) -> bool:
+    """
+    :param text: a text
+    :param end: the position of a period in the text
+    :return: whether the period ends an abbreviation, an initial or an acronym rather than a sentence
+    """
+    match = WORD_BEFORE.search(text, max(0, end - 16), end) if text[end] == '.' else None
+    if match is None:
+        return False
+    return match.group().lower() in ABBREVIATIONS or INITIALS.fullmatch(match.group()) is not None
+
+
+@lru_cache(maxsize=4096)
+def sentence_spans(text: str) -> tuple:
+    """
+    Splits a text into sentences, cached since the answers of a context share its text
+    :param text: the text of a context
+    :return: the (start, end) character positions of each sentence, covering the whole text
+    """
+    spans = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        if is_abbreviation(text, match.start()):
+            continue
+        spans.append((start, match.start(1)))
+        start = match.end(1)
+    if start < len(text) or not spans:
+        spans.append((start, len(text)))
+    return tuple(spans)
+
+
+def answer_span(answer: Answer) -> tuple:
+    """
+    :param answer: an answer with a context
+    :return: the (start, end) character positions of the answer in the text of its context, from its positions when
+    they match its text, from its first occurrence otherwise, None when it is not in the context
+    """
+    text = answer.context.text
+    start, end = answer.start_char_position, answer.end_char_position
+    if 0 <= start < end <= len(text) and text[start: end] == answer.text:
+        return start, end
+    start = text.find(answer.text) if answer.text else -1
+    return (start, start + len(answer.text)) if start >= 0 else None
+
+
+def answer_window(answer: Answer, sentences: int = DEFAULT_WINDOW_SENTENCES,
+                  min_words: int = DEFAULT_MIN_WINDOW_WORDS) -> str:
+    """
+    Cuts the sentences of an answer out of its context, with the given number of sentences on each side, to shorten
+    the inputs of the question generation and question answering models
+    :param answer: an answer with a context
+    :param sentences: the number of sentences kept on each side, None for the full context
+    :param min_words: the number of words under which the window falls back to the full context
+    :return: the window, or the full text of the context when windowing is disabled, when the answer is not found in
+    its context or when the window is too short
+    """
+    text = answer.context.text
+    span = answer_span(answer) if sentences is not None else None
+    if span is None:
+        return text
+
+    spans = sentence_spans(text)
+    first = next(i for i, (_, end) in enumerate(spans) if end > span[0])
+    last = next(i for i in range(len(spans) - 1, -1, -1) if spans[i][0] < span[1])
+    window = text[spans[max(0, first - sentences)][0]: spans[min(len(spans) - 1, last + sentences)][1]]
+    return window if len(window.split()) >= min_words else text
+
+
+def question_window(question: Question, sentences: int = DEFAULT_WINDOW_SENTENCES,
+                    min_words: int = DEFAULT_MIN_WINDOW_WORDS) -> str:
+    """
+    :param question: a generated question, with its predicted answers and their contexts
+    :param sentences: the number of sentences kept on each side of the answers, None for the full contexts
+    :param min_words: the number of words under which a window falls back to the full context
+    :return: the windows of the predicted answers of the question, the texts of its retrieved contexts joined
+    together when windowing is disabled or when none of its answers has a context
+    """
+    answers = [a for a in question.predicted_answers or [] if a.context is not None and a.context.text]
+    if sentences is None or not answers:
+        return ' '.join([context.text for context in question.retrieved_contexts])
+    return ' '.join(dict.fromkeys(answer_window(a, sentences, min_words) for a in answers))
@@ -0,0 +1,414 @@
+from array import array
+from math import log
+import heapq
+import mmap
+import struct
+import sys
+import re
+
+from src.data.data_format import *
+
+
+# Stop words of the Elasticsearch `_english_` analyzer used by `run_indexing`
+ENGLISH_STOPWORDS = frozenset(['a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'if', 'in', 'into',
+                               'is', 'it', 'no', 'not', 'of', 'on', 'or', 'such', 'that', 'the', 'their', 'then',
+                               'there', 'these', 'they', 'this', 'to', 'was', 'will', 'with'])
+
+TOKEN_EXPRESSION = re.compile(r'\w+')
+
+MAX_TERM_FREQUENCY = 65535
+
+INDEX_MAGIC = b'QGBM25\x00\x01'
+
+# Header: magic, byte order, number of documents, terms and articles, k1, b
+HEADER = struct.Struct('<8sBxxxIIIdd')
+
+# Sections of the on-disk format, in file order, with their array type code
+SECTIONS = (('doc_lengths', 'I'),
+            ('doc_norms', 'f'),
+            ('doc_articles', 'I'),
+            ('doc_paragraph_ids', 'I'),
+            ('idf', 'd'),
+            ('postings_offsets', 'Q'),
+            ('postings_docs', 'I'),
+            ('postings_tfs', 'H'),
+            ('term_offsets', 'Q'),
+            ('terms', 'B'),
+            ('text_offsets', 'Q'),
+            ('texts', 'B'),
+            ('article_offsets', 'Q'),
+            ('articles', 'B'))
+
+SECTION_TABLE = struct.Struct('<' + 'QQ' * len(SECTIONS))
+
+ALIGNMENT = 8
+
+BYTE_ORDERS = {'little': 0, 'big': 1}
+
+
+
+def analyze(text: str) -> List[str]:
+    """
+    Splits a text into lowercased terms and removes English stop words, like the standard analyzer of the index
+    :param text: the text to analyze
+    :return: the list of terms of the text
+    """
+    return [t for t in TOKEN_EXPRESSION.findall(text.lower()) if t not in ENGLISH_STOPWORDS]
+
+
+
+class BM25Index:
+    """
+    In-process BM25 inverted index over the Wikipedia paragraphs.
+
+    The postings of every term are stored contiguously in flat arrays:
+    self.postings_offsets[t]:self.postings_offsets[t + 1] delimits the postings of the term t in
+    self.postings_docs (document numbers, in increasing order) and self.postings_tfs (term frequencies).
+    Document lengths, their BM25 length normalisation and the IDF of every term are computed once at finalisation.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        """
+        :param k1: the term frequency saturation parameter of BM25
+        :param b: the length normalisation parameter of BM25
+        """
+        self.k1 = k1
+        self.b = b
+        self.documents = []
+        self.vocabulary = {}
+        self.doc_lengths = array('I')
+        self._postings = {}
+
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+
+    def add_documents(self, documents: List[dict]) -> None:
+        """
+        Adds paragraphs to the index, with the format produced by convert_wikipedia_dump_to_documents
+        :param documents: list of dictionaries with the keys id, name, url, paragraph_id and text
+        :return: None
+        """
+        for doc in documents:
+            doc_number = len(self.doc_lengths)
+            terms = analyze(doc['text'])
+            frequencies = {}
+            for t in terms:
+                frequencies[t] = frequencies.get(t, 0) + 1
+
+            for t, tf in frequencies.items():
+                if t not in self._postings:
+                    self._postings[t] = (array('I'), array('H'))
+                docs, tfs = self._postings[t]
+                docs.append(doc_number)
+                tfs.append(min(tf, MAX_TERM_FREQUENCY))
+
+            self.doc_lengths.append(len(terms))
+            self.documents.append((doc['text'], str(doc['id']), doc['name'], doc['url'], doc['paragraph_id']))
+
+
+    def finalize(self) -> 'BM25Index':
+        """
+        Flattens the postings into contiguous arrays and precomputes the IDF and length normalisation
+        :return: the index itself
+        """
+        self.postings_offsets = array('Q', [0])
+        self.postings_docs = array('I')
+        self.postings_tfs = array('H')
+        self.vocabulary = {}
+
+        for term_id, term in enumerate(sorted(self._postings)):
+            docs, tfs = self._postings[term]
+            self.vocabulary[term] = term_id
+            self.postings_docs.extend(docs)
+            self.postings_tfs.extend(tfs)
+            self.postings_offsets.append(len(self.postings_docs))
+        self._postings = {}
+
+        n_documents = len(self.doc_lengths)
+        self.idf = array('d', [self._idf(self.postings_offsets[t + 1] - self.postings_offsets[t], n_documents)
+                               for t in range(len(self.vocabulary))])
+
+        avg_length = sum(self.doc_lengths) / n_documents if n_documents else 0.0
+        self.doc_norms = array('f', [self.k1 * (1 - self.b + self.b * dl / avg_length) if avg_length else self.k1
+                                     for dl in self.doc_lengths])
+        return self
+
+
+    @staticmethod
+    def _idf(doc_frequency: int, n_documents: int) -> float:
+        return log(1 + (n_documents - doc_frequency + 0.5) / (doc_frequency + 0.5))
+
+
+    def _term_id(self, term: str) -> int:
+        return self.vocabulary.get(term, -1)
+
+
+    def _document(self, doc_number: int) -> tuple:
+        return self.documents[doc_number]
+
+
+    def score(self, query: str, top_k: int = 10) -> List[tuple]:
+        """
+        Scores the documents matching the query, document at a time, by merging the postings of the query terms
+        with a heap of cursors. Only the documents of these postings are visited and the k best are kept in a
+        min-heap.
+        :param query: the query
+        :param top_k: the number of documents to return
+        :return: a list of (score, document number) sorted by decreasing score
+        """
+        cursors = []
+        for term in set(analyze(query)):
+            term_id = self._term_id(term)
+            if term_id >= 0:
+                start, end = self.postings_offsets[term_id], self.postings_offsets[term_id + 1]
+                cursors.append([start, end, self.idf[term_id] * (self.k1 + 1)])
+
+        heap = [(self.postings_docs[c[0]], slot) for slot, c in enumerate(cursors)]
+        heapq.heapify(heap)
+        best = []
+
+        while heap:
+            doc_number = heap[0][0]
+            norm = self.doc_norms[doc_number]
+            doc_score = 0.0
+            while heap and heap[0][0] == doc_number:
+                slot = heap[0][1]
+                cursor = cursors[slot]
+                tf = self.postings_tfs[cursor[0]]
+                doc_score += cursor[2] * tf / (tf + norm)
+                cursor[0] += 1
+                if cursor[0] < cursor[1]:
+                    heapq.heapreplace(heap, (self.postings_docs[cursor[0]], slot))
+                else:
+                    heapq.heappop(heap)
+
+            if len(best) < top_k:
+                heapq.heappush(best, (doc_score, -doc_number))
+            elif doc_score > best[0][0]:
+                heapq.heapreplace(best, (doc_score, -doc_number))
+
+        return [(s, -d) for s, d in sorted(best, reverse=True)]
+
+
+    def text(self, doc_number: int) -> str:
+        """
+        :param doc_number: the number of a document of the index
+        :return: the text of the paragraph
+        """
+        return self._document(doc_number)[0]
+
+
+    def identifier(self, doc_number: int) -> str:
+        """
+        :param doc_number: the number of a document of the index
+        :return: the identifier of the paragraph, the _id of its Elasticsearch document
+        """
+        _, article_id, _, _, paragraph_id = self._document(doc_number)
+        return f'{article_id}_{paragraph_id}'
+
+
+    def iter_texts(self):
+        """
+        Yields the text of every paragraph of the index, in document order
+        """
+        for doc_number in range(len(self)):
+            yield self.text(doc_number)
+
+
+    def top_k(self, query: str, top_k: int = 10) -> List[dict]:
+        """
+        Returns the k best paragraphs for the query, formatted as Elasticsearch hits
+        :param query: the query
+        :param top_k: the number of paragraphs to return
+        :return: a list of hits with the keys _id, _score and _source
+        """
+        hits = []
+        for doc_score, doc_number in self.score(query, top_k):
+            text, article_id, name, url, paragraph_id = self._document(doc_number)
+            hits.append({"_id": f"{article_id}_{paragraph_id}",
+                         "_score": doc_score,
+                         "_source": {"id": article_id,
+                                     "name": name,
+                                     "url": url,
+                                     "paragraph_id": paragraph_id,
+                                     "doc_index": doc_number,
+                                     "text": text}})
+        return hits
+
+
+    def save(self, path: str) -> None:
+        """
+        Writes the finalized index into a binary file that can be memory-mapped with BM25Index.open.
+        Every section is a flat array, strings being stored as one utf-8 blob delimited by an offsets array.
+        :param path: the path of the index file
+        :return: None
+        """
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        term_offsets, term_blob = self._pack_strings(terms)
+        text_offsets, text_blob = self._pack_strings(d[0] for d in self.documents)
+
+        # Titles and urls are stored once per article, paragraphs refer to their article
+        doc_articles = array('I')
+        doc_paragraph_ids = array('I')
+        article_fields = []
+        previous_article = None
+        for text, article_id, name, url, paragraph_id in self.documents:
+            if article_id != previous_article:
+                article_fields += [article_id, name or '', url or '']
+                previous_article = article_id
+            doc_articles.append(len(article_fields) // 3 - 1)
+            doc_paragraph_ids.append(paragraph_id)
+        article_offsets, article_blob = self._pack_strings(article_fields)
+
+        data = {'doc_lengths': self.doc_lengths,
+                'doc_norms': self.doc_norms,
+                'doc_articles': doc_articles,
+                'doc_paragraph_ids': doc_paragraph_ids,
+                'idf': self.idf,
+                'postings_offsets': self.postings_offsets,
+                'postings_docs': self.postings_docs,
+                'postings_tfs': self.postings_tfs,
+                'term_offsets': term_offsets,
+                'terms': term_blob,
+                'text_offsets': text_offsets,
+                'texts': text_blob,
+                'article_offsets': article_offsets,
+                'articles': article_blob}
+
+        with open(path, 'wb') as f:
+            position = HEADER.size + SECTION_TABLE.size
+            table = []
+            for name, _ in SECTIONS:
+                position += -position % ALIGNMENT
+                size = len(memoryview(data[name]).cast('B'))
+                table += [position, size]
+                position += size
+
+            f.write(HEADER.pack(INDEX_MAGIC, BYTE_ORDERS[sys.byteorder], len(self), len(terms),
+                                len(article_fields) // 3, self.k1, self.b))
+            f.write(SECTION_TABLE.pack(*table))
+            for (name, _), offset in zip(SECTIONS, table[::2]):
+                f.write(b'\x00' * (offset - f.tell()))
+                f.write(memoryview(data[name]).cast('B'))
+
+
+    @staticmethod
+    def _pack_strings(strings) -> tuple:
+        offsets = array('Q', [0])
+        blob = bytearray()
+        for s in strings:
+            blob += s.encode('utf-8')
+            offsets.append(len(blob))
+        return offsets, blob
+
+
+    @staticmethod
+    def open(path: str) -> 'MMapBM25Index':
+        """
+        Opens an index file written by BM25Index.save without loading it in memory
+        :param path: the path of the index file
+        :return: the memory-mapped index
+        """
+        return MMapBM25Index(path)
+
+
+
+def is_bm25_index_file(path: str) -> bool:
+    """
+    :param path: path of a file
+    :return: whether the file is an index written by BM25Index.save
+    """
+    with open(path, 'rb') as f:
+        return f.read(len(INDEX_MAGIC)) == INDEX_MAGIC
+
+
+
+class MMapBM25Index(BM25Index):
+    """
+    Read-only BM25 index backed by a memory-mapped file.
+
+    Opening only reads the header: arrays are views on the mapping, the vocabulary is searched by dichotomy in the
+    sorted terms and paragraphs are decoded when they are returned. Several processes opening the same file share
+    its pages through the page cache.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: the path of the index file
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, byte_order, n_documents, n_terms, n_articles, k1, b = HEADER.unpack_from(self._mmap, 0)
+        if magic != INDEX_MAGIC:
+            self._mmap.close()
+            raise ValueError(f'{path} is not a BM25 index file')
+        if byte_order != BYTE_ORDERS[sys.byteorder]:
+            self._mmap.close()
+            raise ValueError(f'{path} was written with a different byte order')
+
+        self.k1 = k1
+        self.b = b
+        self.n_terms = n_terms
+        self.n_articles = n_articles
+        self._buffer = memoryview(self._mmap)
+        table = SECTION_TABLE.unpack_from(self._mmap, HEADER.size)
+        for (name, typecode), offset, size in zip(SECTIONS, table[::2], table[1::2]):
+            setattr(self, name, self._buffer[offset: offset + size].cast(typecode))
+
+
+    def __enter__(self) -> 'MMapBM25Index':
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+    def close(self) -> None:
+        """
+        Releases the views on the mapping and closes it
+        """
+        for name, _ in SECTIONS:
+            getattr(self, name).release()
+        self._buffer.release()
+        self._mmap.close()
+
+
+    def add_documents(self, documents: List[dict]) -> None:
+        raise TypeError('A memory-mapped index is read-only')
+
+
+    def _string(self, offsets, blob, position: int) -> str:
+        return bytes(blob[offsets[position]: offsets[position + 1]]).decode('utf-8')
+
+
+    def _term_id(self, term: str) -> int:
+        key = term.encode('utf-8')
+        offsets, blob = self.term_offsets, self.terms
+        low, high = 0, self.n_terms
+        while low < high:
+            middle = (low + high) // 2
+            if bytes(blob[offsets[middle]: offsets[middle + 1]]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.n_terms and bytes(blob[offsets[low]: offsets[low + 1]]) == key:
+            return low
+        return -1
+
+
+    def _document(self, doc_number: int) -> tuple:
+        article = self.doc_articles[doc_number]
+        return (self._string(self.text_offsets, self.texts, doc_number),
+                self._string(self.article_offsets, self.articles, 3 * article),
+                self._string(self.article_offsets, self.articles, 3 * article + 1),
+                self._string(self.article_offsets, self.articles, 3 * article + 2),
+                self.doc_paragraph_ids[doc_number])
+
+
+    def text(self, doc_number: int) -> str:
+        return self._string(self.text_offsets, self.texts, doc_number)
@@ -1,23 +1,53 @@
-from elasticsearch import Elasticsearch
+import os
+import threading
+import time
+import weakref
 from src.data.data_format import *
+from src.data.tracing import tracer
+
+
+# The retrievers of the process, whose caches are cleared by the indexing scripts
+_retrievers = weakref.WeakSet()
+
+
+def clear_retriever_caches() -> None:
+    """
+    Forgets the cached hits of every retriever of the process, called by the indexing scripts once the index changed
+    """
+    for retriever in list(_retrievers):
+        retriever.clear_cache()
 
 
 class BM25Retriever:
 
+    # Fields of the indexed paragraphs read by convert_es_hit_to_context, the others are not sent back
+    SOURCE_FIELDS = ["id", "name", "url", "paragraph_id", "text"]
+
     def __init__(self, client, name: str = 'BM25 Retriever', **kwargs):
         """
+        :param client: an Elasticsearch client, or a BM25Index when the backend is 'local'
         :param name: the name of the model
         :param kwargs: the arguments of the BM25 retriever
         """
         self.kwargs = self.fill_default_kwargs(**kwargs)
         self.name = name
         self.client = client
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_version = None
+        self._version_checked = None
+        _retrievers.add(self)
 
     @classmethod
     def fill_default_kwargs(cls, **kwargs) -> Dict:
         kwargs.update(dict(
             top_k=kwargs.get("top_k", 10),
-            index=kwargs.get("index", "wikipedia_english")))
+            index=kwargs.get("index", "wikipedia_english"),
+            backend=kwargs.get("backend", "elasticsearch"),
+            cache_size=kwargs.get("cache_size", 1024),
+            version_ttl=kwargs.get("version_ttl", 60)))
         return kwargs
 
 
@@ -40,20 +70,56 @@ class BM25Retriever:
             scores=OrderedDict({self.name: hit["_score"] if hit["_score"] else None}),
             meta=meta)
 
-    def retrieve(self, query: str, top_k: int = 0) -> List[Context]:
+    def index_version(self) -> str:
         """
-        Returns the top k passages in the index corresponding to the request
-        :param query: A request for information about data in the Elasticsearch index
-        :param top_k: k most relevant passages according to the query
-        :return: A list containing the k most relevant Context
+        Identifies the content of the index, which changes when the index is rebuilt, when documents are added, and
+        for Elasticsearch when documents are updated in place, through the content version stored in the _meta of
+        the mapping by the indexing scripts
+        :return: the version of the index
         """
 
+        if self.kwargs.get('backend') == 'local':
+            path = getattr(self.client, 'path', None)
+            if path is None:
+                return f'memory-{id(self.client)}-{len(self.client)}'
+            stat = os.stat(path)
+            return f'{os.path.basename(path)}-{stat.st_size}-{stat.st_mtime_ns}'
+
         index = self.kwargs.get('index')
-        if top_k == 0:
-            top_k = self.kwargs.get('top_k')
+        settings = self.client.indices.get_settings(index=index)
+        mappings = self.client.indices.get_mapping(index=index)
+        count = self.client.count(index=index)['count']
+        versions = [f"{name}-{s['settings']['index']['uuid']}-"
+                    f"{mappings.get(name, {}).get('mappings', {}).get('_meta', {}).get('content_version', '')}"
+                    for name, s in sorted(settings.items())]
+        return ','.join(versions) + f'-{count}'
+
+    def _check_version(self) -> None:
+        """
+        Drops the cached hits of another version of the index, checked at most once every version_ttl seconds since
+        it costs a few requests with Elasticsearch. Nothing is checked while the cache is empty, the hits of the first
+        fill are then stored under an unknown version and replaced after the first check. A version_ttl of None
+        disables the check.
+        """
+        version_ttl = self.kwargs.get('version_ttl')
+        now = time.monotonic()
+        with self._cache_lock:
+            if version_ttl is None or not self._cache or \
+                    (self._version_checked is not None and now - self._version_checked < version_ttl):
+                return
+
+        version = self.index_version()
+        with self._cache_lock:
+            if version != self._cache_version:
+                for key in [k for k, (v, _) in self._cache.items() if v != version]:
+                    del self._cache[key]
+                self._cache_version = version
+            self._version_checked = now
 
-        body = {
+    def _query_body(self, query: str, top_k: int) -> dict:
+        return {
             "size": str(top_k),
+            "_source": self.SOURCE_FIELDS,
             "query": {
                 "bool": {
                     "should": [
@@ -64,7 +130,94 @@ class BM25Retriever:
             },
         }
 
-        result = self.client.search(index=index, body=body)["hits"]["hits"]
+    def _search(self, queries: List[str], top_k: int) -> List[List[dict]]:
+        """
+        Sends the queries to the index, in a single round trip for Elasticsearch
+        :param queries: the queries
+        :param top_k: the number of hits per query
+        :return: the hits of each query
+        """
+
+        index = self.kwargs.get('index')
+        if self.kwargs.get('backend') == 'local':
+            return [self.client.top_k(query, top_k) for query in queries]
+
+        if len(queries) == 1:
+            return [self.client.search(index=index, body=self._query_body(queries[0], top_k))["hits"]["hits"]]
 
-        contexts = [self.convert_es_hit_to_context(hit) for hit in result]
-        return contexts
+        body = []
+        for query in queries:
+            body += [{"index": index}, self._query_body(query, top_k)]
+        responses = self.client.msearch(body=body)["responses"]
+
+        hits = []
+        for query, response in zip(queries, responses):
+            if "error" in response:
+                raise RuntimeError(f'Search of {query!r} failed: {response["error"]}')
+            hits.append(response["hits"]["hits"])
+        return hits
+
+    def retrieve_batch(self, queries: List[str], top_k: int = 0) -> List[List[Context]]:
+        """
+        Returns the top k passages of several queries. The hits of the last cache_size queries are kept in memory, for
+        the current version of the index, and the other queries are sent together in one msearch request.
+        :param queries: requests for information about data in the Elasticsearch index
+        :param top_k: k most relevant passages according to each query
+        :return: for each query, a list containing its k most relevant Context
+        """
+
+        if top_k == 0:
+            top_k = self.kwargs.get('top_k')
+        cache_size = self.kwargs.get('cache_size')
+
+        with tracer.span('retrieval', items_in=len(queries), top_k=top_k) as span:
+            self._check_version()
+            hits = {}
+            with self._cache_lock:
+                # The hits fetched below are stored under the version known before the search, so that hits fetched
+                # while the index is swapped are dropped by the next check instead of being kept under the new version
+                version = self._cache_version
+                for query in queries:
+                    entry = self._cache.get((query, top_k))
+                    if entry is not None and entry[0] == version:
+                        self._cache.move_to_end((query, top_k))
+                        hits[query] = entry[1]
+                missing = list(dict.fromkeys(q for q in queries if q not in hits))
+                self.cache_hits += len(queries) - len(missing)
+                self.cache_misses += len(missing)
+
+            if missing:
+                for query, query_hits in zip(missing, self._search(missing, top_k)):
+                    hits[query] = query_hits
+                with self._cache_lock:
+                    if self._version_checked is None:
+                        # The version is checked version_ttl seconds after the first fill
+                        self._version_checked = time.monotonic()
+                    for query in missing:
+                        self._cache[(query, top_k)] = (version, hits[query])
+                    while len(self._cache) > cache_size:
+                        self._cache.popitem(last=False)
+
+            span.set(cache_hits=len(queries) - len(missing), items_out=sum(len(hits[q]) for q in queries))
+        tracer.count('retrieval_cache_hits', len(queries) - len(missing))
+        tracer.count('retrieval_cache_misses', len(missing))
+
+        # Contexts are created for each call, so that callers can modify them
+        return [[self.convert_es_hit_to_context(hit) for hit in hits[query]] for query in queries]
+
+    def retrieve(self, query: str, top_k: int = 0) -> List[Context]:
+        """
+        Returns the top k passages in the index corresponding to the request
+        :param query: A request for information about data in the Elasticsearch index
+        :param top_k: k most relevant passages according to the query
+        :return: A list containing the k most relevant Context
+        """
+        return self.retrieve_batch([query], top_k)[0]
+
+    def clear_cache(self) -> None:
+        """
+        Forgets the cached hits, to be called when the index is rebuilt
+        """
+        with self._cache_lock:
+            self._cache.clear()
+            self._version_checked = None
@@ -0,0 +1,208 @@
+from array import array
+from os.path import exists
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+from src.data.data_format import *
+from src.models.bm25_index import ALIGNMENT, BYTE_ORDERS, BM25Index
+
+
+ENTITY_INDEX_MAGIC = b'QGENT\x00\x00\x03'
+
+# Header: magic, byte order, number of documents, entities and entity types, fingerprint of the BM25 index
+ENTITY_HEADER = struct.Struct('<8sBxxxIQI40s')
+
+# Columns of the entity file, in file order, with their array type code
+ENTITY_SECTIONS = (('doc_offsets', 'Q'),
+                   ('starts', 'I'),
+                   ('ends', 'I'),
+                   ('type_ids', 'B'),
+                   ('type_offsets', 'Q'),
+                   ('type_names', 'B'),
+                   ('text_checksums', 'I'),
+                   ('id_documents', 'I'),
+                   ('id_offsets', 'Q'),
+                   ('ids', 'B'))
+
+ENTITY_SECTION_TABLE = struct.Struct('<' + 'QQ' * len(ENTITY_SECTIONS))
+
+
+
+def bm25_index_fingerprint(index_path: str) -> str:
+    """
+    :param index_path: the path of a BM25 index file
+    :return: a hash of its number of documents, size and modification time, which changes when it is rebuilt
+    """
+    with BM25Index.open(index_path) as index:
+        n_documents = len(index)
+    stat = os.stat(index_path)
+    return hashlib.sha1(f'{n_documents}-{stat.st_size}-{stat.st_mtime_ns}'.encode('utf-8')).hexdigest()
+
+
+
+def text_checksum(text: str) -> int:
+    """
+    :param text: the text of a paragraph
+    :return: its CRC32, which tells whether a retrieved context still has the text its entities were computed on
+    """
+    return zlib.crc32(text.encode('utf-8'))
+
+
+
+def write_entity_index(path: str, doc_offsets: array, starts: array, ends: array, type_ids: array,
+                       type_names: List[str], identifiers: List[str], text_checksums: array,
+                       fingerprint: str) -> None:
+    """
+    Writes the entities of the paragraphs of a BM25 index into a columnar file.
+    The entities of the document d are the positions doc_offsets[d]:doc_offsets[d + 1] of the other columns.
+    The identifiers of the paragraphs are stored sorted, with their document number, to find the entities of the
+    contexts retrieved from Elasticsearch by their identifier.
+    :param path: the path of the entity file
+    :param doc_offsets: array('Q') of len(index) + 1 offsets
+    :param starts: array('I') of the first character of each entity
+    :param ends: array('I') of the character after each entity
+    :param type_ids: array('B') of the position of the type of each entity in type_names
+    :param type_names: list of the entity types
+    :param identifiers: the identifier of each document, see BM25Index.identifier
+    :param text_checksums: array('I') of the text_checksum of each document
+    :param fingerprint: the fingerprint of the BM25 index the entities were computed on, see bm25_index_fingerprint
+    :return: None
+    """
+    type_offsets = array('Q', [0])
+    type_blob = bytearray()
+    for name in type_names:
+        type_blob += name.encode('utf-8')
+        type_offsets.append(len(type_blob))
+
+    encoded_ids = [identifier.encode('utf-8') for identifier in identifiers]
+    id_documents = array('I', sorted(range(len(encoded_ids)), key=encoded_ids.__getitem__))
+    id_offsets = array('Q', [0])
+    id_blob = bytearray()
+    for doc_number in id_documents:
+        id_blob += encoded_ids[doc_number]
+        id_offsets.append(len(id_blob))
+
+    data = {'doc_offsets': doc_offsets, 'starts': starts, 'ends': ends, 'type_ids': type_ids,
+            'type_offsets': type_offsets, 'type_names': type_blob, 'text_checksums': text_checksums,
+            'id_documents': id_documents, 'id_offsets': id_offsets, 'ids': id_blob}
+
+    with open(path, 'wb') as f:
+        position = ENTITY_HEADER.size + ENTITY_SECTION_TABLE.size
+        table = []
+        for name, _ in ENTITY_SECTIONS:
+            position += -position % ALIGNMENT
+            size = len(memoryview(data[name]).cast('B'))
+            table += [position, size]
+            position += size
+
+        f.write(ENTITY_HEADER.pack(ENTITY_INDEX_MAGIC, BYTE_ORDERS[sys.byteorder], len(doc_offsets) - 1,
+                                   len(starts), len(type_names), fingerprint.encode('ascii')))
+        f.write(ENTITY_SECTION_TABLE.pack(*table))
+        for (name, _), offset in zip(ENTITY_SECTIONS, table[::2]):
+            f.write(b'\x00' * (offset - f.tell()))
+            f.write(memoryview(data[name]).cast('B'))
+
+
+
+class EntityIndex:
+    """
+    Read-only, memory-mapped entities precomputed for every paragraph of a BM25 index, so that answers can be
+    attached to retrieved contexts without running the NER model.
+    """
+
+    def __init__(self, path: str, index_path: str = None) -> None:
+        """
+        :param path: the path of the entity file written by write_entity_index
+        :param index_path: the BM25 index the entities are read for, checked against the one they were computed on.
+        Defaults to path without its .entities suffix, when that file exists.
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, byte_order, self.n_documents, self.n_entities, n_types, fingerprint = \
+            ENTITY_HEADER.unpack_from(self._mmap, 0)
+        if magic != ENTITY_INDEX_MAGIC or byte_order != BYTE_ORDERS[sys.byteorder]:
+            self._mmap.close()
+            raise ValueError(f'{path} is not an entity file of this platform')
+
+        self.fingerprint = fingerprint.decode('ascii')
+        if index_path is None and path.endswith('.entities') and exists(path[:-len('.entities')]):
+            index_path = path[:-len('.entities')]
+        if index_path is not None and bm25_index_fingerprint(index_path) != self.fingerprint:
+            self._mmap.close()
+            raise ValueError(f'{path} was computed on another version of {index_path}, run entity_indexing again')
+
+        self._buffer = memoryview(self._mmap)
+        table = ENTITY_SECTION_TABLE.unpack_from(self._mmap, ENTITY_HEADER.size)
+        for (name, typecode), offset, size in zip(ENTITY_SECTIONS, table[::2], table[1::2]):
+            setattr(self, name, self._buffer[offset: offset + size].cast(typecode))
+        self.types = [bytes(self.type_names[self.type_offsets[t]: self.type_offsets[t + 1]]).decode('utf-8')
+                      for t in range(n_types)]
+
+
+    def __len__(self) -> int:
+        return self.n_documents
+
+
+    def __enter__(self) -> 'EntityIndex':
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+    def close(self) -> None:
+        for name, _ in ENTITY_SECTIONS:
+            getattr(self, name).release()
+        self._buffer.release()
+        self._mmap.close()
+
+
+    def entities(self, doc_number: int, text: str) -> List[tuple]:
+        """
+        :param doc_number: the number of the paragraph in the BM25 index
+        :param text: the text of the paragraph
+        :return: the entities of the paragraph as (text, type, start_char, end_char)
+        """
+        return [(text[self.starts[e]: self.ends[e]], self.types[self.type_ids[e]], self.starts[e], self.ends[e])
+                for e in range(self.doc_offsets[doc_number], self.doc_offsets[doc_number + 1])]
+
+
+    def doc_number(self, identifier: str) -> int:
+        """
+        :param identifier: the identifier of a paragraph, the _id of its Elasticsearch document
+        :return: the number of the paragraph in the BM25 index, -1 when it is not in the index
+        """
+        key = identifier.encode('utf-8')
+        low, high = 0, self.n_documents
+        while low < high:
+            middle = (low + high) // 2
+            if bytes(self.ids[self.id_offsets[middle]: self.id_offsets[middle + 1]]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.n_documents and bytes(self.ids[self.id_offsets[low]: self.id_offsets[low + 1]]) == key:
+            return self.id_documents[low]
+        return -1
+
+
+    def get_many(self, contexts: List[Context]) -> List[Union[List[tuple], None]]:
+        """
+        :param contexts: list of contexts, retrieved from Elasticsearch or from the BM25 index
+        :return: for each context, the entities of the paragraph of the same identifier, or None when there is none or
+        when its text changed since the entities were computed
+        """
+        result = []
+        for c in contexts:
+            doc_number = self.doc_number(str(c.identifier)) if c.identifier is not None and c.text else -1
+            if doc_number < 0 or self.text_checksums[doc_number] != text_checksum(c.text):
+                result.append(None)
+            else:
+                result.append(self.entities(doc_number, c.text))
+        return result
@@ -0,0 +1,194 @@
+from collections import OrderedDict
+from os import makedirs
+from os.path import abspath, dirname
+from typing import Any, Callable, List
+import logging
+import threading
+import time
+
+from src.data.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# SQLite file of the NER cache given to the Stanza extractors loaded by get_stanza_extractor, None to disable it
+ner_cache_path = './data/ner_cache.sqlite'
+
+
+
+class ModelRegistry:
+
+    def __init__(self, max_memory: int = None):
+        """
+        Process-wide store of loaded models: each model is loaded on first use, then shared by every call and thread
+        :param max_memory: the maximal memory of the models in bytes, the least recently used ones are evicted above
+        """
+        self.max_memory = max_memory
+        self.load_seconds = {}
+        self._models = OrderedDict()
+        self._loading_locks = {}
+        self._lock = threading.Lock()
+
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._models
+
+
+    def get(self, key: str, loader: Callable[[], Any]) -> Any:
+        """
+        Returns the model registered under key, loading it with loader the first time. Concurrent calls with the same
+        key wait for a single load.
+        :param key: the name of the model and of its configuration
+        :param loader: the function loading the model
+        :return: the model
+        """
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key][0]
+            loading_lock = self._loading_locks.setdefault(key, threading.Lock())
+
+        with loading_lock:
+            with self._lock:
+                if key in self._models:
+                    return self._models[key][0]
+
+            start = time.perf_counter()
+            model = loader()
+            self.load_seconds[key] = time.perf_counter() - start
+            size = model_memory(model)
+            logger.info(f'Loaded {key} in {self.load_seconds[key]:.1f}s ({size / 2 ** 20:.0f} MB)')
+            tracer.gauge('model_load_seconds', self.load_seconds[key], model=key)
+            tracer.gauge('model_memory_bytes', size, model=key)
+
+            with self._lock:
+                self._models[key] = (model, size)
+                self._evict_over_limit(keep=key)
+        return model
+
+
+    def _evict_over_limit(self, keep: str) -> None:
+        while self.max_memory is not None and self.memory() > self.max_memory:
+            key = next((k for k in self._models if k != keep), None)
+            if key is None:
+                break
+            del self._models[key]
+            logger.info(f'Evicted {key} from the model registry')
+            tracer.count('model_evictions', model=key)
+
+
+    def evict(self, key: str) -> bool:
+        """
+        Drops a model from the registry, it is freed once the calls using it are over
+        :param key: the key of the model
+        :return: whether the model was loaded
+        """
+        with self._lock:
+            return self._models.pop(key, None) is not None
+
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+
+    def memory(self) -> int:
+        """
+        :return: the estimated memory of the loaded models in bytes
+        """
+        return sum(size for _, size in self._models.values())
+
+
+    def keys(self) -> List[str]:
+        return list(self._models)
+
+
+
+def model_memory(model: Any, _seen: set = None) -> int:
+    """
+    Estimates the memory of the tensors of a model: torch modules, and the modules held by wrappers such as
+    MT5Generator, HF pipelines or Stanza pipelines
+    :param model: the model
+    :return: the number of bytes of its parameters and buffers
+    """
+    _seen = _seen if _seen is not None else set()
+    if model is None or id(model) in _seen:
+        return 0
+    _seen.add(id(model))
+
+    if hasattr(model, 'parameters') and hasattr(model, 'buffers'):
+        return sum(t.numel() * t.element_size() for t in list(model.parameters()) + list(model.buffers()))
+
+    size = 0
+    for attribute in ('model', 'nlp', '_model'):
+        size += model_memory(getattr(model, attribute, None), _seen)
+    for processor in getattr(model, 'processors', {}).values():
+        size += model_memory(processor, _seen)
+    return size
+
+
+registry = ModelRegistry()
+
+
+
+def stanza_extractor_key(stanza_dir: str, **kwargs) -> str:
+    """
+    :return: the key of the StanzaExtractor of stanza_dir in the registry
+    """
+    return f'stanza:{stanza_dir}:{sorted(kwargs.items())}'
+
+
+
+def set_ner_cache_path(path: str) -> None:
+    """
+    :param path: the SQLite file of the NER cache of the Stanza extractors loaded from now on, None to disable it
+    """
+    global ner_cache_path
+    ner_cache_path = path
+
+
+
+def get_stanza_extractor(stanza_dir: str, **kwargs) -> Any:
+    """
+    :return: the StanzaExtractor of stanza_dir, loaded once per process, with the NER cache of ner_cache_path unless
+    a cache is given in kwargs
+    """
+    from src.models.stanza_extractor import StanzaExtractor
+    from src.models.ner_cache import NERCache
+
+    def load():
+        extractor = StanzaExtractor(stanza_dir, **kwargs)
+        if extractor.cache is None and ner_cache_path is not None:
+            makedirs(dirname(abspath(ner_cache_path)), exist_ok=True)
+            # Entities are keyed by the model version too, those of another model or configuration are ignored
+            extractor.cache = NERCache(ner_cache_path, extractor.model_version)
+        return extractor
+
+    return registry.get(stanza_extractor_key(stanza_dir, **kwargs), load)
+
+
+
+def get_mt5_generator(model_path: str, backend: str = 'torch', device: str = 'cpu') -> Any:
+    """
+    :return: the frozen MT5Generator of model_path on device, loaded once per process
+    """
+    from src.models.mt5_generator import MT5Generator
+
+    def load():
+        generator = MT5Generator(model_path=model_path, backend=backend)
+        generator.eval()
+        generator.freeze()
+        generator.to(device)
+        return generator
+
+    return registry.get(f'mt5:{model_path}:{backend}:{device}', load)
+
+
+
+def get_qa_pipeline(model_path: str) -> Any:
+    """
+    :return: the HF question-answering pipeline of model_path, loaded once per process
+    """
+    from transformers import pipeline
+
+    return registry.get(f'qa:{model_path}',
+                        lambda: pipeline("question-answering", model=model_path, tokenizer=model_path))
@@ -1,43 +1,160 @@
+import logging
+import time
 import pytorch_lightning as pl
+import torch
 from transformers import MT5ForConditionalGeneration, MT5Tokenizer
 from src.data.data_format import *
-from src.data.utils import yield_batches
+from src.data.windowing import answer_window
 from torch.nn import DataParallel
 
 
+BACKENDS = ('torch', 'quantized', 'onnx')
+
+logger = logging.getLogger(__name__)
+
+
 class MT5Generator(pl.LightningModule):
-    def __init__(self, model_path: str):
+    def __init__(self, model_path: str, backend: str = 'torch'):
         """
         :param model_path: the path of the model
+        :param backend: the inference backend, 'torch' (fp32), 'quantized' (dynamic int8 quantization of the linear
+        layers, CPU only) or 'onnx' (ONNX Runtime encoder/decoder with KV cache, needs optimum[onnxruntime])
         """
         super().__init__()
+        if backend not in BACKENDS:
+            raise ValueError(f'Unknown backend {backend}, expected one of {BACKENDS}')
         self.save_hyperparameters()
-        print(self.hparams)
+        logger.debug(f'MT5Generator hyperparameters: {dict(self.hparams)}')
         self.model = MT5ForConditionalGeneration.from_pretrained(model_path, return_dict=True)
         self.tokenizer = MT5Tokenizer.from_pretrained(model_path)
+        self.encoder_parameters = sum(p.numel() for p in self.model.get_encoder().parameters())
+
+        if backend == 'quantized':
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif backend == 'onnx':
+            try:
+                from optimum.onnxruntime import ORTModelForSeq2SeqLM
+            except ImportError as e:
+                raise ImportError("The 'onnx' backend needs optimum[onnxruntime]: "
+                                  "pip install 'optimum[onnxruntime]'") from e
+            self.model = ORTModelForSeq2SeqLM.from_pretrained(model_path, export=True, use_cache=True)
+
+    @staticmethod
+    def token_budget_batches(lengths: List[int], max_tokens: int, max_batch_size: int) -> List[List[int]]:
+        """
+        Groups sequences of similar lengths: the positions are sorted by length, and a batch grows while its padded
+        size (number of sequences times the longest length) stays within the token budget
+        :param lengths: the length of each sequence
+        :param max_tokens: the maximal number of tokens of a padded batch
+        :param max_batch_size: the maximal number of sequences of a batch
+        :return: the batches, as lists of positions in lengths
+        """
+        batches = []
+        batch = []
+        for i in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+            if batch and ((len(batch) + 1) * lengths[i] > max_tokens or len(batch) == max_batch_size):
+                batches.append(batch)
+                batch = []
+            batch.append(i)
+        if batch:
+            batches.append(batch)
+        return batches
 
-    def generate(self, questions: List[Question]) -> List[Question]:
+    def encode_pairs(self, answers: List[Answer], share_contexts: bool = True, window: int = None,
+                     stats: Dict[str, Any] = None) -> List[List[int]]:
         """
-        Generates a list of questions from pairs of contexts and answers
+        Tokenizes the pairs of answer/context without padding. With share_contexts, the answers are grouped by
+        context (Context.identifier and text) and each context is tokenized once, the pairs
+        being assembled from the token ids with the same truncation and special tokens as the tokenizer.
+        :param answers: list of Answer objects
+        :param share_contexts: whether to tokenize each distinct context only once
+        :param window: the number of sentences kept around each answer instead of its whole context, see answer_window
+        :param stats: an optional dict updated with what sharing the contexts saves: the number of distinct contexts,
+        the context tokenizations and tokens avoided, and the time they would have taken at the measured rate
+        :return: the token ids of each pair
+        """
+        context_texts = [answer_window(a, window) for a in answers]
+        if not share_contexts:
+            return self.tokenizer([a.text for a in answers],
+                                  context_texts,
+                                  max_length=512,
+                                  truncation=True,
+                                  add_special_tokens=True)['input_ids']
+
+        # The answers of a same sentence share their window
+        context_keys = [(a.context.identifier, text) for a, text in zip(answers, context_texts)]
+        unique_contexts = {}
+        for key in context_keys:
+            unique_contexts.setdefault(key, key[1])
+        start = time.perf_counter()
+        context_ids = dict(zip(unique_contexts, self.tokenizer(list(unique_contexts.values()),
+                                                               add_special_tokens=False)['input_ids']))
+        context_seconds = time.perf_counter() - start
+        answer_ids = self.tokenizer([a.text for a in answers], add_special_tokens=False)['input_ids']
+
+        if stats is not None:
+            tokenized = sum(map(len, context_ids.values()))
+            reused = sum(len(context_ids[k]) for k in context_keys) - tokenized
+            stats.update(contexts=len(unique_contexts),
+                         context_tokenizations_saved=len(answers) - len(unique_contexts),
+                         context_tokens_reused=reused,
+                         context_tokenization_seconds=context_seconds,
+                         context_tokenization_seconds_saved=context_seconds * reused / tokenized if tokenized else 0.0)
+
+        return [self.tokenizer.prepare_for_model(ids, context_ids[key],
+                                                 max_length=512,
+                                                 truncation=True,
+                                                 add_special_tokens=True)['input_ids']
+                for ids, key in zip(answer_ids, context_keys)]
+
+    def generate(self, questions: List[Question], max_tokens: int = 4096, max_batch_size: int = 64,
+                 share_contexts: bool = True, window: int = None) -> List[Question]:
+        """
+        Generates a list of questions from pairs of contexts and answers, see generate_with_stats
         :param questions: list of Question objects composed of pairs of context/answer
+        :param max_tokens: the maximal number of encoder tokens of a batch, padding included
+        :param max_batch_size: the maximal number of pairs of context/answer of a batch
+        :param share_contexts: whether to tokenize each distinct context only once
+        :param window: the number of sentences kept around each answer, None for the whole context
         :return: list of Question objects composed of triplets context/answer/question
         """
+        return self.generate_with_stats(questions, max_tokens, max_batch_size, share_contexts, window)[0]
+
+    def generate_with_stats(self, questions: List[Question], max_tokens: int = 4096, max_batch_size: int = 64,
+                            share_contexts: bool = True, window: int = None) -> tuple:
+        """
+        Generates a list of questions from pairs of contexts and answers, along with the statistics of the call: the
+        encoder cost and the padding saved by the token budget batching compared to pairs padded to 512 tokens, and
+        with share_contexts the tokenization saved by encoding each context once (see encode_pairs). The two savings
+        are separate, the encoder still runs on every pair. The statistics are returned rather than stored on the
+        generator, which is shared by the threads of the server and of the streaming pipeline.
+        :param questions: list of Question objects composed of pairs of context/answer
+        :param max_tokens: the maximal number of encoder tokens of a batch, padding included
+        :param max_batch_size: the maximal number of pairs of context/answer of a batch
+        :param share_contexts: whether to tokenize each distinct context only once
+        :param window: the number of sentences kept around each answer, None for the whole context
+        :return: list of Question objects composed of triplets context/answer/question, and the statistics of the call
+        """
         result = []
         all_answers = QuestionContextAnswer(questions=questions).get_all_answers()
+        stats = dict(pairs=len(all_answers))
         if all_answers:
             model = self.model.module if isinstance(self.model, DataParallel) else self.model
-            for batch in yield_batches(all_answers, batch_size=len(questions)):
-                answers = [a.text for a in batch]
-                contexts = [a.context.text for a in batch]
-                source_encoding = self.tokenizer(answers,
-                                                 contexts,
-                                                 max_length=512,
-                                                 padding='max_length',
-                                                 truncation=True,
-                                                 return_attention_mask=True,
-                                                 add_special_tokens=True,
-                                                 return_tensors='pt')
+            # Pairs are tokenized once without padding, then padded to the longest pair of their batch only
+            start = time.perf_counter()
+            input_ids = self.encode_pairs(all_answers, share_contexts=share_contexts, window=window, stats=stats)
+            tokenization_seconds = time.perf_counter() - start
+            generated_questions = [None] * len(all_answers)
+            encoder_tokens = 0
+
+            start = time.perf_counter()
+            for batch in self.token_budget_batches([len(ids) for ids in input_ids], max_tokens, max_batch_size):
+                source_encoding = self.tokenizer.pad({'input_ids': [input_ids[i] for i in batch]},
+                                                     padding='longest',
+                                                     return_attention_mask=True,
+                                                     return_tensors='pt')
                 source_encoding = source_encoding.to(self.device)
+                encoder_tokens += source_encoding['input_ids'].numel()
                 generated_ids = model.generate(input_ids=source_encoding['input_ids'],
                                                attention_mask=source_encoding['attention_mask'],
                                                num_beams=4,
@@ -46,11 +163,21 @@ class MT5Generator(pl.LightningModule):
                                                length_penalty=1.0,
                                                early_stopping=True,
                                                use_cache=True)
-                generated_questions = self.tokenizer.batch_decode(generated_ids,
-                                                                  skip_special_tokens=True,
-                                                                  clean_up_tokenization_spaces=True)
-                generated_items = [Question(text=q, predicted_answers=[batch[i]])
-                                   for i, q in enumerate(generated_questions)]
-                result += generated_items
-
-        return result
+                decoded_questions = self.tokenizer.batch_decode(generated_ids,
+                                                                skip_special_tokens=True,
+                                                                clean_up_tokenization_spaces=True)
+                for i, q in zip(batch, decoded_questions):
+                    generated_questions[i] = q
+
+            # Padding avoided by the token budget batches, the encoder cost estimated as 2 FLOPs per parameter and token
+            padding_saved = 512 * len(all_answers) - encoder_tokens
+            stats.update(tokenization_seconds=tokenization_seconds,
+                         generation_seconds=time.perf_counter() - start,
+                         encoder_tokens=encoder_tokens,
+                         padding_tokens_saved=padding_saved,
+                         padding_flops_saved=2 * self.encoder_parameters * padding_saved)
+
+            # Questions are put back in the order of the answers
+            result = [Question(text=q, predicted_answers=[all_answers[i]]) for i, q in enumerate(generated_questions)]
+
+        return result, stats
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from src.data.data_format import *
+
+
+
+class NERCache:
+
+    def __init__(self, path: str, model_version: str, max_entries: int = 100000):
+        """
+        Disk-backed cache of the entities extracted from contexts, with a least recently used eviction
+        :param path: the path of the SQLite file
+        :param model_version: the version of the NER model, entities of other versions are ignored
+        :param max_entries: the maximal number of contexts kept in the cache
+        """
+        self.path = path
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS entities ("
+                                    "identifier TEXT, text_hash TEXT, model_version TEXT, entities TEXT, "
+                                    "last_access REAL, PRIMARY KEY (identifier, text_hash, model_version))")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS entities_last_access ON entities (last_access)")
+        self.size = self.connection.execute("SELECT COUNT(*) FROM entities").fetchone()[0]
+
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+    def _key(self, context: Context) -> tuple:
+        return str(context.identifier), self.text_hash(context.text), self.model_version
+
+
+    def get_many(self, contexts: List[Context]) -> List[Union[List[tuple], None]]:
+        """
+        :param contexts: list of contexts
+        :return: for each context, its cached entities as (text, type, start_char, end_char), or None on a miss
+        """
+        result = []
+        keys = []
+        with self.lock:
+            for c in contexts:
+                key = self._key(c)
+                row = self.connection.execute("SELECT entities FROM entities WHERE identifier = ? AND text_hash = ? "
+                                              "AND model_version = ?", key).fetchone()
+                if row is None:
+                    self.misses += 1
+                    result.append(None)
+                else:
+                    self.hits += 1
+                    keys.append(key)
+                    result.append([tuple(e) for e in json.loads(row[0])])
+
+            if keys:
+                now = time.time()
+                with self.connection:
+                    self.connection.executemany("UPDATE entities SET last_access = ? WHERE identifier = ? "
+                                                "AND text_hash = ? AND model_version = ?",
+                                                [(now, *key) for key in keys])
+        return result
+
+
+    def put_many(self, contexts: List[Context], entities: List[List[tuple]]) -> None:
+        """
+        Stores the entities of the contexts, then evicts the least recently used ones above max_entries
+        :param contexts: list of contexts
+        :param entities: for each context, its entities as (text, type, start_char, end_char)
+        :return: None
+        """
+        now = time.time()
+        rows = [(*self._key(c), json.dumps(e), now) for c, e in zip(contexts, entities)]
+        with self.lock, self.connection:
+            before = self.connection.total_changes
+            self.connection.executemany("INSERT OR IGNORE INTO entities VALUES (?, ?, ?, ?, ?)", rows)
+            self.size += self.connection.total_changes - before
+
+            if self.size > self.max_entries:
+                self.connection.execute("DELETE FROM entities WHERE rowid IN (SELECT rowid FROM entities "
+                                        "ORDER BY last_access LIMIT ?)", (self.size - self.max_entries,))
+                self.size = self.max_entries
+
+
+    def stats(self) -> Dict[str, float]:
+        """
+        :return: the number of hits and misses since the cache was opened, the hit rate and the number of entries
+        """
+        lookups = self.hits + self.misses
+        return dict(hits=self.hits, misses=self.misses, hit_rate=self.hits / lookups if lookups else 0.0,
+                    size=self.size)
+
+
+    def close(self) -> None:
+        self.connection.close()
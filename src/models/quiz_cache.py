@@ -0,0 +1,101 @@
+import sqlite3
+import threading
+import time
+from src.data.data_format import *
+from src.data.serialization import qca_from_bytes, qca_to_bytes
+from src.data.tracing import tracer
+from src.models.bm25_index import analyze
+
+
+
+def normalize_theme(theme: str) -> str:
+    """
+    Themes with the same BM25 query terms retrieve the same contexts, so they share their quiz
+    :param theme: the theme of a quiz
+    :return: the terms of the theme, as analyzed by the index
+    """
+    return ' '.join(analyze(theme))
+
+
+
+class QuizCache:
+
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600, max_entries: int = 10000):
+        """
+        Disk-backed cache of the filtered questions of a theme, for one version of the index, with a time to live
+        and a least recently used eviction
+        :param path: the path of the SQLite file
+        :param ttl: the number of seconds after which a cached quiz is generated again
+        :param max_entries: the maximal number of themes kept in the cache
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS quizzes ("
+                                    "theme TEXT, index_version TEXT, questions BLOB, created REAL, last_access REAL, "
+                                    "PRIMARY KEY (theme, index_version))")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS quizzes_last_access ON quizzes (last_access)")
+        self.size = self.connection.execute("SELECT COUNT(*) FROM quizzes").fetchone()[0]
+
+
+    def get(self, theme: str, index_version: str) -> Union[QuestionContextAnswer, None]:
+        """
+        :param theme: the theme of the quiz
+        :param index_version: the version of the index the contexts are retrieved from, see BM25Retriever
+        :return: the cached filtered questions of the theme, or None on a miss or when they expired
+        """
+        key = (normalize_theme(theme), index_version)
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute("SELECT questions FROM quizzes WHERE theme = ? AND index_version = ? "
+                                          "AND created > ?", (*key, now - self.ttl)).fetchone()
+            if row is None:
+                self.misses += 1
+                tracer.count('quiz_cache_misses')
+                return None
+            self.hits += 1
+            tracer.count('quiz_cache_hits')
+            with self.connection:
+                self.connection.execute("UPDATE quizzes SET last_access = ? WHERE theme = ? AND index_version = ?",
+                                        (now, *key))
+        return qca_from_bytes(row[0])
+
+
+    def put(self, theme: str, index_version: str, qca: QuestionContextAnswer) -> None:
+        """
+        Stores the filtered questions of a theme, then removes the expired quizzes and evicts the least recently used
+        ones above max_entries
+        :param theme: the theme of the quiz
+        :param index_version: the version of the index the contexts are retrieved from
+        :param qca: the filtered questions
+        :return: None
+        """
+        now = time.time()
+        row = (normalize_theme(theme), index_version, qca_to_bytes(qca), now, now)
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO quizzes VALUES (?, ?, ?, ?, ?)", row)
+            self.connection.execute("DELETE FROM quizzes WHERE created <= ?", (now - self.ttl,))
+            self.size = self.connection.execute("SELECT COUNT(*) FROM quizzes").fetchone()[0]
+
+            if self.size > self.max_entries:
+                self.connection.execute("DELETE FROM quizzes WHERE rowid IN (SELECT rowid FROM quizzes "
+                                        "ORDER BY last_access LIMIT ?)", (self.size - self.max_entries,))
+                self.size = self.max_entries
+
+
+    def stats(self) -> Dict[str, float]:
+        """
+        :return: the number of hits and misses since the cache was opened, the hit rate and the number of entries
+        """
+        lookups = self.hits + self.misses
+        return dict(hits=self.hits, misses=self.misses, hit_rate=self.hits / lookups if lookups else 0.0,
+                    size=self.size)
+
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,69 @@
+from src.data.data_format import *
+from src.models.ner_cache import NERCache
+
+
+
+class StanzaExtractor:
+
+    def __init__(self, stanza_dir: str, use_gpu: bool = False, processors: str = 'tokenize,ner',
+                 batch_size: int = 32, min_words: int = 15, cache: NERCache = None, **kwargs):
+        """
+        Loads the Stanza pipeline once, to extract the named entities of many texts
+        :param stanza_dir: the direction to the English stanza model
+        :param use_gpu: whether to run the pipeline on GPU
+        :param processors: the Stanza processors, the named entities only need the tokenizer
+        :param batch_size: the number of texts processed together by the pipeline
+        :param min_words: texts with at most this number of words have no entities
+        :param cache: an optional cache of the entities of the contexts already processed
+        :param kwargs: the other arguments of the Stanza pipeline
+        """
+        import stanza
+
+        self.batch_size = batch_size
+        self.min_words = min_words
+        self.cache = cache
+        self.model_version = f'stanza-{stanza.__version__}-{processors}-{min_words}'
+        kwargs.setdefault('tokenize_batch_size', batch_size)
+        kwargs.setdefault('ner_batch_size', batch_size)
+        self.nlp = stanza.Pipeline("en", processors=processors, use_gpu=use_gpu, dir=stanza_dir, **kwargs)
+
+
+    def extract_entities(self, texts: List[str]) -> List[List[tuple]]:
+        """
+        Runs the texts through the bulk API of the pipeline, batch by batch
+        :param texts: list of texts
+        :return: for each text, the list of its entities as (text, type, start_char, end_char)
+        """
+        import stanza
+
+        entities = []
+        for i in range(0, len(texts), self.batch_size):
+            docs = self.nlp.bulk_process([stanza.Document([], text=t) for t in texts[i: i + self.batch_size]])
+            for doc in docs:
+                if doc.num_words > self.min_words:
+                    entities.append([(ent.text, ent.label_ if hasattr(ent, 'label_') else ent.type,
+                                      ent.start_char, ent.end_char) for ent in doc.ents])
+                else:
+                    entities.append([])
+        return entities
+
+
+    def extract_context_entities(self, contexts: List[Context]) -> List[List[tuple]]:
+        """
+        Same as extract_entities on the texts of the contexts, only running the pipeline on the contexts missing
+        from the cache
+        :param contexts: list of contexts
+        :return: for each context, the list of its entities as (text, type, start_char, end_char)
+        """
+        if self.cache is None:
+            return self.extract_entities([c.text for c in contexts])
+
+        entities = self.cache.get_many(contexts)
+        missing = [i for i, e in enumerate(entities) if e is None]
+        if missing:
+            missing_contexts = [contexts[i] for i in missing]
+            missing_entities = self.extract_entities([c.text for c in missing_contexts])
+            self.cache.put_many(missing_contexts, missing_entities)
+            for i, e in zip(missing, missing_entities):
+                entities[i] = e
+        return entities
@@ -1,46 +1,67 @@
 from src.data.utils import *
 from src.data.data_format import *
-import stanza
+from src.data.tracing import tracer
+from src.models.stanza_extractor import StanzaExtractor
+from src.models.entity_index import EntityIndex
+from src.models.model_registry import get_stanza_extractor
 
 
-def extract_answers_from_contexts(qca: QuestionContextAnswer, stanza_dir: str) -> QuestionContextAnswer:
+def extract_answers_from_contexts(qca: QuestionContextAnswer, stanza_dir: str,
+                                  extractor: StanzaExtractor = None,
+                                  entity_index: EntityIndex = None, ner_cache: bool = True) -> QuestionContextAnswer:
     """
     Extract from each context, potential answers thanks to Name Entity Recognition
     :param qca: a QuestionContextAnswer object filled with Context objects only
     :param stanza_dir: the direction to the English stanza model
+    :param extractor: a StanzaExtractor, the one of stanza_dir in the model registry otherwise
+    :param entity_index: optional entities precomputed offline, the NER model only runs on the other contexts
+    :param ner_cache: whether the NER cache of the extractor is read and filled, see set_ner_cache_path
     :return: a QuestionContextAnswer object filled with Answer and Context objects
     """
 
     questions = qca.questions
-    nlp = stanza.Pipeline("en", processors='tokenize,ner,pos', use_gpu=True, dir=stanza_dir)
-    print('..... Start extracting answers from contexts')
+    contexts = [c for q in questions for c in q.retrieved_contexts if c.text]
 
-    for q in tqdm(questions):
+    with tracer.span('answer_extraction', items_in=len(questions), contexts=len(contexts)) as span:
+        entities = entity_index.get_many(contexts) if entity_index is not None else [None] * len(contexts)
+        missing = [i for i, e in enumerate(entities) if e is None]
+        if missing:
+            extractor = extractor or get_stanza_extractor(stanza_dir)
+            with tracer.span('ner', batch_size=len(missing)):
+                if ner_cache:
+                    missing_entities = extractor.extract_context_entities([contexts[i] for i in missing])
+                else:
+                    missing_entities = extractor.extract_entities([contexts[i].text for i in missing])
+            for i, e in zip(missing, missing_entities):
+                entities[i] = e
+            if ner_cache and extractor.cache is not None:
+                tracer.gauge('ner_cache_hit_rate', extractor.cache.stats()['hit_rate'])
+        tracer.count('precomputed_entities_contexts', len(contexts) - len(missing))
+        tracer.count('ner_contexts', len(missing))
+        entities_by_context = {id(c): e for c, e in zip(contexts, entities)}
+        new_qca = _attach_answers(questions, entities_by_context)
+        span.set(items_out=len(new_qca))
+    return new_qca
+
+
+def _attach_answers(questions: List[Question], entities_by_context: Dict[int, List[tuple]]) -> QuestionContextAnswer:
+    for q in questions:
         q.predicted_answers = q.predicted_answers or []
-        existing_answers = []
+        existing_answers = set()
         for c in q.retrieved_contexts:
-            if c.text:
-                doc = nlp(c.text)
-                num_words = doc.num_words
-                if num_words > 15:
-                    for ent in doc.ents:
-                        ent_text = ent.text
-                        ent_type = ent.label_ if hasattr(ent, 'label_') else ent.type
-                        if ent.text not in existing_answers:
-                            existing_answers.append(ent.text)
-                            answer_item = Answer(text=ent_text,
-                                                 context=c,
-                                                 meta={'ent_type': ent_type},
-                                                 start_char_position=ent.start_char,
-                                                 end_char_position=ent.end_char)
-                            q.predicted_answers.append(answer_item)
-
-    print('...... Filtering out questions without predicted answers')
+            for ent_text, ent_type, start_char, end_char in entities_by_context.get(id(c), []):
+                if ent_text not in existing_answers:
+                    existing_answers.add(ent_text)
+                    answer_item = Answer(text=ent_text,
+                                         context=c,
+                                         meta={'ent_type': ent_type},
+                                         start_char_position=start_char,
+                                         end_char_position=end_char)
+                    q.predicted_answers.append(answer_item)
+
     new_questions = []
     for q in questions:
         if q.predicted_answers and len(q.predicted_answers) > 0:
             new_questions.append(q)
 
-    new_qca = QuestionContextAnswer(questions=new_questions)
-    print(f'Finished extracting answers from contexts! (Number of questions: {len(questions)})')
-    return new_qca
+    return QuestionContextAnswer(questions=new_questions)
@@ -0,0 +1,127 @@
+from math import ceil
+from src.data.data_format import *
+from src.data.tracing import tracer
+from src.scripts.question_generation import generate_questions
+from src.scripts.roundtrip_filter import normalize, roundtrip_filter
+
+
+# How good a quiz answer each kind of entity makes (Stanza OntoNotes types), the other types get DEFAULT_TYPE_WEIGHT.
+# Numbers and quantities rarely make questions that the roundtrip filter keeps.
+ENTITY_TYPE_WEIGHTS = {'PERSON': 1.0, 'ORG': 0.9, 'GPE': 0.9, 'LOC': 0.8, 'EVENT': 0.8, 'WORK_OF_ART': 0.8,
+                       'FAC': 0.7, 'NORP': 0.7, 'PRODUCT': 0.6, 'LAW': 0.6, 'LANGUAGE': 0.6, 'DATE': 0.5,
+                       'TIME': 0.3, 'MONEY': 0.3, 'QUANTITY': 0.2, 'PERCENT': 0.2, 'CARDINAL': 0.1, 'ORDINAL': 0.1}
+
+DEFAULT_TYPE_WEIGHT = 0.5
+
+# Weights of the entity type, of the retrieval score of the context and of the length of the span in the score
+SCORE_WEIGHTS = dict(entity_type=0.5, context=0.3, length=0.2)
+
+
+def span_length_score(text: str, best_words: int = 3) -> float:
+    """
+    :param text: the text of an answer
+    :param best_words: the number of words up to which an answer is not penalised
+    :return: 1 for answers of 1 to best_words words, decreasing with each additional word, 0 for one-letter answers
+    """
+    n_words = len(text.split())
+    if len(text.strip()) < 2:
+        return 0.0
+    return max(0.0, 1.0 - 0.25 * max(0, n_words - best_words))
+
+
+def score_answers(answers: List[Answer], weights: Dict[str, float] = SCORE_WEIGHTS) -> List[float]:
+    """
+    :param answers: the candidate answers of a quiz, as extracted by extract_answers_from_contexts
+    :param weights: the weights of the entity type, of the context score and of the span length
+    :return: the score of each answer, between 0 and 1. The retrieval scores of the contexts are divided by the best
+    one of the quiz, contexts without score count as the worst one.
+    """
+    context_scores = [max([s for s in (a.context.scores or {}).values() if s is not None], default=0.0)
+                      if a.context is not None else 0.0 for a in answers]
+    best_context_score = max(context_scores, default=0.0) or 1.0
+
+    scores = []
+    for a, context_score in zip(answers, context_scores):
+        entity_type = (a.meta or {}).get('ent_type')
+        scores.append(weights['entity_type'] * ENTITY_TYPE_WEIGHTS.get(entity_type, DEFAULT_TYPE_WEIGHT)
+                      + weights['context'] * context_score / best_context_score
+                      + weights['length'] * span_length_score(a.text))
+    return scores
+
+
+def rank_answers(answers: List[Answer], context_decay: float = 0.7,
+                 weights: Dict[str, float] = SCORE_WEIGHTS) -> List[Answer]:
+    """
+    Orders the candidate answers from the most to the least promising. For diversity, the k-th best answer of a
+    context has its score multiplied by context_decay ** k, so that the first answers come from different contexts,
+    and only the best occurrence of an answer text is kept.
+    :param answers: the candidate answers of a quiz
+    :param context_decay: the factor applied to the score for each better answer of the same context
+    :param weights: the weights of the entity type, of the context score and of the span length
+    :return: the distinct answers, best first
+    """
+    by_context = {}
+    for a, score in zip(answers, score_answers(answers, weights)):
+        by_context.setdefault(id(a.context), []).append((score, a))
+
+    ranked = []
+    for candidates in by_context.values():
+        candidates.sort(key=lambda candidate: -candidate[0])
+        ranked += [(score * context_decay ** k, a) for k, (score, a) in enumerate(candidates)]
+    ranked.sort(key=lambda candidate: -candidate[0])
+
+    seen = set()
+    distinct = []
+    for _, a in ranked:
+        key = normalize(a.text)
+        if key not in seen:
+            seen.add(key)
+            distinct.append(a)
+    return distinct
+
+
+def generate_in_rounds(qca: QuestionContextAnswer, n_questions: int, generator_path: str, qa_path: str,
+                       threshold: int = 6, first_round: int = None, min_pass_rate: float = 0.1,
+                       max_answers: int = None, generation_batch_size: int = 64) -> QuestionContextAnswer:
+    """
+    Generates questions for the best candidate answers first, in rounds, until n_questions questions passed the
+    roundtrip filter or the candidates run out. The size of a round is the number of missing questions divided by
+    the pass rate of the filter observed so far, so that few answers are generated for nothing.
+    :param qca: a QuestionContextAnswer object filled with Answer and Context objects
+    :param n_questions: the number of filtered questions wanted
+    :param generator_path: the path of the question generation model
+    :param qa_path: the path of the question answering model of the roundtrip filter
+    :param threshold: the threshold of the roundtrip filter
+    :param first_round: the number of answers of the first round, 2 * n_questions by default
+    :param min_pass_rate: the lowest pass rate used to size a round
+    :param max_answers: the maximal number of answers generated for the quiz, all of them by default
+    :param generation_batch_size: the maximal number of answers of a question generation batch
+    :return: a QuestionContextAnswer object with the questions that passed the filter, all the ones of the last round
+    included
+    """
+    answers = qca.get_all_answers()
+    with tracer.span('answer_selection', items_in=len(answers)) as span:
+        ranked = rank_answers(answers)
+        if max_answers is not None:
+            ranked = ranked[:max_answers]
+
+        filtered_questions = []
+        position = 0
+        size = first_round or 2 * n_questions
+        while len(filtered_questions) < n_questions and position < len(ranked):
+            round_answers = ranked[position: position + size]
+            position += len(round_answers)
+
+            round_qca = QuestionContextAnswer(questions=[Question(retrieved_contexts=[a.context],
+                                                                  predicted_answers=[a]) for a in round_answers])
+            round_qca = generate_questions(round_qca, model_path=generator_path,
+                                           max_batch_size=generation_batch_size)
+            filtered_questions += roundtrip_filter(round_qca, model_path=qa_path, threshold=threshold).questions
+
+            pass_rate = max(len(filtered_questions) / position, min_pass_rate)
+            size = ceil((n_questions - len(filtered_questions)) / pass_rate)
+
+        span.set(items_out=len(filtered_questions), generated_answers=position)
+    tracer.count('generated_answers', position)
+    tracer.count('skipped_answers', len(answers) - position)
+    return QuestionContextAnswer(questions=filtered_questions)
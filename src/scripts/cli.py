@@ -0,0 +1,92 @@
+import argparse
+import runpy
+import sys
+
+
+# Commands run by the main block of another module, which is only imported when its command is called, so that
+# `quiz-generator --help` or `quiz-generator serve` do not load the models of the other commands
+MODULE_COMMANDS = {
+    'serve': ('src.scripts.quiz_server', 'serves quizzes over HTTP'),
+    'warmup': ('src.scripts.quiz_cache_warmup', 'precomputes the quizzes of popular themes'),
+    'index-entities': ('src.scripts.entity_indexing', 'extracts the entities of the paragraphs of a BM25 index'),
+    'benchmark': ('src.benchmarks.suite', 'runs the benchmark suite'),
+    'compare': ('src.benchmarks.compare', 'compares two benchmark result files'),
+}
+
+
+def run_quiz(arguments: argparse.Namespace) -> None:
+    from src.models.model_registry import set_ner_cache_path
+    from src.scripts.quiz_generator import quiz_generator
+
+    set_ner_cache_path(None if arguments.no_ner_cache else arguments.ner_cache_path)
+
+    cache = None
+    if arguments.cache_path:
+        from src.models.quiz_cache import QuizCache
+        cache = QuizCache(arguments.cache_path)
+    entity_index = None
+    if arguments.entities_path:
+        from src.models.entity_index import EntityIndex
+        entity_index = EntityIndex(arguments.entities_path)
+    try:
+        quiz_generator(arguments.theme, mode=arguments.mode, cache=cache, entity_index=entity_index)
+    finally:
+        if cache is not None:
+            cache.close()
+        if entity_index is not None:
+            entity_index.close()
+
+
+def run_index(arguments: argparse.Namespace) -> None:
+    from src.scripts.wikipedia_indexing import fill_default_args, run_local_indexing
+
+    args = fill_default_args()
+    args.update(directory=arguments.directory, index_path=arguments.index_path)
+    if arguments.num_workers:
+        args['num_workers'] = arguments.num_workers
+    run_local_indexing(args)
+
+
+def main(argv: list = None) -> None:
+    """
+    Entry point of the quiz-generator command, dispatching to the scripts of the repository
+    :param argv: the arguments of the command, sys.argv[1:] by default
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in MODULE_COMMANDS:
+        module, _ = MODULE_COMMANDS[argv[0]]
+        sys.argv = [f'quiz-generator {argv[0]}'] + argv[1:]
+        runpy.run_module(module, run_name='__main__', alter_sys=True)
+        return
+
+    parser = argparse.ArgumentParser(prog='quiz-generator', description='Generates quizzes about a theme')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    quiz_parser = commands.add_parser('quiz', help='prints a quiz of 10 questions about a theme')
+    quiz_parser.add_argument('theme')
+    quiz_parser.add_argument('--mode', default='scheduled', choices=('scheduled', 'streaming', 'stage_by_stage'),
+                             help='how the questions are generated, see generate_quiz_questions')
+    quiz_parser.add_argument('--no-streaming', dest='mode', action='store_const', const='stage_by_stage',
+                             help='same as --mode stage_by_stage')
+    quiz_parser.add_argument('--cache-path', default=None, help='SQLite file of the quiz cache, no cache otherwise')
+    quiz_parser.add_argument('--ner-cache-path', default='./data/ner_cache.sqlite')
+    quiz_parser.add_argument('--no-ner-cache', action='store_true', help='runs Stanza on every context')
+    quiz_parser.add_argument('--entities-path', default=None,
+                             help='entity file written by index-entities, Stanza runs on every context otherwise')
+    quiz_parser.set_defaults(function=run_quiz)
+
+    index_parser = commands.add_parser('index', help='builds the local BM25 index of a Wikipedia dump')
+    index_parser.add_argument('--directory', default='./data/wikipedia')
+    index_parser.add_argument('--index-path', default='./data/wikipedia_english.bm25')
+    index_parser.add_argument('--num-workers', type=int, default=None)
+    index_parser.set_defaults(function=run_index)
+
+    for name, (_, description) in MODULE_COMMANDS.items():
+        commands.add_parser(name, help=description, add_help=False)
+
+    arguments = parser.parse_args(argv)
+    arguments.function(arguments)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count, listdir, makedirs, remove, replace
+from os.path import exists, join
+import argparse
+import json
+import logging
+import pickle
+
+from src.models.bm25_index import BM25Index
+from src.models.entity_index import bm25_index_fingerprint, text_checksum, write_entity_index
+from src.models.stanza_extractor import StanzaExtractor
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+def entity_index_path(index_path: str) -> str:
+    """
+    :param index_path: the path of a BM25 index file
+    :return: the path of the file of the entities of its paragraphs
+    """
+    return index_path + '.entities'
+
+
+# Version of the content of the chunk files, recorded in the manifest of the parts directory
+CHUNK_FORMAT = 2
+
+
+def chunk_path(parts_dir: str, chunk: int) -> str:
+    return join(parts_dir, f'chunk-{chunk:06d}.pkl')
+
+
+def check_parts_dir(index_path: str, chunk_size: int, reset: bool = False) -> str:
+    """
+    Checks that the chunks of the parts directory were computed on the current BM25 index with the same chunk size
+    and chunk format, which are recorded in its manifest.json, so that a rebuilt index or a new chunk size never
+    reuses stale chunks
+    :param index_path: the path of the BM25 index file
+    :param chunk_size: the number of paragraphs of a chunk
+    :param reset: whether stale chunks are deleted, a RuntimeError is raised otherwise
+    :return: the path of the parts directory
+    """
+    parts_dir = entity_index_path(index_path) + '.parts'
+    makedirs(parts_dir, exist_ok=True)
+    manifest = dict(fingerprint=bm25_index_fingerprint(index_path), chunk_size=chunk_size, chunk_format=CHUNK_FORMAT)
+    manifest_path = join(parts_dir, 'manifest.json')
+
+    if exists(manifest_path):
+        with open(manifest_path) as f:
+            if json.load(f) == manifest:
+                return parts_dir
+        if not reset:
+            raise RuntimeError(f'The chunks of {parts_dir} were computed on another version of {index_path} or with '
+                               f'another chunk size, run without --shard or --merge to recompute them')
+        logger.warning(f'Deleting the stale chunks of {parts_dir}')
+    elif not reset and any(name.startswith('chunk-') for name in listdir(parts_dir)):
+        raise RuntimeError(f'The chunks of {parts_dir} have no manifest, '
+                           f'run without --shard or --merge to recompute them')
+
+    for name in listdir(parts_dir):
+        if name.startswith('chunk-'):
+            remove(join(parts_dir, name))
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    replace(manifest_path + '.tmp', manifest_path)
+    return parts_dir
+
+
+def index_shard(index_path: str, stanza_dir: str, shard: int, num_shards: int, chunk_size: int = 1000,
+                **extractor_kwargs) -> int:
+    """
+    Extracts the entities of the chunks of paragraphs of one shard (chunks shard, shard + num_shards, ...).
+    Each chunk is written in its own file once it is complete, so an interrupted job resumes at the first missing
+    chunk.
+    :param index_path: the path of the BM25 index file
+    :param stanza_dir: the direction to the English stanza model
+    :param shard: the number of the shard, from 0 to num_shards - 1
+    :param num_shards: the number of shards
+    :param chunk_size: the number of paragraphs of a chunk
+    :param extractor_kwargs: the other arguments of the StanzaExtractor
+    :return: the number of chunks processed
+    """
+
+    import torch
+    torch.set_num_threads(max(1, (cpu_count() or 1) // num_shards))
+
+    parts_dir = check_parts_dir(index_path, chunk_size)
+    extractor = None
+    processed = 0
+
+    with BM25Index.open(index_path) as index:
+        n_chunks = (len(index) + chunk_size - 1) // chunk_size
+        for chunk in range(shard, n_chunks, num_shards):
+            path = chunk_path(parts_dir, chunk)
+            if exists(path):
+                continue
+
+            extractor = extractor or StanzaExtractor(stanza_dir, **extractor_kwargs)
+            docs = range(chunk * chunk_size, min((chunk + 1) * chunk_size, len(index)))
+            texts = [index.text(d) for d in docs]
+            entities = extractor.extract_entities(texts)
+
+            part = dict(counts=array('I', [len(e) for e in entities]),
+                        starts=array('I', [e[2] for doc_entities in entities for e in doc_entities]),
+                        ends=array('I', [e[3] for doc_entities in entities for e in doc_entities]),
+                        types=[e[1] for doc_entities in entities for e in doc_entities],
+                        text_checksums=array('I', [text_checksum(t) for t in texts]))
+            with open(path + '.tmp', 'wb') as f:
+                pickle.dump(part, f)
+            replace(path + '.tmp', path)
+
+            processed += 1
+            logger.info(f'Shard {shard}: chunk {chunk + 1}/{n_chunks} done')
+
+    return processed
+
+
+def merge_shards(index_path: str, chunk_size: int = 1000) -> str:
+    """
+    Merges the chunks written by index_shard into the columnar entity file of the index
+    :param index_path: the path of the BM25 index file
+    :param chunk_size: the number of paragraphs of a chunk
+    :return: the path of the entity file
+    """
+
+    parts_dir = check_parts_dir(index_path, chunk_size)
+    with BM25Index.open(index_path) as index:
+        n_documents = len(index)
+        identifiers = [index.identifier(d) for d in range(n_documents)]
+    n_chunks = (n_documents + chunk_size - 1) // chunk_size
+    missing = [chunk for chunk in range(n_chunks) if not exists(chunk_path(parts_dir, chunk))]
+    if missing:
+        raise RuntimeError(f'{len(missing)} chunks of {n_chunks} are missing in {parts_dir}, run the shards first')
+
+    doc_offsets = array('Q', [0])
+    starts = array('I')
+    ends = array('I')
+    type_ids = array('B')
+    type_names = {}
+    text_checksums = array('I')
+
+    for chunk in range(n_chunks):
+        with open(chunk_path(parts_dir, chunk), 'rb') as f:
+            part = pickle.load(f)
+        for count in part['counts']:
+            doc_offsets.append(doc_offsets[-1] + count)
+        starts.extend(part['starts'])
+        ends.extend(part['ends'])
+        type_ids.extend(type_names.setdefault(t, len(type_names)) for t in part['types'])
+        text_checksums.extend(part['text_checksums'])
+
+    path = entity_index_path(index_path)
+    write_entity_index(path, doc_offsets, starts, ends, type_ids, sorted(type_names, key=type_names.get),
+                       identifiers, text_checksums, bm25_index_fingerprint(index_path))
+    logger.info(f'{len(starts)} entities of {n_documents} paragraphs written into {path}')
+    return path
+
+
+def run_entity_indexing(index_path: str, stanza_dir: str, num_shards: int = 1, chunk_size: int = 1000,
+                        **extractor_kwargs) -> str:
+    """
+    Precomputes the entities of every paragraph of a BM25 index, with one process per shard
+    :param index_path: the path of the BM25 index file
+    :param stanza_dir: the direction to the English stanza model
+    :param num_shards: the number of processes
+    :param chunk_size: the number of paragraphs of a chunk
+    :param extractor_kwargs: the other arguments of the StanzaExtractor
+    :return: the path of the entity file
+    """
+
+    check_parts_dir(index_path, chunk_size, reset=True)
+    if num_shards == 1:
+        index_shard(index_path, stanza_dir, 0, 1, chunk_size, **extractor_kwargs)
+    else:
+        with ProcessPoolExecutor(max_workers=num_shards) as executor:
+            futures = [executor.submit(index_shard, index_path, stanza_dir, shard, num_shards, chunk_size,
+                                       **extractor_kwargs) for shard in range(num_shards)]
+            for future in futures:
+                future.result()
+
+    return merge_shards(index_path, chunk_size)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precomputes the entities of the paragraphs of a BM25 index')
+    parser.add_argument('--index-path', default='./data/wikipedia_english.bm25')
+    parser.add_argument('--stanza-dir', default='data/stanza')
+    parser.add_argument('--num-shards', type=int, default=1)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--shard', type=int, default=None,
+                        help='only run this shard, to spread the shards over several machines')
+    parser.add_argument('--merge', action='store_true', help='only merge the chunks of the shards')
+    arguments = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if arguments.merge:
+        merge_shards(arguments.index_path, arguments.chunk_size)
+    elif arguments.shard is not None:
+        index_shard(arguments.index_path, arguments.stanza_dir, arguments.shard, arguments.num_shards,
+                    arguments.chunk_size)
+    else:
+        run_entity_indexing(arguments.index_path, arguments.stanza_dir, arguments.num_shards, arguments.chunk_size)
@@ -1,36 +1,48 @@
-from src.models.mt5_generator import MT5Generator
+import warnings
+from src.models.model_registry import get_mt5_generator
 from src.data.data_format import *
 from src.data.utils import *
+from src.data.tracing import tracer
+from src.data.windowing import DEFAULT_WINDOW_SENTENCES
 
 
-def generate_questions(qca: QuestionContextAnswer, batch_size, model_path) -> QuestionContextAnswer:
+def generate_questions(qca: QuestionContextAnswer, batch_size: int = None, model_path: str = None,
+                       backend: str = 'torch', window: int = DEFAULT_WINDOW_SENTENCES, max_tokens: int = 4096,
+                       max_batch_size: int = 64) -> QuestionContextAnswer:
     """
     Returns a QuestionContextAnswer object filled with Question/Context/Answer objects from a QuestionContextAnswer
     object filled with Context/Answer objects (generation of question from context and answers)
     :param qca: a QuestionContextAnswer object
-    :param batch_size: the batch size for the breaking down into batches of the QuestionContextAnswer object
+    :param batch_size: deprecated alias of max_batch_size
     :param model_path: the path of the model
+    :param backend: the inference backend of the generator, see MT5Generator
+    :param window: the number of sentences kept on each side of an answer in the input of the generator, None for the
+    whole context
+    :param max_tokens: the maximal number of encoder tokens of a generation batch, padding included
+    :param max_batch_size: the maximal number of pairs of context/answer of a generation batch
     :return: a QuestionContextAnswer object filled with questions
     """
 
+    if batch_size is not None:
+        warnings.warn('batch_size is deprecated, use max_batch_size', DeprecationWarning, stacklevel=2)
+        max_batch_size = batch_size
+
     device = "cpu"
-    print('Loading...')
-    generator = MT5Generator(model_path=model_path)
-    generator.eval()
-    generator.freeze()
-    generator.to(device)
-    print('Device: ', generator.device)
+    generator = get_mt5_generator(model_path, backend=backend, device=device)
 
-    new_questions = []
-    print('...... Generating questions')
-    for question_batch in yield_batches(qca.questions, batch_size=batch_size):
-        new_questions += generator.generate(question_batch)
+    with tracer.span('question_generation', items_in=len(qca), backend=backend) as span:
+        # All the pairs go through one call, batched by the generator on their token lengths
+        with tracer.span('mt5_generate', batch_size=len(qca.questions)) as generate_span:
+            new_questions, stats = generator.generate_with_stats(qca.questions, max_tokens=max_tokens,
+                                                                 max_batch_size=max_batch_size, window=window)
+            generate_span.set(items_out=stats.get('pairs', 0))
+        tracer.count('padding_flops_saved', stats.get('padding_flops_saved', 0))
+        tracer.count('context_tokens_reused', stats.get('context_tokens_reused', 0))
+        tracer.count('context_tokenization_seconds_saved', stats.get('context_tokenization_seconds_saved', 0.0))
 
-    for q in new_questions:
-        q.retrieved_contexts = q.get_all_contexts()
+        for q in new_questions:
+            q.retrieved_contexts = q.get_all_contexts()
+        span.set(items_out=len(new_questions))
 
     new_qca = QuestionContextAnswer(questions=new_questions, meta=qca.meta)
-    del generator
-
-    print(f'Finished generating questions: (num questions: {len(new_questions)})')
     return new_qca
@@ -0,0 +1,76 @@
+import argparse
+import logging
+
+from src.data.data_format import *
+from src.models.bm25_retriever import BM25Retriever
+from src.models.entity_index import EntityIndex
+from src.models.quiz_cache import QuizCache
+from src.scripts.quiz_generator import generate_quiz_questions
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up_quiz_cache(themes: List[str], retriever: BM25Retriever, cache: QuizCache,
+                       entity_index: EntityIndex = None) -> Dict[str, int]:
+    """
+    Precomputes the quizzes of popular themes: every filtered question of their contexts is generated, without
+    stopping early, so that the quizzes sampled later draw from the whole pool
+    :param themes: the themes to precompute
+    :param retriever: the BM25 retriever of the contexts
+    :param cache: the quiz cache to fill
+    :param entity_index: optional entities precomputed offline by entity_indexing
+    :return: the number of cached questions of each theme
+    """
+    index_version = retriever.index_version()
+    # The contexts of every theme are fetched in one request, generate_quiz_questions then reads them from the
+    # cache of the retriever
+    cached = {theme: cache.get(theme, index_version) for theme in themes}
+    retriever.retrieve_batch([theme for theme, qca in cached.items() if qca is None])
+
+    sizes = {}
+    for theme in themes:
+        qca = cached[theme]
+        if qca is None:
+            qca = generate_quiz_questions(theme, retriever, mode='stage_by_stage', entity_index=entity_index)
+            cache.put(theme, index_version, qca)
+        sizes[theme] = len(qca)
+        logger.info(f'{theme!r}: {sizes[theme]} questions cached')
+    return sizes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precomputes the quizzes of a list of themes into the quiz cache')
+    parser.add_argument('themes', nargs='*', help='the themes, one quiz per theme')
+    parser.add_argument('--themes-file', default=None, help='a file with one theme per line')
+    parser.add_argument('--cache-path', default='./data/quiz_cache.sqlite')
+    parser.add_argument('--ttl', type=float, default=7 * 24 * 3600, help='seconds before a quiz is generated again')
+    parser.add_argument('--backend', default='elasticsearch', choices=['elasticsearch', 'local'])
+    parser.add_argument('--es-host', default='elasticsearch-master')
+    parser.add_argument('--index-path', default='./data/wikipedia_english.bm25')
+    parser.add_argument('--entities-path', default=None,
+                        help='entity file written by entity_indexing, Stanza runs on every context otherwise')
+    arguments = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    hot_themes = list(arguments.themes)
+    if arguments.themes_file:
+        with open(arguments.themes_file, encoding='utf-8') as f:
+            hot_themes += [line.strip() for line in f if line.strip()]
+
+    if arguments.backend == 'local':
+        from src.models.bm25_index import BM25Index
+        client = BM25Index.open(arguments.index_path)
+    else:
+        from src.scripts.wikipedia_indexing import set_es_client
+        client = set_es_client(arguments.es_host)
+
+    quiz_cache = QuizCache(arguments.cache_path, ttl=arguments.ttl)
+    entity_index = EntityIndex(arguments.entities_path) if arguments.entities_path else None
+    try:
+        warm_up_quiz_cache(hot_themes, BM25Retriever(client=client, backend=arguments.backend), quiz_cache,
+                           entity_index)
+        logger.info(f'Quiz cache: {quiz_cache.stats()}')
+    finally:
+        quiz_cache.close()
+        if entity_index is not None:
+            entity_index.close()
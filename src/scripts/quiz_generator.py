@@ -1,27 +1,94 @@
+from functools import lru_cache
 import random
 from src.data.data_format import *
 from src.models.bm25_retriever import BM25Retriever
+from src.models.entity_index import EntityIndex
+from src.models.quiz_cache import QuizCache
 from src.scripts.wikipedia_indexing import set_es_client
 from src.scripts.answer_extraction import extract_answers_from_contexts
+from src.scripts.answer_selection import generate_in_rounds
 from src.scripts.question_generation import generate_questions
 from src.scripts.roundtrip_filter import roundtrip_filter
+from src.scripts.streaming_pipeline import stream_quiz_questions
 
 
-def quiz_generator(theme: str):
+# The ways a quiz is generated from the retrieved contexts, see generate_quiz_questions
+QUIZ_MODES = ('scheduled', 'streaming', 'stage_by_stage')
+
+
+@lru_cache(maxsize=None)
+def default_retriever() -> BM25Retriever:
+    """
+    :return: the retriever of the Elasticsearch index of the DataLab, shared by the quizzes so that they share its cache
+    """
+    return BM25Retriever(client=set_es_client())
+
+
+def generate_quiz_questions(theme: str, retriever: BM25Retriever, mode: str = 'scheduled',
+                            cache: QuizCache = None, stanza_dir: str = 'data/stanza',
+                            generator_path: str = "Narrativa/mT5-base-finetuned-tydiQA-question-generation",
+                            qa_path: str = "csarron/roberta-base-squad-v1",
+                            entity_index: EntityIndex = None) -> QuestionContextAnswer:
+    """
+    Returns the questions about a theme that pass the roundtrip filter, from the cache when they were already generated
+    for the current version of the index
+    :param theme: the theme of the quiz
+    :param retriever: the BM25 retriever of the contexts
+    :param mode: 'scheduled' ranks the candidate answers of all the contexts and generates questions for the best ones
+    first, in rounds, until 10 questions passed the filter (see generate_in_rounds). 'streaming' sends the contexts
+    through the stages in micro-batches, stopping as soon as 10 questions passed the filter. 'stage_by_stage' runs each
+    stage on all the contexts at once and generates a question for every candidate answer.
+    :param cache: an optional cache of the filtered questions of each theme. Only the complete pools, generated stage
+    by stage, are stored: the other modes stop after 10 questions, and a cached pool of 10 questions would serve the
+    same quiz until it expires
+    :param stanza_dir: the direction to the English stanza model
+    :param generator_path: the path of the question generation model
+    :param qa_path: the path of the question answering model of the roundtrip filter
+    :param entity_index: optional entities precomputed offline by entity_indexing, Stanza only runs on the contexts
+    missing from it
+    :return: a QuestionContextAnswer object with the filtered questions
+    """
+    if mode not in QUIZ_MODES:
+        raise ValueError(f'Unknown mode {mode}, expected one of {QUIZ_MODES}')
+
+    index_version = retriever.index_version() if cache is not None else None
+    qca = cache.get(theme, index_version) if cache is not None else None
+    if qca is not None:
+        return qca
+
+    contexts = retriever.retrieve(query=theme)
+
+    if mode == 'scheduled':
+        qca = QuestionContextAnswer(questions=[Question(retrieved_contexts=[context]) for context in contexts])
+        qca = extract_answers_from_contexts(qca, stanza_dir, entity_index=entity_index)
+        qca = generate_in_rounds(qca, n_questions=10, generator_path=generator_path, qa_path=qa_path, threshold=6)
+    elif mode == 'streaming':
+        qca = stream_quiz_questions(contexts, n_questions=10, stanza_dir=stanza_dir, generator_path=generator_path,
+                                    qa_path=qa_path, threshold=6, entity_index=entity_index)
+    else:
+        questions = [Question(retrieved_contexts=[context]) for context in contexts]
+        qca = QuestionContextAnswer(questions=questions)
+
+        qca = extract_answers_from_contexts(qca, stanza_dir, entity_index=entity_index)
+        qca = generate_questions(qca, model_path=generator_path)
+        qca = roundtrip_filter(qca, model_path=qa_path, threshold = 6)
+
+    if cache is not None and mode == 'stage_by_stage':
+        cache.put(theme, index_version, qca)
+    return qca
+
+
+def quiz_generator(theme: str, mode: str = 'scheduled', cache: QuizCache = None, entity_index: EntityIndex = None):
     """
     Generates a quiz composed of 10 questions/answers pairs about a given theme
     :param theme: the theme of the quiz
+    :param mode: how the questions are generated, 'scheduled', 'streaming' or 'stage_by_stage', see
+    generate_quiz_questions
+    :param cache: an optional cache of the filtered questions of each theme, see warm_up_quiz_cache
+    :param entity_index: optional entities precomputed offline by entity_indexing
     """
-    es = set_es_client()
-    bm25 = BM25Retriever(client=es)
-    contexts = bm25.retrieve(query=theme)
-    questions = [Question(retrieved_contexts=[context]) for context in contexts]
-    qca = QuestionContextAnswer(questions=questions)
-
-    qca = extract_answers_from_contexts(qca, 'data/stanza')
-    qca = generate_questions(qca, 12, model_path="Narrativa/mT5-base-finetuned-tydiQA-question-generation")
-    qca = roundtrip_filter(qca, model_path="csarron/roberta-base-squad-v1", threshold = 6)
-    
+    qca = generate_quiz_questions(theme, default_retriever(), mode=mode, cache=cache, entity_index=entity_index)
+
     if len(qca.questions)>10:
         displayed_questions = random.choices(qca.questions, k=10)
     else:
@@ -0,0 +1,357 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+
+from src.data.data_format import *
+from src.data.tracing import JSONLinesSink, PrometheusSink, tracer
+from src.data.windowing import DEFAULT_WINDOW_SENTENCES, question_window
+from src.models.bm25_retriever import BM25Retriever
+from src.models.entity_index import EntityIndex
+from src.models.model_registry import get_mt5_generator, get_qa_pipeline, set_ner_cache_path
+from src.models.quiz_cache import QuizCache
+from src.scripts.answer_extraction import extract_answers_from_contexts
+from src.scripts.roundtrip_filter import answer_questions, best_matching_answer, normalize
+
+logger = logging.getLogger(__name__)
+
+
+
+class DynamicBatcher:
+
+    def __init__(self, function: Callable[[List[Any]], List[Any]], max_batch_size: int = 64, max_wait: float = 0.05,
+                 name: str = 'batch'):
+        """
+        Merges the items submitted by concurrent coroutines into shared calls of function. A batch is run once it
+        holds max_batch_size items or once its first request waited max_wait seconds.
+        :param function: a blocking function returning one result per item, in order, run in a worker thread
+        :param max_batch_size: the number of items above which a batch is run without waiting
+        :param max_wait: the maximal time in seconds a request waits for other requests
+        :param name: the name of the batches in the traces
+        """
+        self.function = function
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.items = 0
+        self._pending = deque()
+        self._size = 0
+        self._arrived = asyncio.Event()
+        self._task = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+
+    async def submit(self, items: List[Any]) -> List[Any]:
+        """
+        :param items: the items of one request
+        :return: the results of function on the items, computed together with the items of other requests
+        """
+        if not items:
+            return []
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((items, future, loop.time()))
+        self._size += len(items)
+        self._arrived.set()
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return await future
+
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            deadline = self._pending[0][2] + self.max_wait
+            while self._size < self.max_batch_size and loop.time() < deadline:
+                self._arrived.clear()
+                try:
+                    await asyncio.wait_for(self._arrived.wait(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    break
+
+            waited = loop.time() - self._pending[0][2]
+            # Whole requests are taken in arrival order, a request larger than max_batch_size is run alone
+            batch = []
+            n_items = 0
+            while self._pending and (not batch or n_items + len(self._pending[0][0]) <= self.max_batch_size):
+                items, future, _ = self._pending.popleft()
+                self._size -= len(items)
+                n_items += len(items)
+                batch.append((items, future))
+
+            start = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self._executor, self.function,
+                                                     [item for items, _ in batch for item in items])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += n_items
+            tracer.record(self.name, time.perf_counter() - start, batch_size=n_items, requests=len(batch),
+                          waited_seconds=waited)
+            position = 0
+            for items, future in batch:
+                if not future.done():
+                    future.set_result(results[position: position + len(items)])
+                position += len(items)
+        self._task = None
+
+
+    def stats(self) -> Dict[str, float]:
+        return dict(batches=self.batches, items=self.items,
+                    mean_batch_size=self.items / self.batches if self.batches else 0.0)
+
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+
+class QuizService:
+
+    def __init__(self, retriever: BM25Retriever, stanza_dir: str = 'data/stanza',
+                 generator_path: str = "Narrativa/mT5-base-finetuned-tydiQA-question-generation",
+                 qa_path: str = "csarron/roberta-base-squad-v1", threshold: int = 6, n_questions: int = 10,
+                 max_batch_size: int = 64, max_wait: float = 0.05, qa_batch_size: int = 16,
+                 cache: QuizCache = None, window: int = DEFAULT_WINDOW_SENTENCES, entity_index: EntityIndex = None):
+        """
+        Generates quizzes for many concurrent themes: the answer extraction, question generation and question
+        answering of concurrent requests are merged into shared batches
+        :param retriever: the BM25 retriever of the contexts
+        :param stanza_dir: the direction to the English stanza model
+        :param generator_path: the path of the question generation model
+        :param qa_path: the path of the question answering model of the roundtrip filter
+        :param threshold: the threshold of the roundtrip filter
+        :param n_questions: the number of questions of a quiz
+        :param max_batch_size: the number of items above which a shared batch is run without waiting
+        :param max_wait: the maximal time in seconds a request waits for other requests
+        :param qa_batch_size: the number of questions per forward pass of the question answering model
+        :param cache: an optional cache of the filtered questions of each theme
+        :param window: the number of sentences kept on each side of an answer in the inputs of the models, None for
+        the whole contexts
+        :param entity_index: optional entities precomputed offline by entity_indexing, Stanza only runs on the
+        contexts missing from it
+        """
+        self.retriever = retriever
+        self.stanza_dir = stanza_dir
+        self.generator_path = generator_path
+        self.qa_path = qa_path
+        self.threshold = threshold
+        self.n_questions = n_questions
+        self.qa_batch_size = qa_batch_size
+        self.cache = cache
+        self.window = window
+        self.entity_index = entity_index
+        self.extraction = DynamicBatcher(self._extract_answers, max_batch_size, max_wait, 'extraction_batch')
+        self.generation = DynamicBatcher(self._generate_questions, max_batch_size, max_wait, 'generation_batch')
+        self.answering = DynamicBatcher(self._answer_questions, max_batch_size, max_wait, 'answering_batch')
+
+
+    def _extract_answers(self, questions: List[Question]) -> List[Question]:
+        # The answers are attached to the questions in place, the ones without answers are dropped by the caller
+        extract_answers_from_contexts(QuestionContextAnswer(questions=questions), self.stanza_dir,
+                                      entity_index=self.entity_index)
+        return questions
+
+
+    def _generate_questions(self, answers: List[Answer]) -> List[Question]:
+        generator = get_mt5_generator(self.generator_path)
+        return generator.generate([Question(predicted_answers=answers)], window=self.window)
+
+
+    def _answer_questions(self, pairs: List[tuple]) -> List[str]:
+        return answer_questions(get_qa_pipeline(self.qa_path), [q for q, _ in pairs], [c for _, c in pairs],
+                                self.qa_batch_size)
+
+
+    async def generate(self, theme: str) -> QuestionContextAnswer:
+        """
+        :param theme: the theme of the quiz
+        :return: every question about the theme that passed the roundtrip filter
+        """
+        loop = asyncio.get_running_loop()
+        if self.cache is not None:
+            index_version = await loop.run_in_executor(None, self.retriever.index_version)
+            qca = self.cache.get(theme, index_version)
+            if qca is not None:
+                return qca
+
+        contexts = await loop.run_in_executor(None, self.retriever.retrieve, theme)
+
+        questions = await self.extraction.submit([Question(retrieved_contexts=[c]) for c in contexts])
+        answers = [a for q in questions if q.predicted_answers for a in q.predicted_answers]
+
+        questions = await self.generation.submit(answers)
+        for q in questions:
+            q.retrieved_contexts = q.get_all_contexts()
+
+        pairs = [(q.text, question_window(q, self.window)) for q in questions]
+        bert_answers = await self.answering.submit(pairs)
+
+        filtered_questions = []
+        for q, bert_answer in zip(questions, bert_answers):
+            best, _ = best_matching_answer([normalize(a.text) for a in q.predicted_answers], normalize(bert_answer),
+                                           self.threshold)
+            if best is not None:
+                q.predicted_answers = [q.predicted_answers[best]]
+                filtered_questions.append(q)
+        qca = QuestionContextAnswer(questions=filtered_questions)
+
+        if self.cache is not None:
+            self.cache.put(theme, index_version, qca)
+        return qca
+
+
+    async def quiz(self, theme: str) -> Dict[str, Any]:
+        """
+        :param theme: the theme of the quiz
+        :return: the quiz as a JSON-serializable dictionary of n_questions questions at most
+        """
+        qca = await self.generate(theme)
+        return quiz_to_dict(theme, random.sample(qca.questions, min(self.n_questions, len(qca.questions))))
+
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        stats = dict(extraction=self.extraction.stats(), generation=self.generation.stats(),
+                     answering=self.answering.stats())
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+        return stats
+
+
+    def close(self) -> None:
+        for batcher in (self.extraction, self.generation, self.answering):
+            batcher.close()
+
+
+
+def quiz_to_dict(theme: str, questions: List[Question]) -> Dict[str, Any]:
+    """
+    :param theme: the theme of the quiz
+    :param questions: the questions of the quiz, with their answer
+    :return: the quiz as a JSON-serializable dictionary
+    """
+    items = []
+    for q in questions:
+        answer = q.predicted_answers[0]
+        context = answer.context
+        items.append(dict(question=q.text,
+                          answer=answer.text,
+                          context=context.text if context else None,
+                          title=context.title if context else None,
+                          context_id=context.identifier if context else None))
+    return dict(theme=theme, questions=items)
+
+
+
+async def handle_request(service: QuizService, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                         metrics: PrometheusSink = None) -> None:
+    """
+    Minimal HTTP/1.1 handler: GET /quiz?theme=... returns a quiz, GET /stats the batch sizes of the service and
+    GET /metrics the metrics of the stages in the Prometheus text format, when a metrics sink is given
+    """
+    try:
+        request_line = (await reader.readline()).decode('latin-1').split()
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+
+        status, body = 404, {'error': 'not found'}
+        if len(request_line) >= 2 and request_line[0] == 'GET':
+            url = urlsplit(request_line[1])
+            theme = parse_qs(url.query).get('theme', [''])[0].strip()
+            if url.path == '/quiz' and theme:
+                try:
+                    status, body = 200, await service.quiz(theme)
+                except Exception as e:
+                    logger.exception(f'Quiz generation failed for {theme!r}')
+                    status, body = 500, {'error': str(e)}
+            elif url.path == '/quiz':
+                status, body = 400, {'error': 'missing theme'}
+            elif url.path == '/stats':
+                status, body = 200, service.stats()
+            elif url.path == '/metrics' and metrics is not None:
+                status, body = 200, metrics.render()
+
+        if isinstance(body, str):
+            payload, content_type = body.encode('utf-8'), 'text/plain; version=0.0.4'
+        else:
+            payload, content_type = json.dumps(body).encode('utf-8'), 'application/json'
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}[status]
+        writer.write(f'HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\n'
+                     f'Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n'.encode('latin-1') + payload)
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+
+async def serve(service: QuizService, host: str = '127.0.0.1', port: int = 8000,
+                metrics: PrometheusSink = None) -> None:
+    server = await asyncio.start_server(lambda r, w: handle_request(service, r, w, metrics), host, port)
+    logger.info(f'Serving quizzes on http://{host}:{port}/quiz?theme=...')
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serves quizzes over HTTP, batching the models across requests')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--backend', default='elasticsearch', choices=['elasticsearch', 'local'])
+    parser.add_argument('--es-host', default='elasticsearch-master')
+    parser.add_argument('--index-path', default='./data/wikipedia_english.bm25')
+    parser.add_argument('--stanza-dir', default='data/stanza')
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait', type=float, default=0.05, help='seconds a request waits for other requests')
+    parser.add_argument('--cache-path', default=None, help='SQLite file of the quiz cache, no cache otherwise')
+    parser.add_argument('--ner-cache-path', default='./data/ner_cache.sqlite')
+    parser.add_argument('--no-ner-cache', action='store_true', help='runs Stanza on every context')
+    parser.add_argument('--entities-path', default=None,
+                        help='entity file written by entity_indexing, Stanza runs on every context otherwise')
+    parser.add_argument('--full-context', action='store_true',
+                        help='feeds the whole contexts to the models instead of the sentences around the answers')
+    parser.add_argument('--trace-path', default=None, help='JSON lines file of the spans and metrics of the stages')
+    parser.add_argument('--no-metrics', action='store_true', help='disables the /metrics endpoint and the tracing')
+    arguments = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    set_ner_cache_path(None if arguments.no_ner_cache else arguments.ner_cache_path)
+    prometheus_sink = None if arguments.no_metrics else PrometheusSink()
+    if prometheus_sink is not None:
+        tracer.add_sink(prometheus_sink)
+    if arguments.trace_path:
+        tracer.add_sink(JSONLinesSink(arguments.trace_path))
+
+    if arguments.backend == 'local':
+        from src.models.bm25_index import BM25Index
+        client = BM25Index.open(arguments.index_path)
+    else:
+        from src.scripts.wikipedia_indexing import set_es_client
+        client = set_es_client(arguments.es_host)
+
+    quiz_cache = QuizCache(arguments.cache_path) if arguments.cache_path else None
+    entity_index = EntityIndex(arguments.entities_path) if arguments.entities_path else None
+    quiz_service = QuizService(BM25Retriever(client=client, backend=arguments.backend),
+                               stanza_dir=arguments.stanza_dir, max_batch_size=arguments.max_batch_size,
+                               max_wait=arguments.max_wait, cache=quiz_cache,
+                               window=None if arguments.full_context else DEFAULT_WINDOW_SENTENCES,
+                               entity_index=entity_index)
+    try:
+        asyncio.run(serve(quiz_service, arguments.host, arguments.port, prometheus_sink))
+    finally:
+        quiz_service.close()
+        if quiz_cache is not None:
+            quiz_cache.close()
+        if entity_index is not None:
+            entity_index.close()
@@ -1,10 +1,18 @@
-from strsimpy.levenshtein import Levenshtein
-from tqdm import tqdm
-from transformers import pipeline
-from math import inf
 import re
 
 from src.data.data_format import *
+from src.data.tracing import tracer
+from src.data.windowing import DEFAULT_WINDOW_SENTENCES, question_window
+from src.models.model_registry import get_qa_pipeline
+
+try:
+    from rapidfuzz import process
+    from rapidfuzz.distance import Levenshtein
+except ImportError:
+    process = None
+
+
+EXPRESSION_PUNCTUATION = re.compile(r'[^\w\d\s]')
 
 
 
@@ -17,22 +25,117 @@ def normalize(s: str) -> str:
     Returns:
         str: normalized string
     """
-    expression_punctuation = re.compile('[^\w\d\s]')
-        
-    def remove_punctuation(s: str) -> str:
-        
-        return re.sub(expression_punctuation, '', s)
     
-    return remove_punctuation(s.lower())
+    return EXPRESSION_PUNCTUATION.sub('', s.lower())
 
 
 
-def roundtrip_filter(qca: QuestionContextAnswer, model_path : str, threshold: int = 5) -> QuestionContextAnswer:
+def bounded_levenshtein(a: str, b: str, max_distance: int) -> int:
+    """
+
+    Args:
+        a (str): first string
+        b (str): second string
+        max_distance (int): largest distance worth computing
+
+    Returns:
+        int: the Levenshtein distance between a and b if it is at most max_distance, max_distance + 1 otherwise.
+        The computation stops as soon as a whole row of the dynamic programming table exceeds max_distance.
+    """
+    
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    if len(a) < len(b):
+        a, b = b, a
+    
+    previous_row = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        row = [i]
+        for j, char_b in enumerate(b, 1):
+            row.append(min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + (char_a != char_b)))
+        if min(row) > max_distance:
+            return max_distance + 1
+        previous_row = row
+    
+    return min(previous_row[-1], max_distance + 1)
+
+
+
+def best_matching_answer(candidates: List[str], reference: str, threshold: int) -> tuple:
+    """
+
+    Args:
+        candidates (List[str]): normalized candidate answers
+        reference (str): normalized answer of the question answering model
+        threshold (int): candidates at a distance of threshold or more do not match
+
+    Returns:
+        tuple: position of the first candidate closest to the reference in the sense of the Levenshtein distance and
+        its distance, or (None, threshold) when no candidate is closer than threshold.
+        All candidates are scored in one call with rapidfuzz when it is installed.
+    """
+    
+    if not candidates or threshold <= 0:
+        return None, threshold
+    
+    if process is not None:
+        distances = process.cdist([reference], candidates, scorer=Levenshtein.distance,
+                                  score_cutoff=threshold - 1)[0]
+        best = int(distances.argmin())
+        distance = int(distances[best])
+    else:
+        best, distance = None, threshold
+        for i, candidate in enumerate(candidates):
+            candidate_distance = bounded_levenshtein(candidate, reference, distance - 1)
+            if candidate_distance < distance:
+                best, distance = i, candidate_distance
+                if distance == 0:
+                    break
+    
+    return (best, distance) if distance < threshold else (None, threshold)
+
+
+
+def answer_questions(qa_pipeline, questions: List[str], contexts: List[str], batch_size: int = 16) -> List[str]:
+    """
+
+    Args:
+        qa_pipeline: HF question-answering pipeline
+        questions (List[str]): the questions
+        contexts (List[str]): the context of each question
+        batch_size (int, optional): number of questions per forward pass of the model. Defaults to 16.
+
+    Returns:
+        List[str]: the answer predicted for each question. The pairs are sent sorted by context, so that the questions
+        of a same context share a batch and batches are padded to similar lengths.
+    """
+    
+    order = sorted(range(len(questions)), key=lambda i: (len(contexts[i]), contexts[i]))
+    answers = [None] * len(questions)
+    
+    if order:
+        predictions = qa_pipeline(question=[questions[i] for i in order],
+                                  context=[contexts[i] for i in order],
+                                  batch_size=batch_size)
+        if isinstance(predictions, dict):
+            predictions = [predictions]
+        for i, prediction in zip(order, predictions):
+            answers[i] = prediction['answer']
+    
+    return answers
+
+
+
+def roundtrip_filter(qca: QuestionContextAnswer, model_path : str, threshold: int = 5,
+                     batch_size: int = 16, window: int = DEFAULT_WINDOW_SENTENCES) -> QuestionContextAnswer:
     """
 
     Args:
         qca (QuestionContextAnswer): QuestionContextAnswer instance that we want to filter
         model_path: Path of the BERT model fine-tuned for Question Answering
+        batch_size: number of questions answered together by the BERT model, 1 answers them one at a time
+        window (int, optional): number of sentences kept on each side of the answers of a question in the context of
+            the BERT model, None to answer from all its retrieved contexts. Defaults to DEFAULT_WINDOW_SENTENCES.
 
     Returns:
         QuestionContextAnswer: QuestionContextAnswer instance containing only contexts and answers that are 'correct',
@@ -40,35 +143,28 @@ def roundtrip_filter(qca: QuestionContextAnswer, model_path : str, threshold: in
         The following code only returns the best answer to the question
     """
     
-    qa_pipeline = pipeline("question-answering", model=model_path, tokenizer=model_path)
+    qa_pipeline = get_qa_pipeline(model_path)
     
-    levenshtein = Levenshtein()
     new_questions = []
     
-    print('..... Start filtering questions')
-    for q in tqdm(qca.questions):
-        
-        context = ' '.join([context.text for context in q.retrieved_contexts])
-        prediction = qa_pipeline({
-            'context': context,
-            'question': q.text
-        })
-        bert_answer = prediction['answer']
-        
+    with tracer.span('roundtrip_filter', items_in=len(qca), batch_size=batch_size) as span:
+        contexts = [question_window(q, window) for q in qca.questions]
+        with tracer.span('question_answering', batch_size=len(contexts)):
+            bert_answers = answer_questions(qa_pipeline, [q.text for q in qca.questions], contexts, batch_size)
         
-        min_levenshtein_distance = inf
-        
-        for predicted_answer in q.predicted_answers: # we find the best answer in the sens of the Levenshtein distance
-
-            if levenshtein.distance(normalize(predicted_answer.text), normalize(bert_answer)) < min_levenshtein_distance:
-                
-                best_answer = predicted_answer
-                min_levenshtein_distance = levenshtein.distance(normalize(predicted_answer.text), normalize(bert_answer))
-                
-        if min_levenshtein_distance < threshold:
+        for q, bert_answer in zip(qca.questions, bert_answers):
             
-            q.predicted_answers = [best_answer]
-            new_questions.append(q)
+            # we find the best answer in the sens of the Levenshtein distance
+            best, _ = best_matching_answer([normalize(a.text) for a in q.predicted_answers], normalize(bert_answer),
+                                           threshold)
+                    
+            if best is not None:
+                
+                q.predicted_answers = [q.predicted_answers[best]]
+                new_questions.append(q)
+
+        span.set(items_out=len(new_questions))
+        tracer.count('filtered_out_questions', len(qca) - len(new_questions))
 
     new_qca = QuestionContextAnswer(questions = new_questions)
     
@@ -0,0 +1,115 @@
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from typing import Callable
+from src.data.data_format import *
+from src.models.entity_index import EntityIndex
+from src.scripts.answer_extraction import extract_answers_from_contexts
+from src.scripts.question_generation import generate_questions
+from src.scripts.roundtrip_filter import roundtrip_filter
+
+
+_DONE = object()
+
+
+def _put(queue: Queue, item: Any, stop: Event) -> bool:
+    """Puts the item in the queue, unless the pipeline is stopped while waiting for room"""
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Full:
+            continue
+    return False
+
+
+def _get(queue: Queue, stop: Event) -> Any:
+    """Gets an item from the queue, or _DONE if the pipeline is stopped while waiting"""
+    while not stop.is_set():
+        try:
+            return queue.get(timeout=0.1)
+        except Empty:
+            continue
+    return _DONE
+
+
+def _run_stage(function: Callable, inputs: Queue, outputs: Queue, stop: Event, errors: List[Exception]) -> None:
+    """Applies function to every micro-batch of inputs and passes the non empty results on to outputs"""
+    try:
+        while True:
+            qca = _get(inputs, stop)
+            if qca is _DONE:
+                break
+            result = function(qca)
+            if len(result) > 0 and not _put(outputs, result, stop):
+                break
+    except Exception as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        _put(outputs, _DONE, stop)
+
+
+def _feed_contexts(contexts: List[Context], micro_batch_size: int, outputs: Queue, stop: Event) -> None:
+    """Sends the retrieved contexts into the pipeline as micro-batches of one-context questions"""
+    for i in range(0, len(contexts), micro_batch_size):
+        questions = [Question(retrieved_contexts=[c]) for c in contexts[i: i + micro_batch_size]]
+        if not _put(outputs, QuestionContextAnswer(questions=questions), stop):
+            return
+    _put(outputs, _DONE, stop)
+
+
+def stream_quiz_questions(contexts: List[Context], n_questions: int = 10, micro_batch_size: int = 2,
+                          generation_batch_size: int = 64, stanza_dir: str = 'data/stanza',
+                          generator_path: str = "Narrativa/mT5-base-finetuned-tydiQA-question-generation",
+                          qa_path: str = "csarron/roberta-base-squad-v1",
+                          threshold: int = 6, queue_size: int = 2,
+                          entity_index: EntityIndex = None) -> QuestionContextAnswer:
+    """
+    Runs the contexts through answer extraction, question generation and the roundtrip filter as a pipeline of
+    micro-batches: the extraction and the generation run in their own threads, connected by bounded queues, while
+    the filter runs in the calling thread. The pipeline stops as soon as n_questions questions passed the filter.
+    :param contexts: the retrieved contexts
+    :param n_questions: the number of filtered questions after which the pipeline stops
+    :param micro_batch_size: the number of contexts of a micro-batch
+    :param generation_batch_size: the maximal number of answers of a question generation batch
+    :param stanza_dir: the direction to the English stanza model
+    :param generator_path: the path of the question generation model
+    :param qa_path: the path of the question answering model of the filter
+    :param threshold: the threshold of the roundtrip filter
+    :param queue_size: the number of micro-batches waiting between two stages
+    :param entity_index: optional entities precomputed offline, Stanza only runs on the contexts missing from it
+    :return: a QuestionContextAnswer object with the questions that passed the filter
+    """
+
+    stop = Event()
+    errors = []
+    retrieved, extracted, generated = Queue(queue_size), Queue(queue_size), Queue(queue_size)
+    stages = [Thread(target=_feed_contexts, args=(contexts, micro_batch_size, retrieved, stop), daemon=True),
+              Thread(target=_run_stage,
+                     args=(lambda qca: extract_answers_from_contexts(qca, stanza_dir, entity_index=entity_index),
+                           retrieved, extracted,
+                           stop, errors),
+                     daemon=True),
+              Thread(target=_run_stage,
+                     args=(lambda qca: generate_questions(qca, model_path=generator_path,
+                                                               max_batch_size=generation_batch_size),
+                           extracted, generated, stop, errors),
+                     daemon=True)]
+    for stage in stages:
+        stage.start()
+
+    filtered_questions = []
+    try:
+        while len(filtered_questions) < n_questions:
+            qca = _get(generated, stop)
+            if qca is _DONE:
+                break
+            filtered_questions += roundtrip_filter(qca, model_path=qa_path, threshold=threshold).questions
+    finally:
+        stop.set()
+        for stage in stages:
+            stage.join()
+
+    if errors:
+        raise errors[0]
+    return QuestionContextAnswer(questions=filtered_questions)
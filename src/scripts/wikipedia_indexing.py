@@ -1,95 +1,229 @@
-from typing import List
-from os import listdir
-from os.path import isfile, join
+from typing import Dict, List, TYPE_CHECKING
+from os import listdir, cpu_count, replace
+from os.path import exists, isfile, join
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import hashlib
 import json
-from tqdm import tqdm
-from elasticsearch import Elasticsearch
-from elasticsearch.helpers import bulk
+import time
 import logging
 
+from src.models.bm25_index import BM25Index
+from src.models.bm25_retriever import clear_retriever_caches
+
+# elasticsearch and tqdm are imported by the functions using them, so that the local BM25 index and the retrieval
+# workers do not load them
+if TYPE_CHECKING:
+    from elasticsearch import Elasticsearch
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 
-def set_es_client(host='elasticsearch-master'):
-    """Connection with ElasticSearch in the DataLab"""
-    
-    es = Elasticsearch([{'host': host, 'port': 9200}], http_compress=True,  timeout=200)
+# Bulk item statuses worth sending again after a backoff (the node rejected the request because it is overloaded)
+RETRYABLE_STATUSES = {429}
+
+
+@lru_cache(maxsize=None)
+def set_es_client(host='elasticsearch-master', maxsize: int = 10):
+    """
+    Connection with ElasticSearch in the DataLab, with a pool of maxsize connections shared by the threads.
+    The client of a host is created once per process and reused by the following calls.
+    """
+    from elasticsearch import Elasticsearch
+
+    es = Elasticsearch([{'host': host, 'port': 9200}], http_compress=True,  timeout=200, maxsize=maxsize)
     return es
 
 def fill_default_args():
     args = {"directory": "./data/wikipedia",
         "batch_size": 12,
+        "bulk_mode": "parallel",
+        "chunk_size": 500,
+        "max_chunk_bytes": 10 * 1024 * 1024,
+        "thread_count": 4,
+        "max_retries": 5,
+        "initial_backoff": 2,
+        "max_backoff": 60,
+        "disable_refresh": True,
+        "num_workers": cpu_count() or 1,
         "min_len_paragraph": 100,
-        "language": "english"}
+        "language": "english",
+        "index_path": "./data/wikipedia_english.bm25",
+        "manifest_path": "./data/wikipedia_english.manifest.json"}
     return args
 
 
-def convert_wikipedia_dump_to_documents(args, batch):
+def list_wikipedia_files(directory: str) -> List[str]:
     """
-    Convert Wikipedia dumps (text files) into dictionaries of documents composed of paragraphs
+    Lists the text files of a Wikipedia dump, sorted so that documents are always produced in the same order
+    :param directory: the directory of the dump, containing one folder per group of files (AA, AB, ...)
+    :return: the sorted list of the paths of the files
+    """
+
+    wiki_dirs = sorted(f for f in listdir(directory) if not isfile(join(directory, f)))
+    return [join(directory, dirs, file) for dirs in wiki_dirs for file in sorted(listdir(join(directory, dirs)))
+            if isfile(join(directory, dirs, file))]
+
+
+def parse_wikipedia_article(article: str, min_len_paragraph: int) -> List[dict]:
+    """
+    Converts one line of a Wikipedia dump into paragraph documents
+    :param article: a json structure describing an article
+    :param min_len_paragraph: the minimal number of characters of a paragraph
+    :return: the list of documents of the paragraphs of the article
+    """
+
+    json_formatted_article = json.loads(article)
+    base_document = {"id": json_formatted_article["id"],
+                     "revid": json_formatted_article.get("revid"),
+                     "name": json_formatted_article["title"],
+                     "url": json_formatted_article["url"]}
+
+    paragraph_separator = '\n'  # Paragraphs in files are separated by one new-line character '\n'
+    paragraphs = [p.strip() for pid, p in enumerate(json_formatted_article["text"].split(paragraph_separator))
+                  if pid > 0 and p.strip() and len(p) >= min_len_paragraph]
+
+    return [{**base_document, "paragraph_id": pid, "text": p} for pid, p in enumerate(paragraphs)]
+
+
+def iter_wikipedia_file(path: str, min_len_paragraph: int):
+    """
+    Streams the articles of one file of a Wikipedia dump, one line at a time
+    :param path: the path of the file
+    :param min_len_paragraph: the minimal number of characters of a paragraph
+    :return: a generator of the lists of paragraph documents of each article
+    """
+
+    # Each text file contains json structures separated by one new-line character '\n'
+    with open(path, "r") as f:
+        for article in f:
+            if article.strip():
+                yield parse_wikipedia_article(article, min_len_paragraph)
+
+
+def parse_wikipedia_file(path: str, min_len_paragraph: int) -> List[List[dict]]:
+    """
+    Parses one file of a Wikipedia dump, in a worker process
+    :param path: the path of the file
+    :param min_len_paragraph: the minimal number of characters of a paragraph
+    :return: the lists of paragraph documents of each article of the file
+    """
+
+    return list(iter_wikipedia_file(path, min_len_paragraph))
+
+
+def _iter_parsed_files(files: List[str], min_len_paragraph: int, num_workers: int):
+    """
+    Parses the files in a process pool and yields the results in the order of the files. At most two files per
+    worker are pending at a time, which bounds the memory used by parsed documents waiting to be consumed.
+    """
+
+    if num_workers <= 1:
+        for path in files:
+            yield path, iter_wikipedia_file(path, min_len_paragraph)
+        return
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        pending = deque()
+        remaining_files = iter(files)
+        for path in islice(remaining_files, 2 * num_workers):
+            pending.append((path, executor.submit(parse_wikipedia_file, path, min_len_paragraph)))
+
+        while pending:
+            path, future = pending.popleft()
+            articles = future.result()
+            for path_to_submit in islice(remaining_files, 1):
+                pending.append((path_to_submit, executor.submit(parse_wikipedia_file, path_to_submit,
+                                                                min_len_paragraph)))
+            yield path, articles
+
+
+def iter_wikipedia_documents(args, counts: Dict[str, float] = None):
+    """
+    Streams the paragraph documents of a Wikipedia dump, in a deterministic order, parsing the files in parallel
     :param args: Dictionary of arguments
-    :param batch: Batch function
-    :return: None
+    :param counts: optional dictionary filled with the number of articles and paragraphs and the throughput
+    :return: a generator of lists of paragraph documents, one list per article
     """
 
     directory = args['directory']
-    batch_size = args['batch_size']
     min_len_paragraph = args['min_len_paragraph']
+    num_workers = args.get('num_workers', 1)
 
-    # Get all directions in the wikipedia folder
-    wiki_dirs = [f for f in listdir(directory) if not isfile(join(directory, f))]
-    dicts = []
-    counts = dict(documents=0, paragraphs=0)
-    progress_bar = tqdm(wiki_dirs)
-    batch_id = 1
+    counts = counts if counts is not None else {}
+    counts.update(documents=0, paragraphs=0)
+    start = time.perf_counter()
+
+    from tqdm import tqdm
 
-    for dirs in progress_bar:
-        sub_dirs = [f for f in listdir(join(directory, dirs)) if not isfile(join(directory, dirs))]
-        progress_bar.set_description(f"Processing wikipedia folder {dirs}")
+    files = list_wikipedia_files(directory)
+    progress_bar = tqdm(_iter_parsed_files(files, min_len_paragraph, num_workers), total=len(files))
 
-        for file in sub_dirs:
-            f = open(join(directory, dirs, file), "r")
+    for path, articles in progress_bar:
+        progress_bar.set_description(f"Processing wikipedia file {path}")
+        for paragraphs in articles:
+            counts["documents"] += 1
+            counts["paragraphs"] += len(paragraphs)
+            yield paragraphs
 
-            # Each text file contains json structures separated by one new-line character '\n'
-            articles = f.read().split("\n")
+        elapsed = time.perf_counter() - start
+        counts.update(seconds=elapsed,
+                      articles_per_second=counts["documents"] / elapsed,
+                      paragraphs_per_second=counts["paragraphs"] / elapsed)
+        progress_bar.set_postfix(articles_per_s=f'{counts["articles_per_second"]:.0f}',
+                                 paragraphs_per_s=f'{counts["paragraphs_per_second"]:.0f}')
 
-            for article in articles:
-                if len(article) == 0:
-                    continue
 
-                json_formatted_article = json.loads(article)
-                base_document = {"id": json_formatted_article["id"],
-                                 "name": json_formatted_article["title"],
-                                 "url": json_formatted_article["url"]}
-                counts["documents"] += 1
+def convert_wikipedia_dump_to_documents(args, batch):
+    """
+    Convert Wikipedia dumps (text files) into dictionaries of documents composed of paragraphs
+    :param args: Dictionary of arguments
+    :param batch: Batch function
+    :return: Dictionary with the number of articles and paragraphs and the parsing throughput
+    """
 
-                paragraph_separator = '\n'  # Paragraphs in files are separated by one new-line character '\n'
-                paragraphs = [p.strip() for pid, p in enumerate(json_formatted_article["text"].split(paragraph_separator))
-                              if pid > 0 and p.strip() and len(p) >= min_len_paragraph]
-                counts["paragraphs"] += len(paragraphs)
+    batch_size = args['batch_size']
+    dicts = []
+    counts = {}
+    batch_id = 1
 
-                for pid, p in enumerate(paragraphs):
-                    document = {**base_document, "paragraph_id": pid, "text": p}
-                    dicts.append(document)
+    for paragraphs in iter_wikipedia_documents(args, counts):
+        dicts += paragraphs
 
-                if len(dicts) >= batch_size:
-                    batch(dicts, batch_id)
-                    dicts = [] # Empty bulk
-                    batch_id += 1
+        if len(dicts) >= batch_size:
+            batch(dicts, batch_id)
+            dicts = [] # Empty bulk
+            batch_id += 1
 
     # Process the last partial batch
     if dicts:
         batch(dicts, batch_id)
 
+    log_counts(counts)
+    return counts
+
+
+def log_counts(counts: Dict[str, float]):
+    """
+    Logs the number of articles and paragraphs read from the dump, and the throughput
+    :param counts: Dictionary filled by iter_wikipedia_documents
+    :return: None
+    """
+
     logger.info("==" * 100)
     logger.info("Indexing done.")
     logger.info(f"# documents: {counts['documents']}")
-    logger.info(f"# paragraphs: {counts['paragraphs']}, "
-                    f"{counts['paragraphs'] / counts['documents']:.2f} per document")
+    if counts['documents']:
+        logger.info(f"# paragraphs: {counts['paragraphs']}, "
+                        f"{counts['paragraphs'] / counts['documents']:.2f} per document")
+        logger.info(f"Throughput: {counts['articles_per_second']:.0f} articles/s, "
+                    f"{counts['paragraphs_per_second']:.0f} paragraphs/s")
 
 
-def index_documents(client: Elasticsearch, index: str, documents: List[dict]):
+def index_documents(client: 'Elasticsearch', index: str, documents: List[dict]):
     """
     Indexes documents for doing queries in Elasticsearch
     :param client: Elasticsearch client
@@ -97,30 +231,221 @@ def index_documents(client: Elasticsearch, index: str, documents: List[dict]):
     :param documents: List of dictionaries
     :return: None
     """
-    documents_to_index = []
+    from elasticsearch.helpers import bulk
 
-    for doc in documents:
-        _doc = {"_op_type": "create", "_index": index, **doc}
-        documents_to_index.append(_doc)
+    documents_to_index = list(iter_index_actions(index, documents))
 
     bulk(client, documents_to_index, request_timeout=300)
 
 
-def run_indexing(client: Elasticsearch, args):
+def document_id(article_id: str, paragraph_id: int) -> str:
+    """
+    :return: the Elasticsearch identifier of a paragraph, stable from one dump to the other
+    """
+    return f"{article_id}_{paragraph_id}"
+
+
+def iter_index_actions(index: str, documents, op_type: str = "create"):
+    """
+    :param index: The index to write the documents into
+    :param documents: Iterable of dictionaries
+    :param op_type: 'create' for a new index, 'index' to overwrite existing documents
+    :return: a generator of bulk actions creating the documents
+    """
+    for doc in documents:
+        yield {"_op_type": op_type, "_index": index, "_id": document_id(doc["id"], doc["paragraph_id"]), **doc}
+
+
+def _retry_delay(args, attempt: int) -> float:
+    return min(args['max_backoff'], args['initial_backoff'] * 2 ** attempt)
+
+
+def _parallel_bulk_with_retries(client: 'Elasticsearch', actions, args) -> Dict[str, int]:
+    """
+    Sends the actions with parallel_bulk, whose chunks are bounded both in count and in bytes, then sends the
+    rejected actions again with an exponential backoff
+    """
+    from elasticsearch.helpers import parallel_bulk
+
+    stats = dict(indexed=0, retried=0, failed=0)
+    for attempt in range(args['max_retries'] + 1):
+        in_flight = deque()
+        retries = []
+
+        def track(actions_to_send):
+            for action in actions_to_send:
+                in_flight.append(action)
+                yield action
+
+        # Results come back in the order of the actions, so each one is matched with the action it answers
+        for ok, item in parallel_bulk(client, track(actions),
+                                      thread_count=args['thread_count'],
+                                      chunk_size=args['chunk_size'],
+                                      max_chunk_bytes=args['max_chunk_bytes'],
+                                      raise_on_error=False,
+                                      raise_on_exception=False,
+                                      request_timeout=300):
+            action = in_flight.popleft()
+            if ok:
+                stats['indexed'] += 1
+            elif next(iter(item.values())).get('status') in RETRYABLE_STATUSES and attempt < args['max_retries']:
+                retries.append(action)
+            else:
+                stats['failed'] += 1
+                logger.error(f"Failed to index a document: {item}")
+
+        if not retries:
+            break
+        stats['retried'] += len(retries)
+        delay = _retry_delay(args, attempt)
+        logger.warning(f"{len(retries)} documents rejected, retrying in {delay}s")
+        time.sleep(delay)
+        actions = retries
+
+    return stats
+
+
+def bulk_index_documents(client: 'Elasticsearch', actions, args) -> Dict[str, int]:
     """
-    Creates the final french wikipedia index
+    Indexes a stream of bulk actions, grouped into requests of at most args['chunk_size'] documents and
+    args['max_chunk_bytes'] bytes, and retries the requests rejected by the cluster
     :param client: Elasticsearch client
-    :param args: Dictionary of arguments
+    :param actions: Iterable of bulk actions
+    :param args: Dictionary of arguments, args['bulk_mode'] being 'parallel', 'streaming' or 'batch'
+    :return: Dictionary with the number of indexed, retried and failed documents
+    """
+
+    from elasticsearch.helpers import bulk, streaming_bulk
+
+    if args['bulk_mode'] == 'parallel':
+        return _parallel_bulk_with_retries(client, actions, args)
+
+    stats = dict(indexed=0, retried=0, failed=0)
+    if args['bulk_mode'] == 'batch':
+        actions = iter(actions)
+        for chunk in iter(lambda: list(islice(actions, args['batch_size'])), []):
+            indexed, _ = bulk(client, chunk, request_timeout=300)
+            stats['indexed'] += indexed
+        return stats
+
+    # streaming_bulk retries the documents rejected with a 429 status by itself
+    for ok, item in streaming_bulk(client, actions,
+                                   chunk_size=args['chunk_size'],
+                                   max_chunk_bytes=args['max_chunk_bytes'],
+                                   max_retries=args['max_retries'],
+                                   initial_backoff=args['initial_backoff'],
+                                   max_backoff=args['max_backoff'],
+                                   raise_on_error=False,
+                                   request_timeout=300):
+        if ok:
+            stats['indexed'] += 1
+        else:
+            stats['failed'] += 1
+            logger.error(f"Failed to index a document: {item}")
+    return stats
+
+
+def disable_refresh_and_replicas(client: 'Elasticsearch', index: str) -> Dict[str, str]:
+    """
+    Switches off the refresh and the replicas of an index during a bulk load
+    :param client: Elasticsearch client
+    :param index: The index that is going to be loaded
+    :return: the previous settings, to be given to restore_index_settings
+    """
+
+    settings = client.indices.get_settings(index=index)[index]['settings']['index']
+    previous_settings = {"refresh_interval": settings.get("refresh_interval", "1s"),
+                         "number_of_replicas": settings.get("number_of_replicas", "1")}
+    client.indices.put_settings(index=index, body={"index": {"refresh_interval": "-1",
+                                                             "number_of_replicas": 0}})
+    return previous_settings
+
+
+def restore_index_settings(client: 'Elasticsearch', index: str, settings: Dict[str, str]):
+    """
+    Restores the settings changed by disable_refresh_and_replicas and makes the loaded documents searchable
+    :param client: Elasticsearch client
+    :param index: The loaded index
+    :param settings: the settings returned by disable_refresh_and_replicas
+    :return: None
+    """
+
+    client.indices.put_settings(index=index, body={"index": settings})
+    client.indices.refresh(index=index)
+
+
+def article_hash(paragraphs: List[dict]) -> str:
+    """
+    :param paragraphs: the paragraph documents of one article
+    :return: a hash of the revision and of the indexed text of the article
+    """
+    content = hashlib.sha1(str(paragraphs[0].get("revid")).encode('utf-8'))
+    for doc in paragraphs:
+        content.update(b'\n' + doc["text"].encode('utf-8'))
+    return content.hexdigest()
+
+
+def load_manifest(path: str) -> Dict:
+    """
+    :param path: the path of the manifest written by the last indexing
+    :return: the manifest, or None if there is none
+    """
+    if not exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(path: str, index: str, articles: Dict[str, list]):
+    """
+    Writes the manifest of the indexed articles, atomically so that an interrupted indexing keeps the previous one
+    :param path: the path of the manifest
+    :param index: the name of the index the articles are in
+    :param articles: for each article id, the hash of the article and its number of paragraphs
+    :return: None
+    """
+    with open(path + ".tmp", "w") as f:
+        json.dump({"index": index, "articles": articles}, f)
+    replace(path + ".tmp", path)
+
+
+def content_version(articles: Dict[str, list]) -> str:
+    """
+    :param articles: for each article id, the hash of the article and its number of paragraphs, as in the manifest
+    :return: a hash of the indexed articles, which changes as soon as one of them is added, updated or removed
+    """
+    return hashlib.sha1(json.dumps(articles, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def set_content_version(client: 'Elasticsearch', index: str, version: str):
+    """
+    Stores the content version in the _meta of the mapping of the index, read by BM25Retriever.index_version so that
+    the caches of the retrievers and of the quizzes see the documents updated in place by run_incremental_indexing
+    :param client: Elasticsearch client
+    :param index: the loaded index
+    :param version: the content version, see content_version
     :return: None
     """
+    client.indices.put_mapping(index=index, body={"_meta": {"content_version": version}})
 
-    index = "wikipedia"
-    index += f"_{args['language'].lower()}"
 
-    if client.indices.exists(index=index):
-        logger.info(f'{index}')
-        logger.warning(f"Index {index} already exists, deleting the index.")
-        client.indices.delete(index=index)
+def _track_articles(articles, manifest_articles: Dict[str, list]):
+    """
+    Yields the paragraphs of the articles and records the hash and number of paragraphs of each article
+    """
+    for paragraphs in articles:
+        if paragraphs:
+            manifest_articles[paragraphs[0]["id"]] = [article_hash(paragraphs), len(paragraphs)]
+            yield from paragraphs
+
+
+def create_index(client: 'Elasticsearch', index: str):
+    """
+    Creates an index with the English standard analyzer
+    :param client: Elasticsearch client
+    :param index: the name of the index
+    :return: None
+    """
 
     client.indices.create(index=index, body={
         "settings": {
@@ -136,7 +461,159 @@ def run_indexing(client: Elasticsearch, args):
     }
                           )
 
+
+def swap_alias(client: 'Elasticsearch', alias: str, index: str):
+    """
+    Points the alias to the index in one atomic operation, then deletes the indices it pointed to before
+    :param client: Elasticsearch client
+    :param alias: the alias queried by the retriever
+    :param index: the freshly loaded index
+    :return: None
+    """
+
+    actions = [{"add": {"index": index, "alias": alias}}]
+    old_indices = []
+    if client.indices.exists_alias(name=alias):
+        old_indices = [i for i in client.indices.get_alias(name=alias) if i != index]
+        actions = [{"remove": {"index": i, "alias": alias}} for i in old_indices] + actions
+    elif client.indices.exists(index=alias):
+        # Index built before the indices were versioned, with the name of the alias
+        logger.warning(f"Index {alias} is replaced by the alias {alias} -> {index}")
+        actions = [{"remove_index": {"index": alias}}] + actions
+
+    client.indices.update_aliases(body={"actions": actions})
+    for old_index in old_indices:
+        client.indices.delete(index=old_index)
+
+
+def run_indexing(client: 'Elasticsearch', args):
+    """
+    Creates a new version of the wikipedia index. The alias wikipedia_<language> is only moved to it once it is
+    fully loaded, so the previous version keeps answering queries in the meantime.
+    :param client: Elasticsearch client
+    :param args: Dictionary of arguments
+    :return: the name of the new index
+    """
+
+    alias = "wikipedia"
+    alias += f"_{args['language'].lower()}"
+    index = f"{alias}_{time.strftime('%Y%m%d%H%M%S')}"
+    create_index(client, index)
+
+    manifest_articles = {}
+    disable_refresh = args['disable_refresh'] and args['bulk_mode'] != 'batch'
+    previous_settings = disable_refresh_and_replicas(client, index) if disable_refresh else None
+    try:
+        counts = {}
+        documents = _track_articles(iter_wikipedia_documents(args, counts), manifest_articles)
+        stats = bulk_index_documents(client, iter_index_actions(index, documents), args)
+    finally:
+        if previous_settings:
+            restore_index_settings(client, index, previous_settings)
+
+    log_counts(counts)
+    logger.info(f"# indexed: {stats['indexed']}, retried: {stats['retried']}, failed: {stats['failed']}")
+
+    set_content_version(client, index, content_version(manifest_articles))
+    swap_alias(client, alias, index)
+    clear_retriever_caches()
+    save_manifest(args['manifest_path'], index, manifest_articles)
+    return index
+
+
+def _iter_incremental_actions(index: str, articles, old_articles: Dict[str, list], new_articles: Dict[str, list],
+                              counts: Dict[str, int]):
+    """
+    Yields the bulk actions updating the articles whose hash changed, and deleting the paragraphs that disappeared
+    """
+    for paragraphs in articles:
+        if not paragraphs:
+            continue
+        article_id = paragraphs[0]["id"]
+        new_articles[article_id] = [article_hash(paragraphs), len(paragraphs)]
+        old_hash, old_n_paragraphs = old_articles.get(article_id, (None, 0))
+        if new_articles[article_id][0] == old_hash:
+            continue
+
+        counts["changed"] += 1
+        yield from iter_index_actions(index, paragraphs, op_type="index")
+        for pid in range(len(paragraphs), old_n_paragraphs):
+            yield {"_op_type": "delete", "_index": index, "_id": document_id(article_id, pid)}
+
+    for article_id, (_, old_n_paragraphs) in old_articles.items():
+        if article_id not in new_articles:
+            counts["removed"] += 1
+            for pid in range(old_n_paragraphs):
+                yield {"_op_type": "delete", "_index": index, "_id": document_id(article_id, pid)}
+
+
+def run_incremental_indexing(client: 'Elasticsearch', args):
+    """
+    Updates the current wikipedia index in place with the articles that changed since the last indexing, according
+    to the manifest of the hashes of the articles. Falls back to run_indexing when there is no usable manifest.
+    :param client: Elasticsearch client
+    :param args: Dictionary of arguments
+    :return: the name of the updated index
+    """
+
+    alias = "wikipedia"
+    alias += f"_{args['language'].lower()}"
+    manifest = load_manifest(args['manifest_path'])
+    if manifest is None or not client.indices.exists_alias(name=alias, index=manifest["index"]):
+        logger.warning("No manifest of the current index, rebuilding the whole index.")
+        return run_indexing(client, args)
+
+    index = manifest["index"]
+    new_articles = {}
+    counts = {}
+    changes = dict(changed=0, removed=0)
+    actions = _iter_incremental_actions(index, iter_wikipedia_documents(args, counts), manifest["articles"],
+                                        new_articles, changes)
+    stats = bulk_index_documents(client, actions, args)
+    client.indices.refresh(index=index)
+    # Also bumped when some updates failed, the documents that were updated changed all the same
+    set_content_version(client, index, content_version(new_articles))
+    clear_retriever_caches()
+
+    log_counts(counts)
+    logger.info(f"# changed articles: {changes['changed']}, removed articles: {changes['removed']}")
+    logger.info(f"# indexed: {stats['indexed']}, retried: {stats['retried']}, failed: {stats['failed']}")
+
+    if stats['failed']:
+        logger.warning("Some updates failed, the manifest is kept so that they are retried next time.")
+    else:
+        save_manifest(args['manifest_path'], index, new_articles)
+    return index
+
+
+def build_bm25_index(args) -> BM25Index:
+    """
+    Builds an in-process BM25 index from the same paragraphs as the Elasticsearch index, to be used with
+    BM25Retriever(client=index, backend='local')
+    :param args: Dictionary of arguments
+    :return: the BM25 index
+    """
+
+    bm25_index = BM25Index()
+
     def batch(dicts, batch_id):
-        index_documents(client, index, dicts)
+        bm25_index.add_documents(dicts)
+
+    convert_wikipedia_dump_to_documents(args, batch=batch)
+    return bm25_index.finalize()
+
+
+
+def run_local_indexing(args) -> str:
+    """
+    Builds the BM25 index of the Wikipedia dump and writes it into a memory-mapped file, so that it can be opened
+    with BM25Index.open without parsing the dump again
+    :param args: Dictionary of arguments
+    :return: the path of the index file
+    """
 
-    convert_wikipedia_dump_to_documents(args, batch=batch)
\ No newline at end of file
+    index_path = args['index_path']
+    build_bm25_index(args).save(index_path)
+    clear_retriever_caches()
+    logger.info(f"BM25 index written into {index_path}")
+    return index_path
@@ -0,0 +1,93 @@
+from src.models.bm25_retriever import BM25Retriever
+
+
+class StubIndices:
+
+    def __init__(self, client) -> None:
+        self.client = client
+
+
+    def get_settings(self, index: str) -> dict:
+        self.client.requests.append('get_settings')
+        return {index: {'settings': {'index': {'uuid': self.client.uuid}}}}
+
+
+    def get_mapping(self, index: str) -> dict:
+        self.client.requests.append('get_mapping')
+        return {index: {'mappings': {'_meta': {'content_version': '1'}}}}
+
+
+
+class StubClient:
+    """
+    Elasticsearch client recording its requests, whose hits name the uuid of the index they were read from. The index
+    is swapped during the search when swap_during_search is set.
+    """
+
+    def __init__(self) -> None:
+        self.indices = StubIndices(self)
+        self.uuid = 'first'
+        self.swap_during_search = None
+        self.requests = []
+
+
+    def count(self, index: str) -> dict:
+        self.requests.append('count')
+        return {'count': 3}
+
+
+    def search(self, index: str, body: dict) -> dict:
+        self.requests.append('search')
+        hit = {'_id': '12_0', '_score': 2.0, '_source': {'id': '12', 'name': 'Paris', 'url': 'https://wiki/12',
+                                                          'paragraph_id': 0, 'text': f'Read from {self.uuid}.'}}
+        if self.swap_during_search is not None:
+            self.uuid, self.swap_during_search = self.swap_during_search, None
+        return {'hits': {'hits': [hit]}}
+
+
+
+def texts(retriever: BM25Retriever, query: str = 'capital of France') -> list:
+    return [c.text for c in retriever.retrieve(query)]
+
+
+
+def test_the_first_search_is_a_single_request():
+    client = StubClient()
+    retriever = BM25Retriever(client)
+
+    assert texts(retriever) == ['Read from first.']
+    assert client.requests == ['search']
+    assert texts(retriever) == ['Read from first.']
+    assert client.requests == ['search']
+    assert (retriever.cache_hits, retriever.cache_misses) == (1, 1)
+
+
+
+def test_hits_of_another_version_are_not_served():
+    client = StubClient()
+    retriever = BM25Retriever(client, version_ttl=0)
+
+    assert texts(retriever) == ['Read from first.']
+    # The hits of the first fill have no version yet, they are fetched again once it is known
+    assert texts(retriever) == ['Read from first.']
+    assert client.requests == ['search', 'get_settings', 'get_mapping', 'count', 'search']
+    client.requests.clear()
+    assert texts(retriever) == ['Read from first.']
+    assert client.requests == ['get_settings', 'get_mapping', 'count']
+
+    client.uuid = 'second'
+    assert texts(retriever) == ['Read from second.']
+
+
+
+def test_hits_fetched_while_the_index_is_swapped_are_dropped():
+    client = StubClient()
+    retriever = BM25Retriever(client, version_ttl=0)
+    texts(retriever, 'seed')
+    texts(retriever, 'seed')
+
+    client.swap_during_search = 'second'
+    assert texts(retriever) == ['Read from first.']
+    assert texts(retriever) == ['Read from second.']
+    assert texts(retriever) == ['Read from second.']
+    assert retriever.cache_hits == 1
@@ -0,0 +1,102 @@
+from src.benchmarks.data_format import list_contexts, list_get_all_answers, list_get_all_contexts, synthetic_qca
+from src.data.data_format import *
+
+
+
+def sample_qca() -> QuestionContextAnswer:
+    """
+    Questions whose answers share contexts, with duplicate identifiers on distinct context objects, answers without
+    context and questions without answers or retrieved contexts
+    """
+    c1 = Context(text='first paragraph', identifier='1_0')
+    c1_copy = Context(text='first paragraph, copy', identifier='1_0')
+    c2 = Context(text='second paragraph', identifier='2_0')
+    c3 = Context(text='third paragraph', identifier='3_0')
+
+    q1 = Question(text='q1',
+                  gold_answers=[Answer(text='gold', context=c2)],
+                  predicted_answers=[Answer(text='a', context=c1), Answer(text='b', context=None),
+                                     Answer(text='c', context=c1_copy), Answer(text='d', context=c2)],
+                  retrieved_contexts=[c3, c1_copy, c2, c3])
+    q2 = Question(text='q2', predicted_answers=[Answer(text='e', context=c3), Answer(text='f', context=c1_copy)])
+    q3 = Question(text='q3', retrieved_contexts=[c2])
+    q4 = Question(text='q4')
+    return QuestionContextAnswer(questions=[q1, q2, q3, q4])
+
+
+
+def assert_same_objects(result: list, reference: list) -> None:
+    assert [id(x) for x in result] == [id(x) for x in reference]
+
+
+
+def test_get_contexts_matches_reference():
+    for q in sample_qca().questions:
+        assert_same_objects(Question._get_contexts(q.predicted_answers), list_contexts(q.predicted_answers))
+        assert_same_objects(q.get_gold_contexts(), list_contexts(q.gold_answers))
+        assert_same_objects(q.get_predicted_contexts(), list_contexts(q.predicted_answers))
+
+
+
+def test_get_contexts_keeps_first_context_of_each_identifier():
+    q1 = sample_qca().questions[0]
+    contexts = q1.get_predicted_contexts()
+    assert [c.identifier for c in contexts] == ['1_0', '2_0']
+    assert contexts[0].text == 'first paragraph'
+    assert Question._get_contexts(None) == []
+    assert Question._get_contexts([Answer(text='no context')]) == []
+
+
+
+def test_get_all_contexts_matches_reference():
+    for q in sample_qca().questions + synthetic_qca(n_answers=200, answers_per_question=40).questions:
+        assert_same_objects(q.get_all_contexts(), list_get_all_contexts(q))
+
+
+
+def test_get_all_contexts_order():
+    q1 = sample_qca().questions[0]
+    assert [c.identifier for c in q1.get_all_contexts()] == ['2_0', '1_0', '3_0']
+    assert sample_qca().questions[3].get_all_contexts() == []
+
+
+
+def test_get_all_answers_matches_reference():
+    for qca in (sample_qca(), synthetic_qca(n_answers=200, answers_per_question=40),
+                QuestionContextAnswer(questions=[])):
+        assert_same_objects(qca.get_all_answers(), list_get_all_answers(qca))
+    assert [a.text for a in sample_qca().get_all_answers()] == ['gold', 'a', 'b', 'c', 'd', 'e', 'f']
+
+
+
+def test_lookups_match_scans():
+    qca = sample_qca()
+    answers_by_context_id = qca.get_answers_by_context_id()
+    for identifier in ('1_0', '2_0', '3_0'):
+        assert_same_objects(answers_by_context_id[identifier],
+                            [a for a in list_get_all_answers(qca) if a.context and a.context.identifier == identifier])
+    assert None not in answers_by_context_id
+
+    contexts_by_id = qca.get_contexts_by_id()
+    assert list(contexts_by_id) == ['2_0', '1_0', '3_0']
+    for q in qca.questions:
+        for c in list_get_all_contexts(q):
+            assert contexts_by_id[c.identifier].identifier == c.identifier
+    assert contexts_by_id['1_0'].text == 'first paragraph'
+
+
+
+def test_lookups_are_rebuilt():
+    qca = sample_qca()
+    lookups = qca.get_contexts_by_id()
+    assert qca.get_contexts_by_id() is lookups
+
+    new_context = Context(text='new paragraph', identifier='4_0')
+    qca.questions[3].retrieved_contexts = [new_context]
+    assert '4_0' not in qca.get_contexts_by_id()
+    qca.clear_lookups()
+    assert qca.get_contexts_by_id()['4_0'] is new_context
+
+    qca.questions = [Question(text='q5', predicted_answers=[Answer(text='g', context=new_context)])]
+    assert list(qca.get_contexts_by_id()) == ['4_0']
+    assert [a.text for a in qca.get_answers_by_context_id()['4_0']] == ['g']
@@ -0,0 +1,100 @@
+import re
+
+from src.data.data_format import *
+from src.models.bm25_index import BM25Index
+from src.models.bm25_retriever import BM25Retriever
+from src.models.entity_index import EntityIndex
+from src.scripts import entity_indexing
+from src.scripts.answer_extraction import extract_answers_from_contexts
+
+
+PARAGRAPHS = [('12', 0, 'Paris is the capital of France and the seat of its government.'),
+              ('12', 1, 'The Seine flows through Paris before reaching the English Channel.'),
+              ('40', 0, 'Berlin became the capital of Germany after the reunification in 1990.')]
+
+
+
+class CapitalizedWordsExtractor:
+    """
+    Offline extractor of the tests: every capitalized word is an entity
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.cache = None
+
+
+    def extract_entities(self, texts: List[str]) -> List[List[tuple]]:
+        return [[(m.group(), 'GPE', m.start(), m.end()) for m in re.finditer(r'\b[A-Z][a-z]+', t)] for t in texts]
+
+
+
+class UnavailableExtractor:
+    """
+    Online extractor of the tests, failing as soon as Stanza would run
+    """
+
+    def __init__(self) -> None:
+        self.cache = None
+        self.texts = []
+
+
+    def extract_context_entities(self, contexts: List[Context]) -> List[List[tuple]]:
+        self.texts += [c.text for c in contexts]
+        return CapitalizedWordsExtractor().extract_entities([c.text for c in contexts])
+
+
+
+def build_entity_index(tmp_path, monkeypatch) -> str:
+    index_path = str(tmp_path / 'wikipedia.bm25')
+    index = BM25Index()
+    index.add_documents([dict(id=article_id, name='Article', url='https://wiki', paragraph_id=paragraph_id, text=text)
+                         for article_id, paragraph_id, text in PARAGRAPHS])
+    index.finalize().save(index_path)
+
+    monkeypatch.setattr(entity_indexing, 'StanzaExtractor', CapitalizedWordsExtractor)
+    return entity_indexing.run_entity_indexing(index_path, 'unused', chunk_size=2)
+
+
+
+def es_context(article_id: str, paragraph_id: int, text: str) -> Context:
+    hit = {'_id': f'{article_id}_{paragraph_id}', '_score': 3.2,
+           '_source': {'id': article_id, 'name': 'Article', 'url': 'https://wiki', 'paragraph_id': paragraph_id,
+                       'text': text}}
+    return BM25Retriever(client=None).convert_es_hit_to_context(hit)
+
+
+
+def test_retrieved_contexts_get_their_entities_without_stanza(tmp_path, monkeypatch):
+    extractor = UnavailableExtractor()
+    contexts = [es_context(*paragraph) for paragraph in reversed(PARAGRAPHS)]
+    assert all('doc_index' not in c.meta for c in contexts)
+
+    with EntityIndex(build_entity_index(tmp_path, monkeypatch)) as entity_index:
+        assert entity_index.doc_number('12_1') == 1 and entity_index.doc_number('99_0') == -1
+        qca = QuestionContextAnswer(questions=[Question(retrieved_contexts=[c]) for c in contexts])
+        qca = extract_answers_from_contexts(qca, 'unused', extractor=extractor, entity_index=entity_index)
+
+    assert extractor.texts == []
+    assert [[a.text for a in q.predicted_answers] for q in qca.questions] == [['Berlin', 'Germany'],
+                                                                             ['The', 'Seine', 'Paris', 'English',
+                                                                              'Channel'],
+                                                                             ['Paris', 'France']]
+    answer = qca.questions[2].predicted_answers[1]
+    assert answer.context is contexts[2]
+    assert answer.context.text[answer.start_char_position: answer.end_char_position] == 'France'
+
+
+
+def test_unknown_or_changed_contexts_fall_back_to_the_extractor(tmp_path, monkeypatch):
+    extractor = UnavailableExtractor()
+    contexts = [es_context('12', 0, PARAGRAPHS[0][2]),
+                es_context('12', 1, 'The Seine was rewritten since the entities were computed.'),
+                es_context('77', 0, 'Rome is not in the index.')]
+
+    with EntityIndex(build_entity_index(tmp_path, monkeypatch)) as entity_index:
+        qca = QuestionContextAnswer(questions=[Question(retrieved_contexts=[c]) for c in contexts])
+        qca = extract_answers_from_contexts(qca, 'unused', extractor=extractor, entity_index=entity_index)
+
+    assert extractor.texts == [contexts[1].text, contexts[2].text]
+    assert [[a.text for a in q.predicted_answers] for q in qca.questions] == [['Paris', 'France'], ['The', 'Seine'],
+                                                                             ['Rome']]
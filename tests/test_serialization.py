@@ -0,0 +1,62 @@
+import collections
+
+from src.data.data_format import *
+from src.data.serialization import dump_qca, load_qca, qca_from_bytes, qca_to_bytes
+from src.models.bm25_retriever import BM25Retriever
+
+
+
+def es_context(score: float) -> Context:
+    hit = {'_id': '12_0', '_score': score,
+           '_source': {'id': '12', 'name': 'Paris', 'url': 'https://wiki/12', 'paragraph_id': 0,
+                       'text': 'Paris is the capital of France.'}}
+    return BM25Retriever(client=None).convert_es_hit_to_context(hit)
+
+
+
+def sample_qca() -> QuestionContextAnswer:
+    """
+    Two copies of the same paragraph retrieved for two queries, with different scores, the first one shared by a
+    question and its answer, and a question with a None context
+    """
+    first, second = es_context(9.0), es_context(1.5)
+    answer = Answer(text='Paris', context=first, meta={'ent_type': 'GPE', 'span': (0, 5)}, start_char_position=0,
+                    end_char_position=5)
+    return QuestionContextAnswer(questions=[
+        Question(text='What is the capital of France?', retrieved_contexts=[first], predicted_answers=[answer]),
+        Question(text='Where is the Louvre?', retrieved_contexts=[second, None],
+                 gold_answers=[Answer(text='Paris', context=second)], predicted_answers=[Answer(text='France')])],
+        meta={'theme': 'paris'})
+
+
+
+def check_round_trip(qca: QuestionContextAnswer) -> None:
+    first_question, second_question = qca.questions
+    first, second = first_question.retrieved_contexts[0], second_question.retrieved_contexts[0]
+
+    assert first is not second
+    assert first.identifier == second.identifier == '12_0' and first.text == second.text
+    assert first.scores == collections.OrderedDict({'BM25 Retriever': 9.0})
+    assert second.scores == collections.OrderedDict({'BM25 Retriever': 1.5})
+    assert isinstance(first.scores, collections.OrderedDict)
+
+    assert first_question.predicted_answers[0].context is first
+    assert second_question.gold_answers[0].context is second
+    assert second_question.retrieved_contexts[1] is None
+    assert second_question.predicted_answers[0].context is None
+
+    assert first.meta['id'] == ('12',)
+    assert first_question.predicted_answers[0].meta == {'ent_type': 'GPE', 'span': (0, 5)}
+    assert qca.meta == {'theme': 'paris'}
+
+
+
+def test_bytes_round_trip_keeps_distinct_copies_and_tuples():
+    check_round_trip(qca_from_bytes(qca_to_bytes(sample_qca())))
+
+
+
+def test_file_round_trip(tmp_path):
+    path = str(tmp_path / 'quiz.msgpack')
+    dump_qca(sample_qca(), path)
+    check_round_trip(load_qca(path))
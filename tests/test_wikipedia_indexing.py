@@ -0,0 +1,135 @@
+import json
+import threading
+
+import pytest
+from elasticsearch.serializer import JSONSerializer
+
+from src.scripts.wikipedia_indexing import bulk_index_documents, fill_default_args, iter_index_actions, run_indexing
+
+
+class StubTransport:
+    serializer = JSONSerializer()
+
+
+
+class StubIndices:
+
+    def __init__(self, settings: dict) -> None:
+        self.settings = settings
+        self.put_settings_calls = []
+
+
+    def create(self, index: str, body: dict = None) -> None:
+        pass
+
+
+    def get_settings(self, index: str) -> dict:
+        return {index: {'settings': {'index': dict(self.settings)}}}
+
+
+    def put_settings(self, index: str, body: dict) -> None:
+        self.put_settings_calls.append(body['index'])
+        self.settings.update(body['index'])
+
+
+    def refresh(self, index: str) -> None:
+        pass
+
+
+
+class StubClient:
+    """
+    Elasticsearch client answering the bulk requests itself: the documents of rejected_ids are rejected with a 429
+    status the first rejections times they are sent, those of failed_ids always fail with a 400 status
+    """
+
+    def __init__(self, rejected_ids=(), rejections: int = 2, failed_ids=(), error: Exception = None) -> None:
+        self.transport = StubTransport()
+        self.indices = StubIndices({'refresh_interval': '30s', 'number_of_replicas': '2'})
+        self.rejections = {i: rejections for i in rejected_ids}
+        self.failed_ids = set(failed_ids)
+        self.error = error
+        self.sent = []
+        self.lock = threading.Lock()
+
+
+    def bulk(self, body: str, **kwargs) -> dict:
+        if self.error is not None:
+            raise self.error
+
+        lines = [json.loads(line) for line in body.splitlines() if line]
+        items = []
+        with self.lock:
+            for line in lines:
+                if len(line) != 1 or next(iter(line)) not in ('create', 'index', 'delete'):
+                    continue
+                op_type, action = next(iter(line.items()))
+                self.sent.append(action['_id'])
+                if self.rejections.get(action['_id'], 0) > 0:
+                    self.rejections[action['_id']] -= 1
+                    status = 429
+                elif action['_id'] in self.failed_ids:
+                    status = 400
+                else:
+                    status = 201
+                items.append({op_type: {'_id': action['_id'], 'status': status}})
+        return {'errors': any(next(iter(i.values()))['status'] >= 300 for i in items), 'items': items}
+
+
+
+def documents(n: int) -> list:
+    return [{'id': str(i), 'paragraph_id': 0, 'name': f'Article {i}', 'url': f'https://wiki/{i}',
+             'text': f'Paragraph of the article {i}.'} for i in range(n)]
+
+
+
+def indexing_args(**kwargs) -> dict:
+    args = fill_default_args()
+    args.update(bulk_mode='parallel', chunk_size=3, thread_count=2, initial_backoff=0, max_backoff=0, max_retries=3)
+    args.update(kwargs)
+    return args
+
+
+
+def test_rejected_documents_are_retried():
+    client = StubClient(rejected_ids=['1_0', '4_0'], rejections=2)
+    stats = bulk_index_documents(client, iter_index_actions('wikipedia', documents(10)), indexing_args())
+
+    assert stats == dict(indexed=10, retried=4, failed=0)
+    assert client.sent.count('1_0') == 3 and client.sent.count('4_0') == 3
+    assert client.sent.count('0_0') == 1
+
+
+
+def test_documents_failing_after_the_retries_are_counted():
+    client = StubClient(rejected_ids=['2_0'], rejections=10, failed_ids=['7_0'])
+    stats = bulk_index_documents(client, iter_index_actions('wikipedia', documents(10)), indexing_args(max_retries=2))
+
+    assert stats == dict(indexed=8, retried=2, failed=2)
+    assert client.sent.count('2_0') == 3
+    assert client.sent.count('7_0') == 1
+
+
+
+def write_dump(directory) -> str:
+    (directory / 'AA').mkdir()
+    with open(directory / 'AA' / 'wiki_00', 'w') as f:
+        for i in range(3):
+            text = f'Article {i}\n' + f'A paragraph long enough to be indexed, about the article number {i}. ' * 3
+            f.write(json.dumps({'id': str(i), 'revid': '1', 'title': f'Article {i}', 'url': f'https://wiki/{i}',
+                                'text': text}) + '\n')
+    return str(directory)
+
+
+
+def test_index_settings_are_restored_when_the_bulk_fails(tmp_path):
+    client = StubClient(error=RuntimeError('connection lost'))
+    args = indexing_args(directory=write_dump(tmp_path), num_workers=1,
+                         manifest_path=str(tmp_path / 'manifest.json'))
+
+    with pytest.raises(RuntimeError):
+        run_indexing(client, args)
+
+    assert client.indices.put_settings_calls == [{'refresh_interval': '-1', 'number_of_replicas': 0},
+                                                 {'refresh_interval': '30s', 'number_of_replicas': '2'}]
+    assert client.indices.settings == {'refresh_interval': '30s', 'number_of_replicas': '2'}
@@ -0,0 +1,107 @@
+from src.data.data_format import *
+from src.data.windowing import answer_span, answer_window, question_window, sentence_spans
+
+
+TEXT = ('The river rises in the northern mountains of the country. '
+        'Dr. Smith met Mr. Jones in the U.S. capital on Jan. 5 to map it. '
+        'Its course runs for about 300 km through three regions. '
+        'The delta was described by J. R. Brown in 1890. '
+        'Fishing remains the main activity of the towns along its banks.')
+
+
+
+def sentences(text: str) -> List[str]:
+    return [text[start: end] for start, end in sentence_spans(text)]
+
+
+
+def answer(text: str, context_text: str = TEXT, start: int = None) -> Answer:
+    start = context_text.find(text) if start is None else start
+    return Answer(text=text, context=Context(text=context_text, identifier='1_0'), start_char_position=start,
+                  end_char_position=start + len(text))
+
+
+
+def test_sentence_spans_cover_the_text():
+    spans = sentence_spans(TEXT)
+    assert spans[0][0] == 0 and spans[-1][1] == len(TEXT)
+    for (_, end), (start, _) in zip(spans, spans[1:]):
+        assert TEXT[end: start].isspace()
+
+
+
+def test_sentence_spans_keep_abbreviations_and_initials():
+    assert sentences(TEXT) == [
+        'The river rises in the northern mountains of the country.',
+        'Dr. Smith met Mr. Jones in the U.S. capital on Jan. 5 to map it.',
+        'Its course runs for about 300 km through three regions.',
+        'The delta was described by J. R. Brown in 1890.',
+        'Fishing remains the main activity of the towns along its banks.']
+
+
+
+def test_sentence_spans_do_not_split_before_lowercase_or_digits():
+    assert sentences('It grew e.g. in spring. 3 of them. It is approx. the same.') == \
+        ['It grew e.g. in spring. 3 of them.', 'It is approx. the same.']
+    assert sentences('It was over! "Really?" (Yes.) Then it ended') == \
+        ['It was over!', '"Really?"', '(Yes.)', 'Then it ended']
+
+
+
+def test_sentence_spans_without_sentence_end():
+    assert sentences('no punctuation at all') == ['no punctuation at all']
+    assert sentences('Trailing spaces.  ') == ['Trailing spaces.']
+    assert sentence_spans('') == ((0, 0),)
+
+
+
+def test_answer_span_from_positions_or_first_occurrence():
+    assert answer_span(answer('Brown')) == (TEXT.find('Brown'), TEXT.find('Brown') + len('Brown'))
+    assert answer_span(answer('Brown', start=0)) == (TEXT.find('Brown'), TEXT.find('Brown') + len('Brown'))
+    assert answer_span(answer('Brown', start=len(TEXT) + 10)) == (TEXT.find('Brown'), TEXT.find('Brown') + 5)
+    assert answer_span(answer('Amazon', start=3)) is None
+    assert answer_span(answer('', start=3)) is None
+
+
+
+def test_answer_window_keeps_the_neighbouring_sentences():
+    assert answer_window(answer('300 km')) == ' '.join(sentences(TEXT)[1: 4])
+    assert answer_window(answer('Dr. Smith'), sentences=0) == sentences(TEXT)[1]
+    assert answer_window(answer('river')) == ' '.join(sentences(TEXT)[:2])
+    assert answer_window(answer('banks'), sentences=2) == ' '.join(sentences(TEXT)[2:])
+
+
+
+def test_answer_window_across_sentences():
+    a = answer('country. Dr. Smith')
+    assert answer_window(a, sentences=0) == ' '.join(sentences(TEXT)[:2])
+
+
+
+def test_answer_window_falls_back_to_the_context():
+    assert answer_window(answer('300 km'), sentences=None) == TEXT
+    assert answer_window(answer('Amazon', start=0)) == TEXT
+    assert answer_window(answer('300 km'), sentences=0, min_words=50) == TEXT
+    short = 'A short one. Another short one. The end of it.'
+    assert answer_window(answer('Another', context_text=short), sentences=0) == short
+
+
+
+def test_answer_window_with_mismatched_positions():
+    assert answer_window(answer('Brown', start=2), sentences=0) == sentences(TEXT)[3]
+
+
+
+def test_question_window():
+    context = Context(text=TEXT, identifier='1_0')
+    first = Answer(text='300 km', context=context, start_char_position=TEXT.find('300 km'),
+                   end_char_position=TEXT.find('300 km') + 6)
+    second = Answer(text='regions', context=context, start_char_position=TEXT.find('regions'),
+                    end_char_position=TEXT.find('regions') + 7)
+    question = Question(text='How long is the river?', retrieved_contexts=[context, Context(text='Other context.')],
+                        predicted_answers=[first, second])
+
+    assert question_window(question) == answer_window(first)
+    assert question_window(question, sentences=None) == TEXT + ' Other context.'
+    question.predicted_answers = [Answer(text='300 km')]
+    assert question_window(question) == TEXT + ' Other context.'